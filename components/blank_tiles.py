@@ -0,0 +1,156 @@
+import os
+import io
+import json
+import hashlib
+import threading
+import numpy as np
+from PIL import Image
+
+# Blank tiles seen in earlier runs and registered placeholder signatures, so repeats are rejected cheaply
+BLANK_REGISTRY_PATH = "output/blank_tiles.json"
+BLANK_CHECK_SIZE = 64
+
+def hash_tile_bytes(data):
+    """Content hash of raw tile bytes, used to tell whether imagery changed between runs"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def difference_hash(gray):
+    """64-bit perceptual difference hash of a grayscale image"""
+    small = np.asarray(Image.fromarray(gray).resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(''.join('1' if bit else '0' for bit in bits), 2)
+
+class BlankTileDetector:
+    """Recognises no-data tiles: placeholders, uniform fills and undecodable responses
+
+    Checks run cheapest first: a set lookup on the byte hash, then a reduced
+    JPEG draft decode for a low-variance test and a perceptual-hash match
+    against placeholders registered with register_placeholder, e.g. by
+    geo_map.probe_provider_placeholder at capture time. Signatures are never
+    learned from the imagery itself, so real tiles (open water, haze) cannot
+    poison the registry; only the byte hash of a flagged tile is kept, which
+    matches nothing but the same bytes. Safe to share between capture threads.
+    """
+
+    def __init__(self, registry_path=BLANK_REGISTRY_PATH, std_threshold=2.5, phash_distance=4, mean_tolerance=8):
+        self.registry_path = registry_path
+        self.std_threshold = std_threshold
+        self.phash_distance = phash_distance
+        self.mean_tolerance = mean_tolerance
+        self.known_hashes = set()
+        # (difference hash, mean brightness) of registered placeholders; the brightness keeps
+        # smooth real tiles, whose hash is also nearly empty, from matching a flat placeholder
+        self.placeholder_signatures = set()
+        # Zoom levels whose provider placeholder has already been probed for
+        self.probed_zooms = set()
+        self.counts = {}
+        self._lock = threading.Lock()
+
+        if registry_path and os.path.exists(registry_path):
+            try:
+                with open(registry_path) as f:
+                    registry = json.load(f)
+                self.known_hashes.update(registry.get('hashes', []))
+                # Older registries kept signatures learned from imagery under 'phashes'; they are not trusted
+                self.placeholder_signatures.update(
+                    (int(phash, 16), mean) for phash, mean in registry.get('placeholder_signatures', [])
+                )
+                self.probed_zooms.update(registry.get('probed_zooms', []))
+            except Exception as e:
+                print(f"Error loading blank tile registry: {e}")
+
+    def register_placeholder(self, data):
+        """Register a tile known to be a provider placeholder, e.g. a saved "Map data not yet available" response"""
+        gray = _decode_gray(data)
+        if gray is None:
+            print("Error registering placeholder: tile could not be decoded")
+            return False
+        with self._lock:
+            self.known_hashes.add(hash_tile_bytes(data))
+            self.placeholder_signatures.add((difference_hash(gray), round(float(gray.mean()), 1)))
+        return True
+
+    def classify(self, data, content_hash=None):
+        """Reason a tile is blank ('known_placeholder', 'undecodable', 'low_variance',
+        'placeholder_phash'), or None for real imagery"""
+        content_hash = content_hash or hash_tile_bytes(data)
+        if content_hash in self.known_hashes:
+            return 'known_placeholder'
+
+        gray = _decode_gray(data)
+        if gray is None:
+            return 'undecodable'
+
+        if gray.std() < self.std_threshold:
+            reason = 'low_variance'
+        elif self.placeholder_signatures:
+            phash, mean = difference_hash(gray), gray.mean()
+            matched = any(
+                bin(phash ^ known).count('1') <= self.phash_distance and abs(mean - known_mean) <= self.mean_tolerance
+                for known, known_mean in self.placeholder_signatures
+            )
+            if not matched:
+                return None
+            reason = 'placeholder_phash'
+        else:
+            return None
+
+        with self._lock:
+            self.known_hashes.add(content_hash)
+        return reason
+
+    def check(self, data, content_hash=None):
+        """Classify a tile and count it; returns the blank reason or None"""
+        reason = self.classify(data, content_hash)
+        if reason is not None:
+            with self._lock:
+                self.counts[reason] = self.counts.get(reason, 0) + 1
+        return reason
+
+    def save(self):
+        """Persist learned placeholder hashes for later runs"""
+        if not self.registry_path:
+            return
+        with self._lock:
+            registry = {
+                'hashes': sorted(self.known_hashes),
+                'placeholder_signatures': sorted([f"{phash:016x}", mean] for phash, mean in self.placeholder_signatures),
+                'probed_zooms': sorted(self.probed_zooms)
+            }
+        try:
+            os.makedirs(os.path.dirname(self.registry_path) or '.', exist_ok=True)
+            tmp_path = f"{self.registry_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(registry, f)
+            os.replace(tmp_path, self.registry_path)
+        except Exception as e:
+            print(f"Error saving blank tile registry: {e}")
+
+def _decode_gray(data):
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            # JPEG draft mode decodes straight at a reduced scale
+            image.draft('L', (BLANK_CHECK_SIZE, BLANK_CHECK_SIZE))
+            return np.asarray(image.convert('L').resize((BLANK_CHECK_SIZE, BLANK_CHECK_SIZE), Image.BILINEAR))
+    except Exception:
+        return None
+
+def filter_blank_tiles(image_files, input_dir, detector):
+    """Split already-captured tiles into real imagery and blanks
+
+    Returns (kept_files, {image_file: reason}) for the blank ones.
+    """
+    kept, blank = [], {}
+    for image_file in image_files:
+        try:
+            with open(os.path.join(input_dir, image_file), 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            print(f"Error reading tile {image_file}: {e}")
+            continue
+        reason = detector.check(data)
+        if reason is None:
+            kept.append(image_file)
+        else:
+            blank[image_file] = reason
+    return kept, blank
@@ -7,6 +7,7 @@ import os
 import kagglehub
 from pathlib import Path
 from ultralytics import YOLO
+from components.scheduler import get_scheduler, yolo_cost
 
 # Global variable to store loaded model
 _model = None
@@ -97,8 +98,11 @@ def load_yolo_model():
     
     return _model
 
-def detect_victims_yolo(thermal_image):
-    """Detect all objects in thermal image using YOLO model"""
+def detect_victims_yolo(thermal_image, owner=None):
+    """Detect all objects in thermal image using YOLO model
+
+    Inference is admitted by the stage scheduler on behalf of owner (a session id).
+    """
     try:
         model = load_yolo_model()
         if model is None:
@@ -114,7 +118,8 @@ def detect_victims_yolo(thermal_image):
         if len(img_array.shape) == 3 and img_array.shape[2] == 4:  # RGBA
             img_array = img_array[:, :, :3]  # Convert to RGB
         
-        with st.spinner('Running AI detection...'):
+        cpu, memory_mb = yolo_cost()
+        with st.spinner('Running AI detection...'), get_scheduler().admit('yolo', owner, cpu=cpu, memory_mb=memory_mb):
             # Run inference with error handling
             try:
                 results = model(img_array, verbose=False)
@@ -1,29 +1,195 @@
 import os
+import time
+import json
 import torch
 import numpy as np
 from PIL import Image
 import shutil
+import multiprocessing
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from transformers import AutoImageProcessor, SegformerForSemanticSegmentation
-import torch
+from components.flood_onnx import (
+    ONNX_MODEL_PATH,
+    export_segformer_onnx,
+    create_onnx_session,
+    OnnxSegformer
+)
+from components.blank_tiles import BlankTileDetector, filter_blank_tiles
+from components.tile_io import load_tile_image, is_tile_file
+from components.flood_prefilter import prefilter_tiles, summarize_prefilter
+from components.geo_map import parse_tile_name
+from components.workspace import state_flooded_dir
+from components.manifest import (
+    has_manifest,
+    start_run,
+    complete_run,
+    record_predictions,
+    query_flooded,
+    query_tile_hashes,
+    query_blank_tiles,
+    summarize_predictions
+)
+from components.flood_writer import TileOutputWriter, link_or_copy
+from components.scheduler import ChunkedAdmission
+from components.flood_mosaic import (
+    plan_mosaic,
+    chip_footprint,
+    tile_window,
+    feather_weights,
+    assemble_chip
+)
+
+MODEL_NAME = "wu-pr-gw/segformer-b2-finetuned-with-LoveDA"
+
+# Inference modes accepted by initialize_flood_model
+FLOOD_MODES = ['default', 'cpu_optimized']
+
+# Segmentation backends accepted by initialize_flood_model
+FLOOD_BACKENDS = ['pytorch', 'onnx']
+
+# Deployment settings, e.g. RESGEOAI_FLOOD_BACKEND=onnx or RESGEOAI_FLOOD_PREFILTER='{"threshold": 0.02}'
+FLOOD_ENV_PREFIX = "RESGEOAI_FLOOD_"
+
+def _env_int(environ, name):
+    value = environ.get(FLOOD_ENV_PREFIX + name, '').strip()
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        print(f"Error parsing {FLOOD_ENV_PREFIX}{name}: expected an integer, got '{value}'")
+        return None
 
-def initialize_flood_model():
-    """Initialize the Segformer model for flood prediction"""
+def _env_options(environ, name):
+    """Options dict from an env var: unset or '0' disables, '1' enables defaults, a JSON object overrides them"""
+    value = environ.get(FLOOD_ENV_PREFIX + name, '').strip()
+    if value.lower() in ('', '0', 'false', 'off', 'no'):
+        return None
+    if value.lower() in ('1', 'true', 'on', 'yes'):
+        return {}
     try:
-        # Choose device
-        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        options = json.loads(value)
+    except ValueError as e:
+        print(f"Error parsing {FLOOD_ENV_PREFIX}{name}: {e}")
+        return None
+    if not isinstance(options, dict):
+        print(f"Error parsing {FLOOD_ENV_PREFIX}{name}: expected a JSON object")
+        return None
+    return options
+
+def flood_model_settings(environ=None):
+    """initialize_flood_model arguments from RESGEOAI_FLOOD_MODE, _BACKEND, _THREADS and _INTEROP_THREADS"""
+    environ = os.environ if environ is None else environ
+    settings = {}
+    for key, name in (('mode', 'MODE'), ('backend', 'BACKEND')):
+        value = environ.get(FLOOD_ENV_PREFIX + name, '').strip().lower()
+        if value:
+            settings[key] = value
+    for key, name in (('num_threads', 'THREADS'), ('num_interop_threads', 'INTEROP_THREADS')):
+        value = _env_int(environ, name)
+        if value:
+            settings[key] = value
+    return settings
+
+def flood_run_settings(environ=None):
+    """process_flood_prediction options from RESGEOAI_FLOOD_WORKERS, _PREFILTER, _CASCADE, _MOSAIC and _SLIDING_WINDOW"""
+    environ = os.environ if environ is None else environ
+    return {
+        'model_options': flood_model_settings(environ),
+        'num_workers': max(1, _env_int(environ, 'WORKERS') or 1),
+        'prefilter': _env_options(environ, 'PREFILTER'),
+        'cascade': _env_options(environ, 'CASCADE'),
+        'mosaic': _env_options(environ, 'MOSAIC'),
+        'sliding_window': _env_options(environ, 'SLIDING_WINDOW'),
+    }
+
+def configure_cpu_threads(num_threads=None, num_interop_threads=None):
+    """Set torch intra-/inter-op thread counts for CPU inference"""
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if num_interop_threads:
+        try:
+            # Can only be set once, before any inter-op parallel work has started
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError as e:
+            print(f"Could not set inter-op threads: {e}")
+
+def optimize_model_for_cpu(model):
+    """Apply dynamic INT8 quantization and channels-last layout to a CPU model"""
+    model = model.to("cpu").to(memory_format=torch.channels_last)
+    model = torch.quantization.quantize_dynamic(
+        model,
+        {torch.nn.Linear},
+        dtype=torch.qint8
+    )
+    model.eval()
+    model.channels_last = True
+    return model
+
+def load_pytorch_model(device):
+    """Load the Segformer checkpoint onto a device"""
+    # Safely load model without meta tensor issues
+    model = SegformerForSemanticSegmentation.from_pretrained(
+        MODEL_NAME,
+        low_cpu_mem_usage=False  # IMPORTANT: disables meta tensors
+    ).to(device)
+    model.eval()
+    return model
+
+def initialize_onnx_model(processor, num_threads=None, onnx_path=ONNX_MODEL_PATH):
+    """Load the ONNX Runtime backend, exporting the checkpoint on first use"""
+    if not os.path.exists(onnx_path):
+        size = processor.size
+        image_size = (size.get('height', 512), size.get('width', 512))
+        export_segformer_onnx(load_pytorch_model(torch.device("cpu")), onnx_path, image_size)
+
+    session = create_onnx_session(onnx_path, num_threads=num_threads)
+    return OnnxSegformer(session)
+
+def initialize_flood_model(mode=None, num_threads=None, num_interop_threads=None, backend=None):
+    """Initialize the Segformer model for flood prediction
+
+    backend='onnx' runs the exported graph through ONNX Runtime on CPU and falls
+    back to PyTorch if onnxruntime is missing or the export fails.
+    Arguments left as None come from flood_model_settings(), then default to
+    mode 'default' on the 'pytorch' backend.
+    """
+    settings = flood_model_settings()
+    mode = mode or settings.get('mode', 'default')
+    backend = backend or settings.get('backend', 'pytorch')
+    num_threads = num_threads or settings.get('num_threads')
+    num_interop_threads = num_interop_threads or settings.get('num_interop_threads')
+    try:
+        if mode not in FLOOD_MODES:
+            raise ValueError(f"Unknown flood model mode '{mode}', expected one of {FLOOD_MODES}")
+        if backend not in FLOOD_BACKENDS:
+            raise ValueError(f"Unknown flood backend '{backend}', expected one of {FLOOD_BACKENDS}")
+
+        # Choose device (the CPU-optimised mode always runs on CPU)
+        if mode == "cpu_optimized":
+            device = torch.device("cpu")
+        else:
+            device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        
+        # Thread limits apply to every CPU run, e.g. so shard workers split the cores instead of oversubscribing them
+        if device.type == "cpu":
+            configure_cpu_threads(num_threads, num_interop_threads)
 
         # Load processor
-        processor = AutoImageProcessor.from_pretrained(
-            "wu-pr-gw/segformer-b2-finetuned-with-LoveDA"
-        )
+        processor = AutoImageProcessor.from_pretrained(MODEL_NAME)
+
+        if backend == "onnx":
+            try:
+                return processor, initialize_onnx_model(processor, num_threads), torch.device("cpu")
+            except Exception as e:
+                print(f"ONNX backend unavailable, falling back to PyTorch: {e}")
+
+        model = load_pytorch_model(device)
 
-        # Safely load model without meta tensor issues
-        model = SegformerForSemanticSegmentation.from_pretrained(
-            "wu-pr-gw/segformer-b2-finetuned-with-LoveDA",
-            low_cpu_mem_usage=False  # IMPORTANT: disables meta tensors
-        ).to(device)
+        if mode == "cpu_optimized":
+            model = optimize_model_for_cpu(model)
 
-        model.eval()
         return processor, model, device
 
     except Exception as e:
@@ -46,36 +212,255 @@ COLORS = np.array([
     [255, 123, 0]      # 7: agricultural
 ])
 
-def predict_single_image(image_path, processor, model, device):
-    """Predict segmentation for a single image"""
-    try:
-        # Load and preprocess image
-        image = Image.open(image_path).convert('RGB')
-        inputs = processor(images=image, return_tensors="pt")
-        inputs = {k: v.to(device) for k, v in inputs.items()}
+def prepare_model_inputs(image, processor, model, device, input_size=None):
+    """Run the processor on a PIL image, resizing to input_size (int or (height, width)) if given"""
+    if isinstance(input_size, int):
+        input_size = (input_size, input_size)
+    processor_kwargs = {'size': {'height': input_size[0], 'width': input_size[1]}} if input_size else {}
+    inputs = processor(images=image, return_tensors="pt", **processor_kwargs)
+    inputs = {k: v.to(device) for k, v in inputs.items()}
+    if getattr(model, 'channels_last', False):
+        inputs['pixel_values'] = inputs['pixel_values'].contiguous(memory_format=torch.channels_last)
+    return inputs
+
+def segment_probabilities(image, processor, model, device):
+    """Per-class probabilities for a PIL image at native resolution, as a (C, H, W) float32 array"""
+    inputs = prepare_model_inputs(image, processor, model, device, input_size=image.size[::-1])
+    with torch.inference_mode():
+        logits = model(**inputs).logits
+        upsampled_logits = torch.nn.functional.interpolate(
+            logits,
+            size=image.size[::-1],
+            mode="bilinear",
+            align_corners=False,
+        )
+        probs = torch.softmax(upsampled_logits.float(), dim=1)[0]
+    return probs.cpu().numpy()
+
+def segment_image(image, processor, model, device, input_size=None, with_uncertainty=False):
+    """Segment a PIL image, optionally at a reduced square model input size
+
+    Returns the uint8 class mask and, if requested, the mean softmax entropy
+    normalised to [0, 1] as a per-tile uncertainty score.
+    """
+    inputs = prepare_model_inputs(image, processor, model, device, input_size)
+    
+    # Make prediction
+    with torch.inference_mode():
+        outputs = model(**inputs)
+        logits = outputs.logits
         
-        # Make prediction
-        with torch.no_grad():
-            outputs = model(**inputs)
-            logits = outputs.logits
-            
-            # Resize logits to match input image size
-            upsampled_logits = torch.nn.functional.interpolate(
-                logits,
-                size=image.size[::-1],  # PIL size is (width, height), we need (height, width)
-                mode="bilinear",
-                align_corners=False,
-            )
-            
-            # Get predicted segmentation
-            predicted = upsampled_logits.argmax(dim=1).squeeze().cpu().numpy()
-            
+        # Resize logits to match input image size
+        upsampled_logits = torch.nn.functional.interpolate(
+            logits,
+            size=image.size[::-1],  # PIL size is (width, height), we need (height, width)
+            mode="bilinear",
+            align_corners=False,
+        )
+        
+        # Get predicted segmentation
+        # uint8 is enough for 8 classes and keeps masks cheap to hold and ship between processes
+        predicted = upsampled_logits.argmax(dim=1).squeeze().to(torch.uint8).cpu().numpy()
+        
+        uncertainty = None
+        if with_uncertainty:
+            # Entropy on the low-resolution logits is enough for routing and much cheaper
+            probs = torch.softmax(logits.float(), dim=1)
+            entropy = -(probs * torch.log(probs.clamp_min(1e-8))).sum(dim=1)
+            uncertainty = float(entropy.mean() / np.log(logits.shape[1]))
+    
+    return predicted, uncertainty
+
+def predict_large_image(image, processor, model, device, window=512, stride=384, batch_size=4, block_width=4096):
+    """Sliding-window segmentation of an arbitrarily large PIL image at native resolution
+
+    Windows are run in batches and blended with feathered weights over their
+    overlap (window - stride). The image is processed in column blocks of
+    block_width output columns; within a block only a strip one window high
+    is accumulated before rows are finalised into a preallocated uint8 mask.
+    Working memory therefore depends on window and block_width, not on the
+    image size. Windows straddling a block edge are run for both blocks.
+    """
+    if stride <= 0 or stride > window:
+        raise ValueError(f"Sliding window stride must be in (0, window], got stride={stride} for window={window}")
+    width, height = image.size
+    window_h, window_w = min(window, height), min(window, width)
+    block_width = max(block_width, window_w)
+
+    def starts(length, size):
+        positions = list(range(0, length - size, stride)) + [length - size]
+        return sorted(set(positions))
+
+    ys, xs = starts(height, window_h), starts(width, window_w)
+    weights = torch.from_numpy(feather_weights(window_h, window_w, max(window - stride, 0)))
+    mask = np.zeros((height, width), dtype=np.uint8)
+
+    for block_start in range(0, width, block_width):
+        block_end = min(block_start + block_width, width)
+        # Every window contributing to the block's columns, and the strip span they cover
+        block_xs = [x for x in xs if x < block_end and x + window_w > block_start]
+        strip_start = block_xs[0]
+        strip = torch.zeros((NUM_CLASSES, window_h, block_xs[-1] + window_w - strip_start), dtype=torch.float32)
+
+        for row_idx, y in enumerate(ys):
+            for batch_start in range(0, len(block_xs), batch_size):
+                batch_xs = block_xs[batch_start:batch_start + batch_size]
+                crops = [image.crop((x, y, x + window_w, y + window_h)) for x in batch_xs]
+                inputs = prepare_model_inputs(crops, processor, model, device, input_size=(window_h, window_w))
+                with torch.inference_mode():
+                    logits = model(**inputs).logits
+                    probs = torch.softmax(torch.nn.functional.interpolate(
+                        logits.float(),
+                        size=(window_h, window_w),
+                        mode="bilinear",
+                        align_corners=False,
+                    ), dim=1).cpu()
+                for x, window_probs in zip(batch_xs, probs):
+                    strip[:, :, x - strip_start:x - strip_start + window_w] += window_probs * weights
+
+            # Rows above the next window row will not receive any more contributions
+            next_y = ys[row_idx + 1] if row_idx + 1 < len(ys) else height
+            done = next_y - y
+            mask[y:next_y, block_start:block_end] = strip[
+                :, :done, block_start - strip_start:block_end - strip_start
+            ].argmax(dim=0).to(torch.uint8).numpy()
+
+            # Slide the strip down in place, keeping the overlap with the next window row
+            strip[:, :window_h - done] = strip[:, done:].clone()
+            strip[:, window_h - done:] = 0
+
+    return mask
+
+def predict_single_image(image_path, processor, model, device, sliding_window=None):
+    """Predict segmentation for a single image
+
+    sliding_window, e.g. {'window': 512, 'stride': 384, 'batch_size': 4}, segments
+    images larger than the window at native resolution via predict_large_image.
+    """
+    try:
+        # Tiles are decoded from their stored bytes, whatever the format
+        image = load_tile_image(image_path)
+        if sliding_window is not None and max(image.size) > sliding_window.get('window', 512):
+            predicted = predict_large_image(image, processor, model, device, **sliding_window)
+        else:
+            predicted, _ = segment_image(image, processor, model, device)
         return predicted, image
     
     except Exception as e:
         print(f"Error predicting image {image_path}: {e}")
         return None, None
 
+# Cascade settings: the fast stage runs the same checkpoint at a reduced input size
+CASCADE_DEFAULTS = {
+    'fast_size': 256,
+    'entropy_threshold': 0.35,  # normalised mean softmax entropy
+    'water_margin': 15.0,       # percentage points around the 50% flooded threshold
+}
+
+def predict_cascade(image_path, processor, model, device, cascade=None):
+    """Predict with a fast low-resolution pass, re-running uncertain tiles at full size
+
+    Returns (prediction, image, stage, uncertainty) where stage is 'fast' or 'full'.
+    """
+    settings = {**CASCADE_DEFAULTS, **(cascade or {})}
+    try:
+        image = load_tile_image(image_path)
+        predicted, uncertainty = segment_image(
+            image, processor, model, device,
+            input_size=settings['fast_size'],
+            with_uncertainty=True
+        )
+        
+        water_percentage = calculate_water_percentage(predicted)
+        ambiguous = (
+            uncertainty > settings['entropy_threshold']
+            or abs(water_percentage - 50.0) < settings['water_margin']
+        )
+        if not ambiguous:
+            return predicted, image, 'fast', uncertainty
+        
+        predicted, _ = segment_image(image, processor, model, device)
+        return predicted, image, 'full', uncertainty
+    
+    except Exception as e:
+        print(f"Error predicting image {image_path}: {e}")
+        return None, None, None, None
+
+def calculate_mask_iou(mask_a, mask_b, class_id=4):
+    """Calculate IoU of one class between two predicted masks"""
+    a = mask_a == class_id
+    b = mask_b == class_id
+    union = np.logical_or(a, b).sum()
+    if union == 0:
+        return 1.0
+    return float(np.logical_and(a, b).sum() / union)
+
+def compare_flood_models(sample, processor, reference_model, candidate_model, device):
+    """Compare a candidate model's masks and throughput against a reference model"""
+    def run(model):
+        start = time.perf_counter()
+        masks = [predict_single_image(path, processor, model, device)[0] for path in sample]
+        return masks, time.perf_counter() - start
+
+    reference_masks, reference_time = run(reference_model)
+    candidate_masks, candidate_time = run(candidate_model)
+
+    water_ious = []
+    pixel_agreement = []
+    shapes_match = True
+    for ref, cand in zip(reference_masks, candidate_masks):
+        if ref is None or cand is None:
+            continue
+        shapes_match = shapes_match and ref.shape == cand.shape
+        water_ious.append(calculate_mask_iou(ref, cand))
+        pixel_agreement.append(float(np.mean(ref == cand)))
+
+    return {
+        'sample_size': len(water_ious),
+        'shapes_match': shapes_match,
+        'water_iou': float(np.mean(water_ious)) if water_ious else 0.0,
+        'min_water_iou': float(np.min(water_ious)) if water_ious else 0.0,
+        'pixel_agreement': float(np.mean(pixel_agreement)) if pixel_agreement else 0.0,
+        'reference_tiles_per_sec': len(sample) / reference_time if reference_time > 0 else 0.0,
+        'candidate_tiles_per_sec': len(sample) / candidate_time if candidate_time > 0 else 0.0,
+        'speedup': reference_time / candidate_time if candidate_time > 0 else 0.0
+    }
+
+def check_cpu_agreement(image_paths, sample_size=8, num_threads=None, num_interop_threads=None):
+    """Compare the CPU-optimised model against the fp32 model on a sample of images
+
+    Returns the water-mask IoU, per-pixel agreement and tiles/sec of both models.
+    """
+    sample = list(image_paths)[:sample_size]
+    if not sample:
+        return {"error": "No images to compare"}
+
+    processor, reference_model, _ = initialize_flood_model("default", backend="pytorch")
+    _, optimized_model, cpu = initialize_flood_model(
+        "cpu_optimized",
+        num_threads=num_threads,
+        num_interop_threads=num_interop_threads
+    )
+    if not reference_model or not optimized_model:
+        return {"error": "Failed to initialize model"}
+
+    return compare_flood_models(sample, processor, reference_model.to(cpu), optimized_model, cpu)
+
+def check_onnx_parity(image_paths, sample_size=8, num_threads=None):
+    """Check the ONNX Runtime backend against PyTorch on CPU for mask parity and throughput"""
+    sample = list(image_paths)[:sample_size]
+    if not sample:
+        return {"error": "No images to compare"}
+
+    processor, onnx_model, cpu = initialize_flood_model(backend="onnx", num_threads=num_threads)
+    if not onnx_model:
+        return {"error": "Failed to initialize model"}
+    if not isinstance(onnx_model, OnnxSegformer):
+        return {"error": "ONNX backend unavailable"}
+
+    reference_model = load_pytorch_model(cpu)
+    return compare_flood_models(sample, processor, reference_model, onnx_model, cpu)
+
 def calculate_water_percentage(prediction):
     """Calculate the percentage of water pixels in the prediction"""
     if prediction is None:
@@ -98,76 +483,521 @@ def create_prediction_visualization(prediction):
     
     return prediction_image
 
-def process_flood_prediction(input_dir, state_name, progress_callback=None):
-    """Process all images in the input directory for flood prediction"""
+def record_tile_prediction(image_file, prediction, original_image, flooded_dir, stage=None, uncertainty=None,
+                           writer=None, source_path=None):
+    """Build the result entry for a predicted tile and save it if it is mostly water
+
+    With source_path the original tile bytes are linked or copied instead of
+    re-encoded, and with a TileOutputWriter all writes happen in the background.
+    Returns (prediction_info, flooded_info); either is None when not applicable.
+    """
+    if prediction is None:
+        return None, None
+    
+    # Calculate water percentage
+    water_percentage = calculate_water_percentage(prediction)
+    
+    # Create prediction visualization
+    prediction_viz = create_prediction_visualization(prediction)
+    
+    # Store prediction info
+    prediction_info = {
+        'image_name': image_file,
+        'water_percentage': water_percentage,
+        'prediction': prediction,
+        'original_image': original_image,
+        'prediction_viz': prediction_viz,
+        'prefiltered': False
+    }
+    if stage is not None:
+        prediction_info['cascade_stage'] = stage
+        prediction_info['uncertainty'] = uncertainty
+    
+    # If water percentage > 50%, save to flooded directory
+    flooded_info = None
+    if water_percentage > 50.0:
+        # The original keeps the tile's own format; the colour-coded mask is always a lossless PNG
+        original_path = os.path.join(flooded_dir, f"original_{image_file}")
+        pred_path = os.path.join(flooded_dir, f"prediction_{os.path.splitext(image_file)[0]}.png")
+        
+        if writer is not None:
+            if source_path:
+                writer.copy_file(source_path, original_path)
+            else:
+                writer.save_image(original_image, original_path)
+            writer.save_image(prediction_viz, pred_path)
+        else:
+            # Save original image
+            if source_path:
+                link_or_copy(source_path, original_path)
+            else:
+                original_image.save(original_path)
+            
+            # Save prediction visualization
+            prediction_viz.save(pred_path)
+        
+        flooded_info = {
+            'image_name': image_file,
+            'water_percentage': water_percentage,
+            'original_path': original_path,
+            'prediction_path': pred_path
+        }
+    
+    return prediction_info, flooded_info
+
+def process_single_tile(image_file, input_dir, flooded_dir, processor, model, device, cascade=None,
+                        sliding_window=None, writer=None):
+    """Predict one tile and save it to the flooded directory if it is mostly water
+
+    Returns (prediction_info, flooded_info); either is None when not applicable.
+    """
+    image_path = os.path.join(input_dir, image_file)
+    
+    # Make prediction
+    stage, uncertainty = None, None
+    if cascade is not None:
+        prediction, original_image, stage, uncertainty = predict_cascade(
+            image_path, processor, model, device, cascade
+        )
+    else:
+        prediction, original_image = predict_single_image(
+            image_path, processor, model, device, sliding_window
+        )
     
-    # Initialize model
-    processor, model, device = initialize_flood_model()
+    return record_tile_prediction(
+        image_file, prediction, original_image, flooded_dir, stage, uncertainty,
+        writer=writer, source_path=image_path
+    )
+
+def predict_mosaic_tiles(plan, input_dir, processor, model, device, chip_tiles=2, margin=32):
+    """Segment neighbouring tiles together as native-resolution chips
+
+    Each chip covers chip_tiles x chip_tiles tiles plus a `margin` pixel ring
+    borrowed from its neighbours. Overlapping chip predictions are blended with
+    feathered weights and split back per tile. Yields (image_file, prediction,
+    image) as soon as every chip touching a tile has run, so only about two
+    chip rows of tiles are held in memory. Isolated tiles of the plan are
+    segmented one by one at their own size.
+    """
+    positions, unplaced, chips, isolated = plan
+
+    # Number of chips touching each tile; a tile is final when it drops to zero
+    pending = {}
+    for origin in chips:
+        for position in chip_footprint(origin, chip_tiles, margin):
+            if position in positions:
+                pending[position] = pending.get(position, 0) + 1
+
+    tile_images = {}
+    tile_arrays = {}
+    accumulators = {}
+    tile_size = None
+    weights = None
+
+    def load_tile(position):
+        if position in tile_arrays:
+            return
+        try:
+            image = load_tile_image(os.path.join(input_dir, positions[position][0]))
+            if image.size != (tile_size, tile_size):
+                image = image.resize((tile_size, tile_size), Image.BILINEAR)
+            tile_images[position] = image
+            tile_arrays[position] = np.asarray(image)
+        except Exception as e:
+            print(f"Error loading tile {positions[position][0]}: {e}")
+            tile_images[position] = None
+            tile_arrays[position] = None
+
+    for origin in chips:
+        footprint = [p for p in chip_footprint(origin, chip_tiles, margin) if p in positions]
+        if tile_size is None:
+            with Image.open(os.path.join(input_dir, positions[footprint[0]][0])) as first:
+                tile_size = first.size[0]
+            extent = chip_tiles * tile_size + 2 * margin
+            weights = feather_weights(extent, extent, 2 * margin)
+
+        for position in footprint:
+            load_tile(position)
+        available = {p: tile_arrays[p] for p in footprint if tile_arrays[p] is not None}
+
+        try:
+            chip = assemble_chip(origin, chip_tiles, margin, tile_size, available)
+            weighted = segment_probabilities(Image.fromarray(chip), processor, model, device) * weights
+        except Exception as e:
+            print(f"Error predicting chip {origin}: {e}")
+            weighted = None
+
+        for position in footprint:
+            if weighted is not None and position in available:
+                chip_slice, tile_slice = tile_window(origin, position, chip_tiles, margin, tile_size)
+                if position not in accumulators:
+                    accumulators[position] = np.zeros((weighted.shape[0], tile_size, tile_size), dtype=np.float32)
+                accumulators[position][(slice(None),) + tile_slice] += weighted[(slice(None),) + chip_slice]
+
+            pending[position] -= 1
+            if pending[position] == 0:
+                accumulator = accumulators.pop(position, None)
+                prediction = accumulator.argmax(axis=0).astype(np.uint8) if accumulator is not None else None
+                image = tile_images.pop(position, None)
+                tile_arrays.pop(position, None)
+                for image_file in positions[position]:
+                    yield image_file, prediction, image
+
+    # A tile without neighbours gains nothing from a black-padded chip
+    for position in isolated:
+        prediction, image = predict_single_image(
+            os.path.join(input_dir, positions[position][0]), processor, model, device
+        )
+        for image_file in positions[position]:
+            yield image_file, prediction, image
+
+    # Tiles without z/x/y in their name cannot be placed on the grid
+    for image_file in unplaced:
+        prediction, image = predict_single_image(os.path.join(input_dir, image_file), processor, model, device)
+        yield image_file, prediction, image
+
+# Model loaded once per shard worker process
+_worker_model = None
+
+def _init_shard_worker(model_options):
+    """Load the flood model inside a shard worker process"""
+    global _worker_model
+    _worker_model = initialize_flood_model(**model_options)
+
+def _process_shard(shard, input_dir, flooded_dir, tile_options=None):
+    """Process one shard of tiles inside a worker process, returning (results, write_errors)
+
+    Images are already written by the worker, so only the class masks and paths
+    are sent back instead of pickling each tile's PIL images.
+    """
+    processor, model, device = _worker_model
     if not processor or not model:
-        return {"error": "Failed to initialize model", "flooded_images": [], "all_predictions": []}
+        raise RuntimeError("Failed to initialize model in worker")
+    with TileOutputWriter() as writer:
+        results = [
+            process_single_tile(f, input_dir, flooded_dir, processor, model, device, writer=writer, **(tile_options or {}))
+            for f in shard
+        ]
+    write_errors = writer.close()
+    for info, _ in results:
+        if info is not None:
+            info['original_image'] = info['prediction_viz'] = None
+    return results, write_errors
+
+def split_into_shards(items, num_workers, max_shard_size=32):
+    """Split items into ordered shards, several per worker for balanced progress"""
+    shard_size = max(1, min(max_shard_size, -(-len(items) // (num_workers * 4))))
+    return [items[i:i + shard_size] for i in range(0, len(items), shard_size)]
+
+def chunked_admission(admission, num_workers=1, **options):
+    """CPU chunks of a RunAdmission, or a no-op ChunkedAdmission when the run is not scheduled"""
+    return admission.chunks(num_workers, **options) if admission else ChunkedAdmission()
+
+def run_sharded_prediction(image_files, input_dir, flooded_dir, num_workers, model_options=None, progress_callback=None,
+                           tile_options=None, result_callback=None, admission=None):
+    """Run tile prediction across worker processes and merge results in input order
+
+    tile_options holds keyword arguments for process_single_tile (cascade, sliding_window).
+    result_callback receives each prediction_info as its shard completes.
+    admission, a scheduler RunAdmission, admits the workers' CPU for one wave of
+    num_workers shards at a time; the workers keep their models loaded between
+    waves, so the caller reserves their memory for the whole call.
+
+    Shards lost to a crashed worker are re-run in this process, so a failing
+    worker slows the run down instead of aborting it. Returns (results, write_errors),
+    with results None if the model could not be loaded.
+    """
+    # Split the cores between workers instead of letting each torch claim all of them; the
+    # caller's own settings are kept for the in-process fallback, as torch threads are process-wide
+    worker_options = dict(model_options or {})
+    worker_options.setdefault('num_threads', max(1, (os.cpu_count() or 1) // num_workers))
+
+    shards = split_into_shards(image_files, num_workers)
+    shard_results = [None] * len(shards)
+    failed_shards = []
+    write_errors = []
+    processed_count = 0
+    total_images = len(image_files)
+
+    try:
+        executor = ProcessPoolExecutor(
+            max_workers=num_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_shard_worker,
+            initargs=(worker_options,)
+        )
+        try:
+            # Under a scheduler, shards go out one wave per worker set, each wave admitted separately
+            wave_size = num_workers if admission else len(shards)
+            waves = [range(start, min(start + wave_size, len(shards))) for start in range(0, len(shards), wave_size)]
+            with chunked_admission(admission, num_workers, chunk_size=1, total=len(waves)) as chunks:
+                for wave in waves:
+                    futures = {
+                        executor.submit(_process_shard, shards[idx], input_dir, flooded_dir, tile_options): idx
+                        for idx in wave
+                    }
+                    for future in as_completed(futures):
+                        idx = futures[future]
+                        try:
+                            shard_results[idx], shard_errors = future.result()
+                            write_errors.extend(shard_errors)
+                        except Exception as e:
+                            print(f"Shard {idx} failed in worker: {e}")
+                            failed_shards.append(idx)
+                            continue
+
+                        if result_callback:
+                            for info, _ in shard_results[idx]:
+                                if info is not None:
+                                    result_callback(info)
+
+                        processed_count += len(shards[idx])
+                        if progress_callback:
+                            progress_callback(processed_count / total_images)
+                    chunks.step()
+        except BaseException:
+            # Cancelled or failed: drop the queued shards instead of waiting for all of them
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        executor.shutdown()
+    except Exception as e:
+        print(f"Worker pool failed: {e}")
+        failed_shards = [idx for idx, result in enumerate(shard_results) if result is None]
+
+    if failed_shards:
+        processor, model, device = initialize_flood_model(**(model_options or {}))
+        if not processor or not model:
+            return None, write_errors
+
+        failed_shards = sorted(set(failed_shards))
+        rerun_total = sum(len(shards[idx]) for idx in failed_shards)
+        with TileOutputWriter() as writer, chunked_admission(admission, 1, total=rerun_total) as chunks:
+            for idx in failed_shards:
+                results = []
+                for image_file in shards[idx]:
+                    results.append(process_single_tile(
+                        image_file, input_dir, flooded_dir, processor, model, device,
+                        writer=writer, **(tile_options or {})
+                    ))
+                    if result_callback and results[-1][0] is not None:
+                        result_callback(results[-1][0])
+                    processed_count += 1
+                    if progress_callback:
+                        progress_callback(processed_count / total_images)
+                    chunks.step()
+                shard_results[idx] = results
+        write_errors.extend(writer.close())
+
+    return [result for shard in shard_results for result in shard], write_errors
+
+def _predict_run_files(run_files, input_dir, flooded_dir, model_options, num_workers, mosaic, tile_options,
+                       progress_callback, result_callback, admission):
+    """Segment run_files with the chosen strategy, returning (tile_results, write_errors, mosaic_plan)
+
+    tile_results is None if the model could not be loaded. The model only lives
+    inside this call, so its memory is freed by the time it returns.
+    """
+    mosaic_plan = None
+    if mosaic is not None:
+        # Initialize model
+        processor, model, device = initialize_flood_model(**(model_options or {}))
+        if not processor or not model:
+            return None, [], mosaic_plan
+        
+        chip_tiles = mosaic.get('chip_tiles', 2)
+        margin = mosaic.get('margin', 32)
+        mosaic_plan = plan_mosaic(run_files, chip_tiles, margin)
+        mosaic_results = {}
+        tiles = predict_mosaic_tiles(
+            mosaic_plan, input_dir, processor, model, device, chip_tiles, margin
+        )
+        # Chips are segmented lazily as tiles are drawn, so each chunk's model calls run under its admission
+        with TileOutputWriter() as writer, chunked_admission(admission, 1, total=len(run_files)) as chunks:
+            for idx, (image_file, prediction, original_image) in enumerate(tiles):
+                mosaic_results[image_file] = record_tile_prediction(
+                    image_file, prediction, original_image, flooded_dir,
+                    writer=writer, source_path=os.path.join(input_dir, image_file)
+                )
+                if result_callback and mosaic_results[image_file][0] is not None:
+                    result_callback(mosaic_results[image_file][0])
+                
+                # Update progress
+                if progress_callback:
+                    progress_callback((idx + 1) / len(run_files))
+                chunks.step()
+        
+        tile_results = [mosaic_results[f] for f in run_files]
+        write_errors = writer.close()
+    elif num_workers > 1:
+        tile_results, write_errors = run_sharded_prediction(
+            run_files, input_dir, flooded_dir, num_workers, model_options, progress_callback, tile_options,
+            result_callback, admission
+        )
+    else:
+        # Initialize model
+        processor, model, device = initialize_flood_model(**(model_options or {}))
+        if not processor or not model:
+            return None, [], mosaic_plan
+        
+        # Flooded-tile outputs are written in the background so inference never waits on disk
+        tile_results = []
+        with TileOutputWriter() as writer, chunked_admission(admission, 1, total=len(run_files)) as chunks:
+            for idx, image_file in enumerate(run_files):
+                tile_results.append(process_single_tile(
+                    image_file, input_dir, flooded_dir, processor, model, device, writer=writer, **tile_options
+                ))
+                if result_callback and tile_results[-1][0] is not None:
+                    result_callback(tile_results[-1][0])
+                
+                # Update progress
+                if progress_callback:
+                    progress = (idx + 1) / len(run_files)
+                    progress_callback(progress)
+                chunks.step()
+        write_errors = writer.close()
+    
+    return tile_results, write_errors, mosaic_plan
+
+def process_flood_prediction(input_dir, state_name, progress_callback=None, model_options=None, num_workers=1,
+                             prefilter=None, cascade=None, mosaic=None, sliding_window=None, result_callback=None,
+                             image_files=None, skip_blank=True, progress_bus=None, flooded_dir=None, admission=None):
+    """Process all images in the input directory for flood prediction
+
+    model_options is passed to initialize_flood_model, e.g. {'mode': 'cpu_optimized', 'num_threads': 4}
+    or {'backend': 'onnx'}. num_workers > 1 shards the tiles across worker processes.
+    prefilter enables the dry-tile pre-filter and is passed to prefilter_tiles,
+    e.g. {'threshold': 0.02, 'audit_fraction': 0.05}.
+    cascade enables the fast-then-full model cascade, overriding CASCADE_DEFAULTS.
+    mosaic segments neighbouring tiles together, e.g. {'chip_tiles': 2, 'margin': 32};
+    it runs in-process and takes precedence over num_workers and cascade.
+    sliding_window segments images larger than the window at native resolution,
+    e.g. {'window': 512, 'stride': 384, 'batch_size': 4}.
+    result_callback is called with each tile's prediction_info as soon as it is
+    available, for consumers that aggregate results incrementally.
+    image_files restricts the run to the given tiles of input_dir.
+    skip_blank drops placeholder and uniform no-data tiles before inference;
+    they are excluded from the totals and counted under 'blank_tiles'.
+    progress_bus, if given, receives per-stage counts under the state's topic
+    ('blank_filter', 'prefilter', 'inference', 'indexing'); progress_callback
+    still receives the inference fraction.
+    flooded_dir overrides where outputs go, by default output/flooded/<STATE>.
+    admission, a scheduler RunAdmission, reserves memory for the run's models
+    before they load and until they are freed, and admits their CPU one chunk
+    of tiles (or wave of shards) at a time, so other owners' runs interleave
+    with a long one.
+    """
     
     # Create flooded images directory
-    flooded_dir = f"output/flooded/{state_name.replace(' ', '_')}"
+    flooded_dir = flooded_dir or state_flooded_dir(state_name)
     os.makedirs(flooded_dir, exist_ok=True)
     
     # Get all image files
-    image_files = [f for f in os.listdir(input_dir) if f.endswith('.png')]
+    if image_files is None:
+        image_files = [f for f in os.listdir(input_dir) if is_tile_file(f)]
+    
+    # Tiles classified at capture carry a content hash or blank reason in the manifest;
+    # only the rest (captured before blank detection existed) are read and checked
+    blank_files = {}
+    if skip_blank:
+        checked = set()
+        if has_manifest(input_dir):
+            checked = {name for name, content_hash in query_tile_hashes(input_dir).items() if content_hash}
+            recorded_blank = query_blank_tiles(input_dir)
+            blank_files = {f: recorded_blank[f] for f in image_files if f in recorded_blank}
+        unchecked = [f for f in image_files if f not in checked and f not in blank_files]
+        if unchecked:
+            if progress_bus:
+                progress_bus.publish(state_name, 'blank_filter', 0, len(unchecked))
+            blank_detector = BlankTileDetector()
+            kept, newly_blank = filter_blank_tiles(unchecked, input_dir, blank_detector)
+            blank_detector.save()
+            blank_files.update(newly_blank)
+            # Unreadable tiles are neither kept nor blank and are dropped
+            checked.update(kept)
+        image_files = [f for f in image_files if f in checked]
     total_images = len(image_files)
     
     if total_images == 0:
         return {"error": "No images found", "flooded_images": [], "all_predictions": []}
     
-    flooded_images = []
-    all_predictions = []
-    processed_count = 0
+    run_id = start_run(flooded_dir, 'prediction', state_name)
     
-    for idx, image_file in enumerate(image_files):
-        image_path = os.path.join(input_dir, image_file)
-        
-        # Make prediction
-        prediction, original_image = predict_single_image(image_path, processor, model, device)
-        
-        if prediction is not None:
-            # Calculate water percentage
-            water_percentage = calculate_water_percentage(prediction)
-            
-            # Create prediction visualization
-            prediction_viz = create_prediction_visualization(prediction)
-            
-            # Store prediction info
-            prediction_info = {
-                'image_name': image_file,
-                'water_percentage': water_percentage,
-                'prediction': prediction,
-                'original_image': original_image,
-                'prediction_viz': prediction_viz
-            }
-            
-            all_predictions.append(prediction_info)
-            
-            # If water percentage > 50%, save to flooded directory
-            if water_percentage > 50.0:
-                # Save original image
-                original_path = os.path.join(flooded_dir, f"original_{image_file}")
-                original_image.save(original_path)
-                
-                # Save prediction visualization
-                pred_path = os.path.join(flooded_dir, f"prediction_{image_file}")
-                prediction_viz.save(pred_path)
-                
-                flooded_images.append({
-                    'image_name': image_file,
-                    'water_percentage': water_percentage,
-                    'original_path': original_path,
-                    'prediction_path': pred_path
-                })
-        
-        processed_count += 1
+    # Skip tiles the cheap colour pre-filter is confident are dry
+    skipped_files, audit_files = set(), set()
+    if prefilter is not None:
+        if progress_bus:
+            progress_bus.publish(state_name, 'prefilter', 0, total_images)
+        skipped_files, audit_files, prefilter_scores = prefilter_tiles(image_files, input_dir, **prefilter)
+    run_files = [f for f in image_files if f not in skipped_files]
+    
+    # Per-tile progress goes through the bus, which coalesces it for its subscribers
+    if progress_bus:
+        progress_callback = progress_bus.stage_callback(state_name, 'inference', len(run_files), progress_callback)
+    
+    # Prefiltered tiles are still recorded so every tile appears in the results
+    prefiltered_infos = {
+        image_file: {
+            'image_name': image_file,
+            'water_percentage': 0.0,
+            'prediction': None,
+            'original_image': None,
+            'prediction_viz': None,
+            'prefiltered': True,
+            'prefilter_score': prefilter_scores[image_file]
+        }
+        for image_file in image_files if image_file in skipped_files
+    }
+    if result_callback:
+        for info in prefiltered_infos.values():
+            result_callback(info)
+    
+    tile_options = {'cascade': cascade, 'sliding_window': sliding_window}
+    
+    # Memory for the resident models is reserved before they load and held until they are freed
+    run_workers = 1 if mosaic is not None or num_workers <= 1 else max(1, min(num_workers, len(run_files)))
+    with admission.reserve(run_workers) if admission else nullcontext():
+        tile_results, write_errors, mosaic_plan = _predict_run_files(
+            run_files, input_dir, flooded_dir, model_options, run_workers, mosaic, tile_options,
+            progress_callback, result_callback, admission
+        )
+    if tile_results is None:
+        return {"error": "Failed to initialize model", "flooded_images": [], "all_predictions": []}
+    
+    results_by_name = dict(zip(run_files, tile_results))
+    all_predictions = []
+    flooded_images = []
+    for image_file in image_files:
+        if image_file in prefiltered_infos:
+            all_predictions.append(prefiltered_infos[image_file])
+            continue
         
-        # Update progress
-        if progress_callback:
-            progress = processed_count / total_images
-            progress_callback(progress)
+        info, flooded = results_by_name[image_file]
+        if info is not None:
+            all_predictions.append(info)
+        if flooded is not None:
+            flooded_images.append(flooded)
+    
+    # Index the run so result pages query the manifest instead of scanning directories
+    if progress_bus:
+        progress_bus.publish(state_name, 'indexing', 0, 1)
+    flooded_by_name = {f['image_name']: f for f in flooded_images}
+    manifest_rows = []
+    for info in all_predictions:
+        flooded = flooded_by_name.get(info['image_name'], {})
+        manifest_rows.append({
+            **(parse_tile_name(info['image_name']) or {}),
+            'image_name': info['image_name'],
+            'water_percentage': info['water_percentage'],
+            'flooded': bool(flooded),
+            'prefiltered': info['prefiltered'],
+            'source_path': os.path.join(input_dir, info['image_name']),
+            'original_path': flooded.get('original_path'),
+            'prediction_path': flooded.get('prediction_path')
+        })
+    record_predictions(flooded_dir, run_id, manifest_rows)
+    complete_run(flooded_dir, run_id, total_images)
+    if progress_bus:
+        progress_bus.publish(state_name, 'indexing', 1, 1, final=True)
     
     # Summary
     total_flooded = len(flooded_images)
@@ -178,22 +1008,67 @@ def process_flood_prediction(input_dir, state_name, progress_callback=None):
         'flooded_percentage': (total_flooded / total_images * 100) if total_images > 0 else 0,
         'flooded_images': flooded_images[:10],  # Limit to first 10 for display
         'all_predictions': all_predictions,
-        'flooded_dir': flooded_dir
+        'flooded_dir': flooded_dir,
+        'write_errors': write_errors
     }
     
+    if blank_files:
+        blank_counts = {}
+        for reason in blank_files.values():
+            blank_counts[reason] = blank_counts.get(reason, 0) + 1
+        result['blank_tiles'] = blank_counts
+    
+    if prefilter is not None:
+        audit_results = {
+            f: results_by_name[f][0]['water_percentage']
+            for f in audit_files if results_by_name[f][0] is not None
+        }
+        result['prefilter'] = summarize_prefilter(
+            total_images, skipped_files, audit_results, prefilter.get('threshold', 0.02)
+        )
+    
+    if mosaic_plan is not None:
+        _, unplaced, chips, isolated = mosaic_plan
+        model_calls = len(chips) + len(isolated) + len(unplaced)
+        # Per-tile inference would have made one model call per tile
+        result['mosaic'] = {
+            'tiles': len(run_files),
+            'chips': len(chips),
+            'isolated_tiles': len(isolated),
+            'unplaced_tiles': len(unplaced),
+            'model_calls': model_calls,
+            'model_calls_saved': len(run_files) - model_calls,
+            'model_call_savings': (len(run_files) - model_calls) / len(run_files) * 100 if run_files else 0
+        }
+    elif cascade is not None:
+        stages = [info.get('cascade_stage') for info in all_predictions if not info['prefiltered']]
+        fast_count = stages.count('fast')
+        full_count = stages.count('full')
+        result['cascade'] = {
+            'fast': fast_count,
+            'full': full_count,
+            'full_rate': full_count / len(stages) * 100 if stages else 0
+        }
+    
     return result
 
-def get_flooded_images(flooded_dir, limit=10):
-    """Get list of flooded images from directory"""
+def get_flooded_images(flooded_dir, limit=10, offset=0, sort='water_desc'):
+    """Get a page of flooded images, from the run manifest when the directory has one
+
+    sort is one of manifest.SORT_ORDERS, e.g. 'water_desc' for the most flooded first.
+    """
     if not os.path.exists(flooded_dir):
         return []
     
-    # Get original images (not prediction visualizations)
-    original_files = [f for f in os.listdir(flooded_dir) if f.startswith('original_')]
+    if has_manifest(flooded_dir):
+        return query_flooded(flooded_dir, limit=limit, offset=offset, sort=sort)
+    
+    # Directories from before the manifest existed are scanned instead
+    original_files = sorted(f for f in os.listdir(flooded_dir) if f.startswith('original_'))
     
     flooded_images = []
-    for original_file in original_files[:limit]:
-        pred_file = original_file.replace('original_', 'prediction_')
+    for original_file in original_files[offset:offset + limit]:
+        pred_file = f"prediction_{os.path.splitext(original_file[len('original_'):])[0]}.png"
         
         original_path = os.path.join(flooded_dir, original_file)
         pred_path = os.path.join(flooded_dir, pred_file)
@@ -207,23 +1082,32 @@ def get_flooded_images(flooded_dir, limit=10):
     
     return flooded_images
 
-def cleanup_prediction_data(state_name):
+def count_flooded_images(flooded_dir):
+    """Count flooded images in a flooded directory"""
+    if not os.path.exists(flooded_dir):
+        return 0
+    
+    if has_manifest(flooded_dir):
+        return summarize_predictions(flooded_dir)['total_flooded']
+    
+    return len([f for f in os.listdir(flooded_dir) if f.startswith('original_')])
+
+def cleanup_prediction_data(state_name, flooded_dir=None):
     """Clean up prediction data for a state"""
-    flooded_dir = f"output/flooded/{state_name.replace(' ', '_')}"
+    flooded_dir = flooded_dir or state_flooded_dir(state_name)
     if os.path.exists(flooded_dir):
         shutil.rmtree(flooded_dir)
 
-def get_prediction_summary(state_name):
+def get_prediction_summary(state_name, flooded_dir=None):
     """Get summary of prediction results"""
-    flooded_dir = f"output/flooded/{state_name.replace(' ', '_')}"
+    flooded_dir = flooded_dir or state_flooded_dir(state_name)
     
     if not os.path.exists(flooded_dir):
         return {"total_flooded": 0, "flooded_images": []}
     
-    original_files = [f for f in os.listdir(flooded_dir) if f.startswith('original_')]
     flooded_images = get_flooded_images(flooded_dir, limit=10)
     
     return {
-        "total_flooded": len(original_files),
+        "total_flooded": count_flooded_images(flooded_dir),
         "flooded_images": flooded_images
-    }
\ No newline at end of file
+    }
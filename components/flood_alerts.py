@@ -0,0 +1,192 @@
+import os
+import json
+import time
+import threading
+import numpy as np
+from components.geo_map import parse_tile_name
+
+ALERTS_PATH = "output/alerts/alerts.jsonl"
+
+# Rules used when an operator declares none: (type, settings) as accepted by build_rules
+DEFAULT_ALERT_RULES = [
+    {'type': 'zone_area', 'min_water_km2': 25.0},
+    {'type': 'neighbour_rise', 'min_increase': 20.0, 'min_tiles': 4},
+]
+
+class ZoneAreaRule:
+    """Fires once per zone when its water area exceeds min_water_km2
+
+    Reads the running totals of a ZonalFloodStats, which must receive each
+    result before the alert engine does. Only the zones under the incoming tile
+    are checked, so the cost per tile does not grow with the number of zones.
+    """
+
+    def __init__(self, zonal_stats, min_water_km2, name=None):
+        self.zonal_stats = zonal_stats
+        self.min_water_km2 = min_water_km2
+        self.name = name or f"zone_area>{min_water_km2:g}km2"
+        self.fired = set()
+
+    def evaluate(self, prediction_info, coords):
+        labels = self.zonal_stats.tile_labels(coords['z'], coords['x'], coords['y'])
+        alerts = []
+        for idx in np.unique(labels):
+            if idx == 0 or idx in self.fired:
+                continue
+            water_km2 = float(self.zonal_stats.water_km2[idx])
+            if water_km2 > self.min_water_km2:
+                self.fired.add(idx)
+                zone = self.zonal_stats.names[idx - 1]
+                alerts.append({
+                    'rule': self.name,
+                    'message': f"{zone}: {water_km2:.1f} km² of water exceeds {self.min_water_km2:g} km²",
+                    'zone': zone,
+                    'water_km2': water_km2,
+                    'trigger_tile': prediction_info['image_name']
+                })
+        return alerts
+
+class NeighbourRiseRule:
+    """Fires when min_tiles 8-connected tiles have each gained at least min_increase percentage points
+
+    A tile's rise is taken from change detection ('change' in prediction_info)
+    or from a baseline of previous water fractions, e.g. latest_fractions().
+    Risen tiles are merged into clusters with union-find, so each tile costs
+    near-constant time and a cluster fires once, when it reaches min_tiles.
+    """
+
+    def __init__(self, min_increase, min_tiles, baseline=None, name=None):
+        self.min_increase = min_increase
+        self.min_tiles = min_tiles
+        self.baseline = baseline or {}
+        self.name = name or f"rise>{min_increase:g}%x{min_tiles}"
+        self.parent = {}
+        self.size = {}
+        self.fired = set()
+
+    def find(self, tile):
+        while self.parent[tile] != tile:
+            self.parent[tile] = self.parent[self.parent[tile]]
+            tile = self.parent[tile]
+        return tile
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return a
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        if b in self.fired:
+            self.fired.add(a)
+        return a
+
+    def tile_increase(self, prediction_info, tile):
+        change = prediction_info.get('change')
+        if change is not None:
+            return change.get('delta')
+        previous = self.baseline.get(tile)
+        if previous is None:
+            return None
+        return prediction_info['water_percentage'] - previous * 100.0
+
+    def evaluate(self, prediction_info, coords):
+        tile = (coords['z'], coords['x'], coords['y'])
+        increase = self.tile_increase(prediction_info, tile)
+        if increase is None or increase < self.min_increase or tile in self.parent:
+            return []
+
+        self.parent[tile] = tile
+        self.size[tile] = 1
+        root = tile
+        z, x, y = tile
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                neighbour = (z, x + dx, y + dy)
+                if neighbour != tile and neighbour in self.parent:
+                    root = self.union(root, neighbour)
+
+        root = self.find(root)
+        if self.size[root] < self.min_tiles or root in self.fired:
+            return []
+        self.fired.add(root)
+        return [{
+            'rule': self.name,
+            'message': (
+                f"{self.size[root]} neighbouring tiles gained more than {self.min_increase:g}% water "
+                f"around z{z}/{x}/{y}"
+            ),
+            'tile_count': self.size[root],
+            'trigger_tile': prediction_info['image_name']
+        }]
+
+def build_rules(specs, zonal_stats=None, baseline=None):
+    """Instantiate rules from declarative specs such as DEFAULT_ALERT_RULES"""
+    rules = []
+    for spec in specs:
+        settings = {k: v for k, v in spec.items() if k != 'type'}
+        if spec['type'] == 'zone_area':
+            if zonal_stats is None:
+                print(f"Skipping alert rule {spec}: no zones available")
+                continue
+            rules.append(ZoneAreaRule(zonal_stats, **settings))
+        elif spec['type'] == 'neighbour_rise':
+            rules.append(NeighbourRiseRule(baseline=baseline, **settings))
+        else:
+            print(f"Unknown alert rule type: {spec['type']}")
+    return rules
+
+class FileAlertSink:
+    """Appends alerts as JSON lines, flushed immediately so tails see them at once"""
+
+    def __init__(self, path=ALERTS_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    def send(self, alert):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(alert) + "\n")
+
+class WebhookStubSink:
+    """Collects the payloads a webhook would receive, for wiring up a real endpoint later"""
+
+    def __init__(self, url=None):
+        self.url = url
+        self.sent = []
+
+    def send(self, alert):
+        self.sent.append({'url': self.url, 'payload': alert})
+        print(f"Alert webhook stub ({self.url or 'no url'}): {alert['message']}")
+
+class AlertEngine:
+    """Evaluates alert rules incrementally as each tile's result arrives
+
+    Use add_result as (part of) the result_callback of process_flood_prediction;
+    alerts are dispatched to every sink as soon as the triggering tile lands.
+    A failing sink is reported and does not stop the run.
+    """
+
+    def __init__(self, rules, sinks, state_name=None):
+        self.rules = rules
+        self.sinks = sinks
+        self.state_name = state_name
+        self.alerts = []
+        self._lock = threading.Lock()
+
+    def add_result(self, prediction_info):
+        """Result callback for process_flood_prediction"""
+        coords = parse_tile_name(prediction_info['image_name'])
+        if coords is None or prediction_info.get('prefiltered'):
+            return
+        with self._lock:
+            fired = [alert for rule in self.rules for alert in rule.evaluate(prediction_info, coords)]
+            for alert in fired:
+                alert['state_name'] = self.state_name
+                alert['fired_at'] = time.time()
+                self.alerts.append(alert)
+                for sink in self.sinks:
+                    try:
+                        sink.send(alert)
+                    except Exception as e:
+                        print(f"Error sending alert to {type(sink).__name__}: {e}")
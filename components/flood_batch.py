@@ -0,0 +1,244 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from shapely.geometry import box
+from shapely.prepared import prep
+from components.flood import process_flood_prediction
+from components.geo_map import (
+    get_state_geometry_and_bounds,
+    calculate_tile_parameters,
+    iter_capture_tiles,
+    tile_file_name,
+    tile_bounds,
+    download_single_tile,
+    probe_provider_placeholder
+)
+from components.manifest import has_manifest, record_tiles, query_tile_hashes, query_blank_tiles
+from components.blank_tiles import BlankTileDetector
+from components.workspace import OUTPUT_ROOT, state_tiles_dir, state_flooded_dir
+from components.scheduler import RunAdmission
+
+BATCH_NAME = "India_batch"
+BATCH_TILES_DIR = state_tiles_dir(BATCH_NAME)
+
+def plan_batch(df, state_names, tiles_number=10):
+    """Build one deduplicated tile plan covering several states
+
+    Each state's capture grid is generated as in capture_satellite_tiles, and
+    tiles are keyed by (z, x, y). A tile is kept only for the states whose
+    boundary it actually meets, so a border tile is fetched and segmented once
+    and counted for every state it covers.
+    Returns {'tiles': {(z, x, y): {'image_name', 'states'}}, 'states': {...}, 'duplicates': n,
+    'grid_duplicates': n, 'border_duplicates': n, 'outside_cells': n}, where grid duplicates
+    are cells of one state's grid landing on the same tile, border duplicates are tiles
+    already planned for another state, and outside cells miss every state outline.
+    """
+    tiles = {}
+    states = {}
+    grid_duplicates = border_duplicates = outside_cells = 0
+    for state_name in state_names:
+        _, geometry, bounds = get_state_geometry_and_bounds(df, state_name)
+        if geometry is None:
+            print(f"Skipping {state_name}: no geometry")
+            continue
+
+        outline = prep(geometry)
+        tile_params = calculate_tile_parameters(bounds, tiles_number)
+        state_tiles = set()
+        for _, _, z, x, y in iter_capture_tiles(bounds, tile_params):
+            key = (z, x, y)
+            if key in state_tiles:
+                grid_duplicates += 1
+                continue
+            if not outline.intersects(box(*tile_bounds(x, y, z))):
+                outside_cells += 1
+                continue
+            state_tiles.add(key)
+            if key in tiles:
+                border_duplicates += 1
+            entry = tiles.setdefault(key, {'image_name': tile_file_name(y, x, z, x, y), 'states': []})
+            entry['states'].append(state_name)
+
+        states[state_name] = {'tile_count': len(state_tiles), 'grid_cells': tile_params['total_tiles']}
+
+    return {
+        'tiles': tiles,
+        'states': states,
+        'duplicates': grid_duplicates + border_duplicates,
+        'grid_duplicates': grid_duplicates,
+        'border_duplicates': border_duplicates,
+        'outside_cells': outside_cells
+    }
+
+def state_totals(plan):
+    """Planned tile count of each state"""
+    return {state: info['tile_count'] for state, info in plan['states'].items()}
+
+def capture_batch(plan, output_dir=BATCH_TILES_DIR, num_threads=8, progress_callback=None):
+    """Download every planned tile once on a shared thread pool
+
+    Tiles already captured into output_dir (with a recorded hash) are kept, so
+    an interrupted batch resumes where it stopped. Each plan entry's image_name
+    is updated to the stored file, whose extension follows the tile's actual
+    format. No-data tiles are tagged, not saved. progress_callback receives
+    (overall_progress, {state: progress}). Returns (tiles_available, blank_counts).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    recorded = query_tile_hashes(output_dir) if has_manifest(output_dir) else {}
+    totals = state_totals(plan)
+    done = {state: 0 for state in totals}
+
+    # Tiles are stored in their native format, so earlier captures are matched by name without extension
+    recorded_names = {os.path.splitext(name)[0]: name for name, content_hash in recorded.items() if content_hash}
+    
+    pending = []
+    available = 0
+    for (z, x, y), entry in plan['tiles'].items():
+        existing = recorded_names.get(os.path.splitext(entry['image_name'])[0])
+        if existing and os.path.exists(os.path.join(output_dir, existing)):
+            entry['image_name'] = existing
+            available += 1
+            for state in entry['states']:
+                done[state] += 1
+        else:
+            pending.append(((z, x, y), entry))
+
+    captured = []
+    total = len(plan['tiles'])
+    finished = available
+    blank_detector = BlankTileDetector()
+    for zoom in {z for (z, _, _), _ in pending}:
+        probe_provider_placeholder(blank_detector, zoom)
+    executor = ThreadPoolExecutor(max_workers=num_threads)
+    try:
+        futures = {
+            executor.submit(
+                download_single_tile, x, y, z, os.path.join(output_dir, entry['image_name']), blank_detector
+            ): (key, entry)
+            for key, entry in pending
+        }
+        for future in as_completed(futures):
+            (z, x, y), entry = futures[future]
+            tile = future.result()
+            if tile:
+                entry['image_name'] = tile['image_name']
+                if tile['blank_reason'] is None:
+                    available += 1
+                captured.append({**tile, 'z': z, 'x': x, 'y': y})
+            finished += 1
+            for state in entry['states']:
+                done[state] += 1
+            if progress_callback:
+                progress_callback(
+                    finished / total,
+                    {state: done[state] / totals[state] for state in totals if totals[state]}
+                )
+    except BaseException:
+        # Cancelled or failed: drop the queued downloads instead of fetching every one first
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+
+    # Index the captured tiles so listings don't rescan the directory
+    record_tiles(output_dir, captured)
+    blank_detector.save()
+    return available, dict(blank_detector.counts)
+
+def summarize_batch_states(plan, predictions):
+    """Per-state flood summary from the shared per-tile results"""
+    owners = {entry['image_name']: entry['states'] for entry in plan['tiles'].values()}
+    summaries = {
+        state: {'total_images': 0, 'total_flooded': 0, 'water_sum': 0.0}
+        for state in plan['states']
+    }
+    for info in predictions:
+        for state in owners.get(info['image_name'], []):
+            summary = summaries[state]
+            summary['total_images'] += 1
+            summary['water_sum'] += info['water_percentage']
+            if info['water_percentage'] > 50.0:
+                summary['total_flooded'] += 1
+
+    for summary in summaries.values():
+        total = summary['total_images']
+        water_sum = summary.pop('water_sum')
+        summary['flooded_percentage'] = (summary['total_flooded'] / total * 100) if total else 0
+        summary['mean_water_percentage'] = (water_sum / total) if total else 0
+    return summaries
+
+def run_batch(df, state_names, tiles_number=10, capture_threads=8, num_workers=1, model_options=None,
+              progress_callback=None, result_callback=None, prediction_options=None, output_root=OUTPUT_ROOT,
+              owner=None, on_wait=None):
+    """Capture and segment several states as one deduplicated batch
+
+    Capture runs on one shared thread pool and inference on one shared model
+    (or pool of workers with num_workers > 1) for all states.
+    progress_callback receives (stage, overall_progress, {state: progress}) with
+    stage 'capture' or 'prediction'. prediction_options is passed on to
+    process_flood_prediction (prefilter, cascade, ...).
+    Tiles and outputs go under output_root; inference is admitted by the stage
+    scheduler on behalf of owner, its CPU one chunk of tiles at a time, with on_wait
+    called while it is queued.
+    """
+    plan = plan_batch(df, state_names, tiles_number)
+    if not plan['tiles']:
+        return {"error": "No tiles planned for the selected states"}
+
+    def on_capture_progress(progress, state_progress):
+        if progress_callback:
+            progress_callback('capture', progress, state_progress)
+
+    tiles_dir = state_tiles_dir(BATCH_NAME, output_root)
+    _, blank_counts = capture_batch(plan, tiles_dir, capture_threads, on_capture_progress)
+    # Capture settles each tile's stored name, so ownership is indexed afterwards
+    owners = {entry['image_name']: entry['states'] for entry in plan['tiles'].values()}
+
+    # Per-state totals count only the tiles sent to prediction, so a state with blanks still reaches 100%
+    blank_files = query_blank_tiles(tiles_dir) if has_manifest(tiles_dir) else {}
+    image_files = [
+        image_name for image_name in owners
+        if image_name not in blank_files and os.path.exists(os.path.join(tiles_dir, image_name))
+    ]
+    totals = {state: 0 for state in plan['states']}
+    for image_name in image_files:
+        for state in owners[image_name]:
+            totals[state] += 1
+
+    processed = {state: 0 for state in totals}
+    processed_total = [0]
+
+    def state_progress():
+        return {state: processed[state] / totals[state] if totals[state] else 1.0 for state in totals}
+
+    def on_tile_result(prediction_info):
+        for state in owners.get(prediction_info['image_name'], []):
+            processed[state] += 1
+        processed_total[0] += 1
+        if result_callback:
+            result_callback(prediction_info)
+        if progress_callback:
+            progress_callback('prediction', processed_total[0] / max(len(image_files), 1), state_progress())
+
+    result = process_flood_prediction(
+        tiles_dir,
+        BATCH_NAME,
+        model_options=model_options,
+        num_workers=num_workers,
+        result_callback=on_tile_result,
+        image_files=image_files,
+        flooded_dir=state_flooded_dir(BATCH_NAME, output_root),
+        admission=RunAdmission(owner, model_options, on_wait),
+        **(prediction_options or {})
+    )
+    if 'error' in result:
+        return result
+    if progress_callback:
+        # Tiles that failed inference never report, so every state is closed once the run ends
+        progress_callback('prediction', 1.0, {state: 1.0 for state in totals})
+
+    result['states'] = summarize_batch_states(plan, result['all_predictions'])
+    result['planned_tiles'] = len(plan['tiles'])
+    result['duplicate_tiles_skipped'] = plan['duplicates']
+    result['border_tiles_shared'] = plan['border_duplicates']
+    result['outside_cells_skipped'] = plan['outside_cells']
+    result['blank_tiles_skipped'] = blank_counts
+    return result
@@ -0,0 +1,260 @@
+import os
+import sqlite3
+import time
+import numpy as np
+from PIL import Image
+from contextlib import closing, ExitStack
+from components.flood import (
+    MODEL_NAME,
+    flood_model_settings,
+    initialize_flood_model,
+    chunked_admission,
+    predict_single_image,
+    calculate_water_percentage
+)
+from components.flood_tiles import write_class_tile, read_class_tile, WATER_CLASS
+from components.geo_map import get_tile_images, hash_tile_bytes, parse_tile_name
+from components.manifest import has_manifest, query_tile_hashes
+from components.workspace import OUTPUT_ROOT, state_flooded_dir
+
+# Masks are content-addressed and shared; each workspace keeps its own baseline of what it last saw
+CHANGE_CACHE_DIR = "output/change_cache"
+CHANGE_STATE_DIRNAME = "change_state"
+CHANGES_DIRNAME = "changes"
+
+# Change mask classes: 0 unchanged, 1 water gained, 2 water lost
+CHANGE_PALETTE = [0, 0, 0, 0, 120, 255, 255, 140, 0]
+CHANGE_ALPHA = bytes([0, 255, 255])
+
+# Tiles are keyed by their z/x/y address, which (unlike grid indices) does not depend on the capture grid
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tile_baseline (
+    z INTEGER NOT NULL,
+    x INTEGER NOT NULL,
+    y INTEGER NOT NULL,
+    content_hash TEXT NOT NULL,
+    water_percentage REAL NOT NULL,
+    observed_at REAL NOT NULL,
+    PRIMARY KEY (z, x, y)
+) WITHOUT ROWID;
+"""
+
+def change_state_dir(output_root=OUTPUT_ROOT):
+    """Directory of the change baseline of an output root, e.g. a session workspace"""
+    return os.path.join(output_root, CHANGE_STATE_DIRNAME)
+
+def open_change_state(state_dir):
+    """Open (creating if needed) the record of the last hash seen for each tile"""
+    os.makedirs(state_dir, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(state_dir, "tile_baseline.sqlite"), timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
+
+def load_previous_state(state_dir):
+    """Content hash and water percentage last recorded for every tile, keyed by (z, x, y)"""
+    with closing(open_change_state(state_dir)) as conn:
+        rows = conn.execute("SELECT z, x, y, content_hash, water_percentage FROM tile_baseline").fetchall()
+    return {(row['z'], row['x'], row['y']): dict(row) for row in rows}
+
+def save_state(tiles, state_dir):
+    """Record this run's tile hashes as the baseline of the next"""
+    now = time.time()
+    with closing(open_change_state(state_dir)) as conn, conn:
+        conn.executemany(
+            """INSERT OR REPLACE INTO tile_baseline
+               (z, x, y, content_hash, water_percentage, observed_at)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            [(*t['tile'], t['content_hash'], t['water_percentage'], now) for t in tiles]
+        )
+
+def mask_cache_key(model_options=None):
+    """Cache namespace of the masks a model configuration produces: model, mode and backend"""
+    settings = {**flood_model_settings(), **{k: v for k, v in (model_options or {}).items() if v}}
+    mode = settings.get('mode', 'default')
+    backend = settings.get('backend', 'pytorch')
+    return f"{MODEL_NAME.replace('/', '_')}_{mode}_{backend}"
+
+def mask_cache_path(content_hash, model_key, cache_dir=CHANGE_CACHE_DIR):
+    """Content-addressed location of the cached mask for a tile's imagery"""
+    return os.path.join(cache_dir, "masks", model_key, content_hash[:2], f"{content_hash}.png")
+
+def tile_content_hashes(input_dir, image_files):
+    """Tile hashes recorded at capture time, hashing only tiles captured without one"""
+    recorded = query_tile_hashes(input_dir) if has_manifest(input_dir) else {}
+    hashes = {}
+    for image_file in image_files:
+        content_hash = recorded.get(image_file)
+        if not content_hash:
+            with open(os.path.join(input_dir, image_file), 'rb') as f:
+                content_hash = hash_tile_bytes(f.read())
+        hashes[image_file] = content_hash
+    return hashes
+
+class MaskCacheSeeder:
+    """Stores the masks of a prediction run in the change-detection mask cache
+
+    Used as the result_callback of process_flood_prediction over input_dir, so
+    the first detect_flood_changes afterwards reuses these masks instead of
+    segmenting every tile again. Prefiltered tiles have no mask, and masks from
+    the cascade's low-resolution pass are not what change detection computes,
+    so neither is stored.
+    """
+
+    def __init__(self, input_dir, model_options=None, cache_dir=CHANGE_CACHE_DIR):
+        self.input_dir = input_dir
+        self.cache_dir = cache_dir
+        self.model_key = mask_cache_key(model_options)
+        self.recorded = query_tile_hashes(input_dir) if has_manifest(input_dir) else {}
+
+    def add_result(self, prediction_info):
+        """Result callback for process_flood_prediction"""
+        image_file = prediction_info['image_name']
+        if prediction_info.get('prediction') is None or prediction_info.get('cascade_stage') == 'fast':
+            return
+        try:
+            content_hash = self.recorded.get(image_file)
+            if not content_hash:
+                with open(os.path.join(self.input_dir, image_file), 'rb') as f:
+                    content_hash = hash_tile_bytes(f.read())
+            cache_path = mask_cache_path(content_hash, self.model_key, self.cache_dir)
+            if not os.path.exists(cache_path):
+                write_class_tile(cache_path, prediction_info['prediction'])
+        except Exception as e:
+            print(f"Error caching mask of {image_file}: {e}")
+
+def compute_change_mask(previous, current):
+    """Per-pixel water change between two class maps (0 none, 1 gained, 2 lost)"""
+    if previous.shape != current.shape:
+        previous = np.asarray(Image.fromarray(previous).resize(current.shape[::-1], Image.NEAREST))
+    was_water = previous == WATER_CLASS
+    is_water = current == WATER_CLASS
+    change = np.zeros(current.shape, dtype=np.uint8)
+    change[is_water & ~was_water] = 1
+    change[was_water & ~is_water] = 2
+    return change
+
+def save_change_mask(change, path):
+    """Write a change mask as a palette PNG where unchanged pixels are transparent"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    image = Image.fromarray(change)
+    image.putpalette(CHANGE_PALETTE)
+    image.save(path, format='PNG', transparency=CHANGE_ALPHA)
+
+def detect_flood_changes(input_dir, state_name, progress_callback=None, model_options=None, result_callback=None,
+                         cache_dir=CHANGE_CACHE_DIR, flooded_dir=None, admission=None, output_root=OUTPUT_ROOT):
+    """Compare a fresh capture of a state against its previous run, re-segmenting only changed imagery
+
+    Tiles are identified by the content hash recorded by capture_satellite_tiles.
+    Masks are cached by that hash and the model configuration (MaskCacheSeeder
+    also fills the cache from prediction runs), so a tile whose imagery has not
+    changed (or that matches imagery seen before) is never segmented again, and
+    the model is only loaded if some tile needs it. The previous run is the
+    baseline recorded under output_root, e.g. the session workspace, by z/x/y.
+    For tiles whose imagery changed since the last run a change mask is written
+    under <flooded_dir>/changes, by default output/flooded/<STATE>/changes.
+    result_callback receives a prediction_info for every tile, as in
+    process_flood_prediction, with the water change added under 'change'.
+    admission, a scheduler RunAdmission, is only requested once a tile needs the
+    model: its memory is then held until the run ends, its CPU one chunk of
+    re-segmented tiles at a time.
+    """
+    image_files = get_tile_images(input_dir)
+    if not image_files:
+        return {"error": "No images found", "changes": []}
+
+    changes_dir = os.path.join(flooded_dir or state_flooded_dir(state_name, output_root), CHANGES_DIRNAME)
+    state_dir = change_state_dir(output_root)
+    previous_state = load_previous_state(state_dir)
+    hashes = tile_content_hashes(input_dir, image_files)
+    model_key = mask_cache_key(model_options)
+
+    processor = model = device = None
+    recomputed = reused = 0
+    current_state = []
+    changes = []
+
+    # Only re-segmented tiles use the model, so capacity is requested once the first one needs it
+    with ExitStack() as model_reservation, chunked_admission(admission, lazy=True) as chunks:
+        for idx, image_file in enumerate(image_files):
+            content_hash = hashes[image_file]
+            coords = parse_tile_name(image_file)
+            # Tiles without a z/x/y address cannot be matched across runs
+            tile = (coords['z'], coords['x'], coords['y']) if coords else None
+            previous = previous_state.get(tile)
+            cache_path = mask_cache_path(content_hash, model_key, cache_dir)
+
+            prediction = read_class_tile(cache_path)
+            if prediction is not None:
+                reused += 1
+            else:
+                if model is None:
+                    if admission:
+                        model_reservation.enter_context(admission.reserve())
+                    processor, model, device = initialize_flood_model(**(model_options or {}))
+                    if not processor or not model:
+                        return {"error": "Failed to initialize model", "changes": []}
+                chunks.hold()
+                prediction, _ = predict_single_image(os.path.join(input_dir, image_file), processor, model, device)
+                chunks.step()
+                if prediction is None:
+                    continue
+                write_class_tile(cache_path, prediction)
+                recomputed += 1
+
+            water_percentage = calculate_water_percentage(prediction)
+            if tile is not None:
+                current_state.append({'tile': tile, 'content_hash': content_hash, 'water_percentage': water_percentage})
+
+            status = 'new'
+            delta = None
+            change_path = None
+            if previous is not None:
+                delta = water_percentage - previous['water_percentage']
+                status = 'unchanged' if previous['content_hash'] == content_hash else 'changed'
+                previous_path = mask_cache_path(previous['content_hash'], model_key, cache_dir)
+                if status == 'changed' and os.path.exists(previous_path):
+                    change = compute_change_mask(read_class_tile(previous_path), prediction)
+                    if change.any():
+                        change_path = os.path.join(changes_dir, "change_z{}_x{}_y{}.png".format(*tile))
+                        save_change_mask(change, change_path)
+
+            tile_change = {
+                'image_name': image_file,
+                'status': status,
+                'water_percentage': water_percentage,
+                'previous_water_percentage': None if previous is None else previous['water_percentage'],
+                'delta': delta,
+                'change_path': change_path
+            }
+            changes.append(tile_change)
+
+            if result_callback:
+                result_callback({
+                    'image_name': image_file,
+                    'water_percentage': water_percentage,
+                    'prediction': prediction,
+                    'original_image': None,
+                    'prediction_viz': None,
+                    'prefiltered': False,
+                    'change': tile_change
+                })
+
+            if progress_callback:
+                progress_callback((idx + 1) / len(image_files))
+
+        # Free the model before its memory reservation is given back
+        processor = model = device = None
+
+    save_state(current_state, state_dir)
+
+    changes.sort(key=lambda c: abs(c['delta'] or 0.0), reverse=True)
+    return {
+        'total_images': len(image_files),
+        'recomputed': recomputed,
+        'reused': reused,
+        'changed_imagery': sum(1 for c in changes if c['status'] == 'changed'),
+        'new_tiles': sum(1 for c in changes if c['status'] == 'new'),
+        'changes': changes,
+        'changes_dir': changes_dir
+    }
@@ -0,0 +1,115 @@
+import os
+import numpy as np
+import rasterio
+import rasterio.shutil
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+from components.flood import COLORS
+from components.flood_tiles import PYRAMID_DIRNAME, read_class_tile
+
+# Half the width of the EPSG:3857 world, in metres
+WEB_MERCATOR_EXTENT = 20037508.342789244
+COG_NAME = "flood_mask_cog.tif"
+
+def tile_grid_transform(zoom, xmin, ymin, tile_size=256):
+    """Affine transform of a raster whose top-left pixel is tile (xmin, ymin) at zoom"""
+    tile_span = 2 * WEB_MERCATOR_EXTENT / (2 ** zoom)
+    left = -WEB_MERCATOR_EXTENT + xmin * tile_span
+    top = WEB_MERCATOR_EXTENT - ymin * tile_span
+    return from_origin(left, top, tile_span / tile_size, tile_span / tile_size)
+
+def iter_base_tiles(flooded_dir):
+    """Base-level (z, x, y, path) tiles of a state's flood pyramid"""
+    root = os.path.join(flooded_dir, PYRAMID_DIRNAME)
+    if not os.path.exists(root):
+        return
+    zooms = [int(name) for name in os.listdir(root) if name.isdigit()]
+    if not zooms:
+        return
+    zoom = max(zooms)
+    zoom_dir = os.path.join(root, str(zoom))
+    for x_name in os.listdir(zoom_dir):
+        for y_name in os.listdir(os.path.join(zoom_dir, x_name)):
+            if y_name.endswith('.png'):
+                yield zoom, int(x_name), int(y_name[:-4]), os.path.join(zoom_dir, x_name, y_name)
+
+def write_mask_cog(tiles, output_path, tile_size=256):
+    """Stream per-tile class masks into a tiled, compressed Cloud-Optimized GeoTIFF
+
+    tiles is a list of (z, x, y, load_mask) where load_mask() returns the
+    tile's uint8 class map; masks are loaded and written one window at a time,
+    so memory stays bounded by a single tile. Returns the output path.
+    """
+    if not tiles:
+        raise ValueError("No flood tiles to export")
+
+    zooms = {z for z, _, _, _ in tiles}
+    if len(zooms) != 1:
+        raise ValueError(f"Tiles must share one zoom level, got {sorted(zooms)}")
+    zoom = zooms.pop()
+
+    xmin = min(x for _, x, _, _ in tiles)
+    xmax = max(x for _, x, _, _ in tiles)
+    ymin = min(y for _, _, y, _ in tiles)
+    ymax = max(y for _, _, y, _ in tiles)
+
+    profile = {
+        'driver': 'GTiff',
+        'width': (xmax - xmin + 1) * tile_size,
+        'height': (ymax - ymin + 1) * tile_size,
+        'count': 1,
+        'dtype': 'uint8',
+        'nodata': 0,
+        'crs': 'EPSG:3857',
+        'transform': tile_grid_transform(zoom, xmin, ymin, tile_size),
+        'tiled': True,
+        'blockxsize': tile_size,
+        'blockysize': tile_size,
+        'compress': 'deflate',
+        'BIGTIFF': 'IF_SAFER',
+        # Blocks never written stay unallocated, which matters for sparse state grids
+        'SPARSE_OK': True,
+    }
+
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    staging_path = f"{output_path}.staging.tif"
+    try:
+        with rasterio.open(staging_path, 'w', **profile) as dst:
+            for _, x, y, load_mask in tiles:
+                mask = load_mask()
+                if mask is None:
+                    continue
+                window = Window((x - xmin) * tile_size, (y - ymin) * tile_size, tile_size, tile_size)
+                dst.write(mask.astype(np.uint8), 1, window=window)
+            dst.write_colormap(1, {idx: tuple(int(c) for c in color) + (255,) for idx, color in enumerate(COLORS)})
+
+        # GDAL's COG driver reorders blocks and builds internal overviews block by block
+        rasterio.shutil.copy(
+            staging_path,
+            output_path,
+            driver='COG',
+            compress='DEFLATE',
+            blocksize=tile_size,
+            overview_resampling='nearest',
+            BIGTIFF='IF_SAFER'
+        )
+    finally:
+        if os.path.exists(staging_path):
+            os.remove(staging_path)
+
+    return output_path
+
+def export_flood_cog(flooded_dir, output_path=None, tile_size=256):
+    """Export a state's flood pyramid base level as a Cloud-Optimized GeoTIFF in EPSG:3857
+
+    The pyramid is built by FloodPyramid, e.g. as the result_callback of
+    process_flood_prediction. Returns the output path, or None if there is nothing to export.
+    """
+    output_path = output_path or os.path.join(flooded_dir, COG_NAME)
+    tiles = [
+        (z, x, y, lambda path=path: read_class_tile(path, tile_size))
+        for z, x, y, path in iter_base_tiles(flooded_dir)
+    ]
+    if not tiles:
+        return None
+    return write_mask_cog(tiles, output_path, tile_size)
@@ -0,0 +1,106 @@
+import threading
+import folium
+from components.geo_map import parse_tile_name, tile_bounds
+
+# Water fraction colour ramp, light to deep blue
+HEATMAP_COLORS = [
+    (10.0, '#c6dbef'),
+    (25.0, '#6baed6'),
+    (50.0, '#2171b5'),
+    (75.0, '#08519c'),
+    (100.0, '#08306b'),
+]
+
+def water_color(water_percentage):
+    """Fill colour for a mean water percentage"""
+    for upper, color in HEATMAP_COLORS:
+        if water_percentage <= upper:
+            return color
+    return HEATMAP_COLORS[-1][1]
+
+class FloodHeatmap:
+    """Water fraction per web-mercator cell, aggregated at several zoom levels
+
+    Each tile result updates one cell per level in O(levels), so the layer is
+    maintained incrementally while predictions stream in. Rendering picks the
+    finest level that fits within max_cells, keeping the map payload small
+    regardless of how many tiles were segmented.
+    """
+
+    def __init__(self, levels=6, max_cells=4000, min_water=5.0):
+        self.levels = levels
+        self.max_cells = max_cells
+        self.min_water = min_water
+        # zoom -> {(x, y): [water_sum, tile_count]}
+        self.cells = {}
+        self.tile_count = 0
+        # Results may arrive on a background job thread while a page renders the layer
+        self._lock = threading.Lock()
+
+    def add_tile(self, z, x, y, water_percentage):
+        """Fold one tile's water fraction into every aggregation level"""
+        with self._lock:
+            for shift in range(self.levels + 1):
+                if z - shift < 0:
+                    break
+                level = self.cells.setdefault(z - shift, {})
+                cell = level.setdefault((x >> shift, y >> shift), [0.0, 0])
+                cell[0] += water_percentage
+                cell[1] += 1
+            self.tile_count += 1
+
+    def add_result(self, prediction_info):
+        """Result callback for process_flood_prediction"""
+        coords = parse_tile_name(prediction_info['image_name'])
+        if coords is not None:
+            self.add_tile(coords['z'], coords['x'], coords['y'], prediction_info['water_percentage'])
+
+    def select_zoom(self):
+        """Finest aggregation zoom whose cell count fits within max_cells"""
+        for zoom in sorted(self.cells, reverse=True):
+            if len(self.cells[zoom]) <= self.max_cells:
+                return zoom
+        return min(self.cells) if self.cells else None
+
+    def to_geojson(self, zoom=None):
+        """GeoJSON FeatureCollection of cells above min_water at the given or selected zoom"""
+        with self._lock:
+            zoom = self.select_zoom() if zoom is None else zoom
+            cells = [(key, tuple(cell)) for key, cell in self.cells.get(zoom, {}).items()]
+        features = []
+        for (x, y), (water_sum, count) in cells:
+            mean_water = water_sum / count
+            if mean_water < self.min_water:
+                continue
+            west, south, east, north = tile_bounds(x, y, zoom)
+            features.append({
+                'type': 'Feature',
+                'geometry': {
+                    'type': 'Polygon',
+                    'coordinates': [[[west, south], [east, south], [east, north], [west, north], [west, south]]]
+                },
+                'properties': {
+                    'water': round(mean_water, 1),
+                    'tiles': count,
+                    'color': water_color(mean_water)
+                }
+            })
+        return {'type': 'FeatureCollection', 'features': features}
+
+    def add_to_map(self, folium_map, name="Flood Water Fraction"):
+        """Add the aggregated water fraction as a choropleth layer on a Folium map"""
+        if not self.cells:
+            return folium_map
+
+        folium.GeoJson(
+            self.to_geojson(),
+            name=name,
+            style_function=lambda feature: {
+                'fillColor': feature['properties']['color'],
+                'color': feature['properties']['color'],
+                'weight': 0.5,
+                'fillOpacity': 0.6
+            },
+            tooltip=folium.GeoJsonTooltip(fields=['water', 'tiles'], aliases=['Water %', 'Tiles'])
+        ).add_to(folium_map)
+        return folium_map
@@ -0,0 +1,218 @@
+import os
+import sqlite3
+import time
+import threading
+import numpy as np
+from contextlib import closing
+from components.flood import NUM_CLASSES
+from components.geo_map import parse_tile_name
+
+# Kept outside output/flooded so cleanup_prediction_data never removes past runs
+HISTORY_PATH = "output/history/flood_history.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history_runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    state_name TEXT,
+    observed_at REAL NOT NULL,
+    total_tiles INTEGER
+);
+CREATE TABLE IF NOT EXISTS observations (
+    z INTEGER NOT NULL,
+    x INTEGER NOT NULL,
+    y INTEGER NOT NULL,
+    observed_at REAL NOT NULL,
+    run_id INTEGER NOT NULL,
+    water_fraction REAL NOT NULL,
+    prefiltered INTEGER NOT NULL DEFAULT 0,
+    histogram BLOB,
+    PRIMARY KEY (z, x, y, observed_at)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS latest (
+    z INTEGER NOT NULL,
+    x INTEGER NOT NULL,
+    y INTEGER NOT NULL,
+    state_name TEXT,
+    observed_at REAL NOT NULL,
+    water_fraction REAL NOT NULL,
+    previous_at REAL,
+    previous_fraction REAL,
+    delta REAL,
+    PRIMARY KEY (z, x, y)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_latest_delta ON latest (delta DESC);
+CREATE INDEX IF NOT EXISTS idx_latest_state_delta ON latest (state_name, delta DESC);
+"""
+
+# A newer observation shifts the current value into previous_*, so "rose since the last run" is an index scan on delta
+UPSERT_LATEST = """
+INSERT INTO latest (z, x, y, state_name, observed_at, water_fraction)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (z, x, y) DO UPDATE SET
+    state_name = excluded.state_name,
+    previous_at = latest.observed_at,
+    previous_fraction = latest.water_fraction,
+    delta = excluded.water_fraction - latest.water_fraction,
+    observed_at = excluded.observed_at,
+    water_fraction = excluded.water_fraction
+WHERE excluded.observed_at > latest.observed_at
+"""
+
+def open_history(path=HISTORY_PATH):
+    """Open (creating if needed) the flood time-series database"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+def class_histogram(prediction):
+    """Pixel count of every class in a class map"""
+    return np.bincount(prediction.ravel(), minlength=NUM_CLASSES)[:NUM_CLASSES].astype(np.int32)
+
+def decode_histogram(blob):
+    """Class histogram stored with an observation, or None for prefiltered tiles"""
+    return None if blob is None else np.frombuffer(blob, dtype=np.int32)
+
+class FloodHistoryRecorder:
+    """Appends one run's per-tile water fraction and class histogram to the time series
+
+    Rows are buffered and written in batches, so it can be used directly as the
+    result_callback of process_flood_prediction. All tiles of a run share the
+    run's timestamp. close() writes what is left and returns the run id.
+    """
+
+    def __init__(self, state_name, path=HISTORY_PATH, observed_at=None, batch_size=1000):
+        self.path = path
+        self.state_name = state_name
+        self.observed_at = observed_at if observed_at is not None else time.time()
+        self.batch_size = batch_size
+        self.rows = []
+        self.total = 0
+        self._lock = threading.Lock()
+        with closing(open_history(path)) as conn, conn:
+            cursor = conn.execute(
+                "INSERT INTO history_runs (state_name, observed_at) VALUES (?, ?)",
+                (state_name, self.observed_at)
+            )
+            self.run_id = cursor.lastrowid
+
+    def add_tile(self, z, x, y, water_fraction, histogram=None, prefiltered=False):
+        """Buffer one tile observation"""
+        blob = None if histogram is None else np.asarray(histogram, dtype=np.int32).tobytes()
+        with self._lock:
+            self.rows.append((z, x, y, float(water_fraction), int(bool(prefiltered)), blob))
+            should_flush = len(self.rows) >= self.batch_size
+        if should_flush:
+            self.flush()
+
+    def add_result(self, prediction_info):
+        """Result callback for process_flood_prediction"""
+        coords = parse_tile_name(prediction_info['image_name'])
+        if coords is None:
+            return
+        prediction = prediction_info.get('prediction')
+        self.add_tile(
+            coords['z'], coords['x'], coords['y'],
+            prediction_info['water_percentage'] / 100.0,
+            histogram=None if prediction is None else class_histogram(prediction),
+            prefiltered=prediction_info.get('prefiltered', False)
+        )
+
+    def flush(self):
+        """Write buffered observations and advance the latest-value index"""
+        with self._lock:
+            rows, self.rows = self.rows, []
+        if not rows:
+            return
+        with closing(open_history(self.path)) as conn, conn:
+            conn.executemany(
+                """INSERT OR REPLACE INTO observations
+                   (z, x, y, observed_at, run_id, water_fraction, prefiltered, histogram)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                [(z, x, y, self.observed_at, self.run_id, fraction, prefiltered, blob)
+                 for z, x, y, fraction, prefiltered, blob in rows]
+            )
+            conn.executemany(
+                UPSERT_LATEST,
+                [(z, x, y, self.state_name, self.observed_at, fraction) for z, x, y, fraction, _, _ in rows]
+            )
+        self.total += len(rows)
+
+    def close(self):
+        """Flush remaining rows and mark the run complete"""
+        self.flush()
+        with closing(open_history(self.path)) as conn, conn:
+            conn.execute("UPDATE history_runs SET total_tiles = ? WHERE run_id = ?", (self.total, self.run_id))
+        return self.run_id
+
+def tile_history(tiles, path=HISTORY_PATH, since=None, until=None):
+    """Observations of the given (z, x, y) tiles, oldest first, keyed by tile
+
+    The tiles are joined against the clustered (z, x, y, observed_at) key, so
+    the cost depends on the number of rows returned, not the size of the store.
+    """
+    tiles = list(tiles)
+    history = {tuple(tile): [] for tile in tiles}
+    if not tiles:
+        return history
+
+    conditions, params = [], []
+    if since is not None:
+        conditions.append("o.observed_at >= ?")
+        params.append(since)
+    if until is not None:
+        conditions.append("o.observed_at <= ?")
+        params.append(until)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    with closing(open_history(path)) as conn:
+        conn.execute("CREATE TEMP TABLE wanted (z INTEGER, x INTEGER, y INTEGER, PRIMARY KEY (z, x, y)) WITHOUT ROWID")
+        conn.executemany("INSERT OR IGNORE INTO wanted VALUES (?, ?, ?)", tiles)
+        rows = conn.execute(
+            f"""SELECT o.* FROM wanted w
+                JOIN observations o ON o.z = w.z AND o.x = w.x AND o.y = w.y
+                {where} ORDER BY o.z, o.x, o.y, o.observed_at""",
+            params
+        ).fetchall()
+
+    for row in rows:
+        entry = dict(row)
+        entry['histogram'] = decode_histogram(entry['histogram'])
+        history[(row['z'], row['x'], row['y'])].append(entry)
+    return history
+
+def rising_tiles(min_increase, state_name=None, path=HISTORY_PATH, limit=None):
+    """Tiles whose water fraction rose by at least min_increase since their previous observation"""
+    where, params = "delta >= ?", [min_increase]
+    if state_name is not None:
+        where += " AND state_name = ?"
+        params.append(state_name)
+    with closing(open_history(path)) as conn:
+        rows = conn.execute(
+            f"SELECT * FROM latest WHERE {where} ORDER BY delta DESC LIMIT ?",
+            params + [-1 if limit is None else limit]
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+def list_history_runs(state_name=None, path=HISTORY_PATH):
+    """Recorded runs, newest first"""
+    where, params = "", []
+    if state_name is not None:
+        where, params = "WHERE state_name = ?", [state_name]
+    with closing(open_history(path)) as conn:
+        rows = conn.execute(
+            f"SELECT * FROM history_runs {where} ORDER BY observed_at DESC",
+            params
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+def latest_fractions(state_name, path=HISTORY_PATH):
+    """Most recent water fraction of every tile observed for a state, keyed by (z, x, y)"""
+    with closing(open_history(path)) as conn:
+        rows = conn.execute(
+            "SELECT z, x, y, water_fraction FROM latest WHERE state_name = ?",
+            (state_name,)
+        ).fetchall()
+    return {(row['z'], row['x'], row['y']): row['water_fraction'] for row in rows}
@@ -0,0 +1,106 @@
+import numpy as np
+from components.geo_map import parse_tile_name
+
+def group_tiles_by_position(image_files):
+    """Group tile files by their (z, x, y) position, returning unparsable names separately
+
+    The capture grid can map two grid cells onto the same web-mercator tile,
+    so each position holds a list of file names.
+    """
+    positions = {}
+    unplaced = []
+    for image_file in image_files:
+        coords = parse_tile_name(image_file)
+        if coords is None:
+            unplaced.append(image_file)
+            continue
+        positions.setdefault((coords['z'], coords['x'], coords['y']), []).append(image_file)
+    return positions, unplaced
+
+def plan_mosaic(image_files, chip_tiles=2, margin=32):
+    """Plan mosaic inference, returning (positions, unplaced files, chip origins, isolated positions)
+
+    A chip whose footprint holds a single tile would only pad that tile with
+    black, so such tiles are listed as isolated and segmented on their own.
+    Nothing else touches an isolated tile, since all its neighbours lie inside
+    its chip's footprint.
+    """
+    positions, unplaced = group_tiles_by_position(image_files)
+    chips, isolated = [], []
+    for origin in build_chips(positions, chip_tiles):
+        footprint = [p for p in chip_footprint(origin, chip_tiles, margin) if p in positions]
+        if len(footprint) > 1:
+            chips.append(origin)
+        else:
+            isolated.extend(footprint)
+    return positions, unplaced, chips, isolated
+
+def build_chips(positions, chip_tiles=2):
+    """Group tile positions into chips of chip_tiles x chip_tiles neighbouring tiles
+
+    Returns chip origins (z, x0, y0) in row-major order, so tiles finish
+    roughly one chip row after they are first touched.
+    """
+    origins = {
+        (z, (x // chip_tiles) * chip_tiles, (y // chip_tiles) * chip_tiles)
+        for z, x, y in positions
+    }
+    return sorted(origins, key=lambda origin: (origin[0], origin[2], origin[1]))
+
+def chip_footprint(origin, chip_tiles, margin):
+    """Tile positions whose pixels fall inside a chip, including its margin ring"""
+    z, x0, y0 = origin
+    reach = 1 if margin > 0 else 0
+    return [
+        (z, x, y)
+        for y in range(y0 - reach, y0 + chip_tiles + reach)
+        for x in range(x0 - reach, x0 + chip_tiles + reach)
+    ]
+
+def tile_window(origin, position, chip_tiles, margin, tile_size):
+    """Overlap of a tile with a chip as (chip_slice, tile_slice) pairs, or None"""
+    _, x0, y0 = origin
+    _, x, y = position
+    chip_extent = chip_tiles * tile_size + 2 * margin
+
+    # Tile's top-left corner in chip pixel coordinates
+    left = (x - x0) * tile_size + margin
+    top = (y - y0) * tile_size + margin
+
+    chip_x0, chip_x1 = max(left, 0), min(left + tile_size, chip_extent)
+    chip_y0, chip_y1 = max(top, 0), min(top + tile_size, chip_extent)
+    if chip_x0 >= chip_x1 or chip_y0 >= chip_y1:
+        return None
+
+    chip_slice = (slice(chip_y0, chip_y1), slice(chip_x0, chip_x1))
+    tile_slice = (slice(chip_y0 - top, chip_y1 - top), slice(chip_x0 - left, chip_x1 - left))
+    return chip_slice, tile_slice
+
+def feather_weights(height, width, ramp):
+    """Blending weights that taper linearly to the edges of a chip over `ramp` pixels"""
+    if ramp <= 0:
+        return np.ones((height, width), dtype=np.float32)
+
+    def ramp_1d(length):
+        idx = np.arange(length, dtype=np.float32)
+        distance = np.minimum(idx, length - 1 - idx) + 0.5
+        return np.clip(distance / ramp, 1e-3, 1.0)
+
+    return np.outer(ramp_1d(height), ramp_1d(width)).astype(np.float32)
+
+def assemble_chip(origin, chip_tiles, margin, tile_size, tile_arrays):
+    """Paste neighbouring tile arrays into one chip at native resolution
+
+    Positions missing from tile_arrays are left black.
+    """
+    extent = chip_tiles * tile_size + 2 * margin
+    chip = np.zeros((extent, extent, 3), dtype=np.uint8)
+    for position in chip_footprint(origin, chip_tiles, margin):
+        if position not in tile_arrays:
+            continue
+        window = tile_window(origin, position, chip_tiles, margin, tile_size)
+        if window is None:
+            continue
+        chip_slice, tile_slice = window
+        chip[chip_slice] = tile_arrays[position][tile_slice]
+    return chip
@@ -0,0 +1,69 @@
+import os
+import inspect
+from types import SimpleNamespace
+import numpy as np
+import torch
+
+# Exported graphs are cached next to the other model artefacts
+ONNX_MODEL_DIR = "src/model"
+# Graphs cached by earlier exports had batch 1 baked in, so the dynamic-batch export uses a new name
+ONNX_MODEL_PATH = os.path.join(ONNX_MODEL_DIR, "segformer-b2-loveda-dynamic.onnx")
+
+def export_segformer_onnx(model, onnx_path=ONNX_MODEL_PATH, image_size=(512, 512)):
+    """Export a Segformer model to ONNX once, reusing the cached graph afterwards"""
+    if os.path.exists(onnx_path):
+        return onnx_path
+
+    os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
+    model = model.to("cpu").eval()
+    dummy_input = torch.randn(1, 3, image_size[0], image_size[1])
+
+    # The dynamo exporter ignores dynamic_axes and fixes the batch of the dummy input,
+    # so the TorchScript exporter is requested where torch offers the choice
+    export_options = {'dynamo': False} if 'dynamo' in inspect.signature(torch.onnx.export).parameters else {}
+
+    # Write to a temporary file first so an interrupted export never leaves a broken cache
+    tmp_path = f"{onnx_path}.tmp"
+    torch.onnx.export(
+        model,
+        (dummy_input,),
+        tmp_path,
+        input_names=["pixel_values"],
+        output_names=["logits"],
+        dynamic_axes={
+            "pixel_values": {0: "batch", 2: "height", 3: "width"},
+            "logits": {0: "batch", 2: "out_height", 3: "out_width"}
+        },
+        opset_version=17,
+        **export_options
+    )
+    os.replace(tmp_path, onnx_path)
+    return onnx_path
+
+def create_onnx_session(onnx_path=ONNX_MODEL_PATH, num_threads=None):
+    """Create an ONNX Runtime CPU session with all graph optimisations enabled"""
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if num_threads:
+        options.intra_op_num_threads = num_threads
+
+    return ort.InferenceSession(onnx_path, sess_options=options, providers=["CPUExecutionProvider"])
+
+class OnnxSegformer:
+    """Wraps an ONNX Runtime session so it can be called like SegformerForSemanticSegmentation"""
+
+    def __init__(self, session):
+        self.session = session
+
+    def __call__(self, pixel_values, **kwargs):
+        pixel_values = pixel_values.detach().cpu().numpy().astype(np.float32)
+        logits = self.session.run(["logits"], {"pixel_values": pixel_values})[0]
+        return SimpleNamespace(logits=torch.from_numpy(logits))
+
+    def eval(self):
+        return self
+
+    def to(self, *args, **kwargs):
+        return self
@@ -0,0 +1,97 @@
+import os
+import random
+import cv2
+import numpy as np
+from components.tile_io import load_tile_array
+
+# Tiles are scored on small thumbnails, which is plenty for colour statistics
+PREFILTER_SIZE = 64
+
+def load_tile_thumbnails(image_paths, size=PREFILTER_SIZE):
+    """Decode tiles at reduced size into a (N, size, size, 3) uint8 batch"""
+    batch = np.zeros((len(image_paths), size, size, 3), dtype=np.uint8)
+    valid = np.zeros(len(image_paths), dtype=bool)
+
+    for idx, image_path in enumerate(image_paths):
+        try:
+            # JPEG tiles are decoded at a quarter scale straight into the batch row
+            thumbnail = load_tile_array(image_path, out=batch[idx], reduce=4)
+            if thumbnail.shape[:2] != (size, size):
+                batch[idx] = cv2.resize(thumbnail, (size, size), interpolation=cv2.INTER_AREA)
+            valid[idx] = True
+        except Exception as e:
+            print(f"Error loading thumbnail {image_path}: {e}")
+
+    return batch, valid
+
+def calculate_water_scores(batch):
+    """Estimate the fraction of water-like pixels for each tile in a batch
+
+    A pixel counts as water-like when blue exceeds both red and green and it
+    is not bright, or when it is very dark without leaning green. Green
+    dominance is what separates forest and cropland from water in RGB, so
+    vegetation (e.g. (40, 60, 35) or (90, 110, 70)) never scores.
+    """
+    rgb = batch.astype(np.float32)
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    brightness = rgb.mean(axis=-1)
+
+    # Normalised blue dominance over the stronger of red and green, an RGB proxy for NDWI
+    red_green = np.maximum(r, g)
+    blue_dominance = (b - red_green) / (b + red_green + 1.0)
+    blue_water = (blue_dominance > 0.0) & (brightness < 150)
+    # Deep or shadowed water is nearly black; dark canopy still leans green
+    dark_water = (brightness < 35) & (g <= b + 5)
+
+    return (blue_water | dark_water).mean(axis=(1, 2))
+
+def prefilter_tiles(image_files, input_dir, threshold=0.02, batch_size=64, audit_fraction=0.05, seed=0):
+    """Find tiles that are confidently dry and can skip segmentation
+
+    threshold is the fraction of water-like thumbnail pixels below which a tile
+    is skipped; 0.02 is about 80 of the 4096 pixels, roughly one pond or river
+    bend. It is meant to be calibrated per region from the audit: raise it
+    while summarize_prefilter reports a false-negative rate under the accepted
+    target (e.g. 1%), lower it when audited tiles turn out to hold water.
+    Turbid, sediment-laden flood water is brown rather than blue and can score
+    low, so audit results from monsoon imagery matter most.
+
+    A random audit_fraction of the skipped tiles is returned separately so the
+    caller can still segment them and measure the pre-filter's false negatives.
+    Returns (skipped_files, audit_files, scores).
+    """
+    scores = {}
+    for start in range(0, len(image_files), batch_size):
+        batch_files = image_files[start:start + batch_size]
+        batch, valid = load_tile_thumbnails([os.path.join(input_dir, f) for f in batch_files])
+        batch_scores = calculate_water_scores(batch)
+        for image_file, score, is_valid in zip(batch_files, batch_scores, valid):
+            # Tiles that fail to decode are left for the full model to handle
+            if is_valid:
+                scores[image_file] = float(score)
+
+    candidates = [f for f in image_files if f in scores and scores[f] < threshold]
+
+    audit_count = int(round(len(candidates) * audit_fraction))
+    audit_files = set(random.Random(seed).sample(candidates, audit_count)) if audit_count else set()
+    skipped_files = set(candidates) - audit_files
+
+    return skipped_files, audit_files, scores
+
+def summarize_prefilter(total_images, skipped_files, audit_results, threshold, false_negative_water=5.0):
+    """Report skip rate and the audited false-negative rate of the pre-filter
+
+    audit_results maps each audited tile to the water percentage the full model found.
+    """
+    false_negatives = [name for name, water in audit_results.items() if water >= false_negative_water]
+    audited = len(audit_results)
+
+    return {
+        'threshold': threshold,
+        'skipped': len(skipped_files),
+        'skip_rate': len(skipped_files) / total_images * 100 if total_images > 0 else 0,
+        'audited': audited,
+        'false_negatives': len(false_negatives),
+        'false_negative_rate': len(false_negatives) / audited * 100 if audited > 0 else 0,
+        'false_negative_tiles': false_negatives
+    }
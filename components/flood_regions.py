@@ -0,0 +1,155 @@
+import math
+import cv2
+import numpy as np
+from components.geo_map import parse_tile_name, num2deg
+
+WATER_CLASS = 4
+# Ground resolution of one pixel at the equator for zoom 0 (metres)
+EQUATOR_RESOLUTION = 156543.03392
+
+def pixel_area_km2(z, y, tile_size=256):
+    """Ground area of one pixel of tile row y at zoom z"""
+    lat, _ = num2deg(0, y + 0.5, z)
+    resolution = EQUATOR_RESOLUTION * math.cos(math.radians(lat)) / (2 ** z) * (256 / tile_size)
+    return resolution * resolution / 1e6
+
+class FloodRegionTracker:
+    """Connected flood regions across the tile grid, maintained with union-find
+
+    Each tile's water mask is labelled locally (8-connectivity). Its components
+    become union-find nodes, merged with neighbouring tiles' components where
+    water pixels meet across a shared edge. Only the edge labels of each tile
+    are kept, and only for edges that contain water, so full masks are never
+    retained and each tile costs near-constant time.
+    """
+
+    def __init__(self, tile_size=256):
+        self.tile_size = tile_size
+        self.parent = []
+        self.size = []
+        self.pixels = []
+        self.area_km2 = []
+        self.bbox = []   # global pixel bbox (min_col, min_row, max_col, max_row)
+        self.tiles = []
+        self.zoom = None
+        # (x, y) -> {'top'|'bottom'|'left'|'right': (edge_labels, first_node_id)}
+        self.edges = {}
+
+    def find(self, node):
+        while self.parent[node] != node:
+            self.parent[node] = self.parent[self.parent[node]]
+            node = self.parent[node]
+        return node
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        self.pixels[a] += self.pixels[b]
+        self.area_km2[a] += self.area_km2[b]
+        self.bbox[a] = (
+            min(self.bbox[a][0], self.bbox[b][0]), min(self.bbox[a][1], self.bbox[b][1]),
+            max(self.bbox[a][2], self.bbox[b][2]), max(self.bbox[a][3], self.bbox[b][3])
+        )
+        # Merge the smaller membership set into the larger one
+        if len(self.tiles[a]) < len(self.tiles[b]):
+            self.tiles[a], self.tiles[b] = self.tiles[b], self.tiles[a]
+        self.tiles[a] |= self.tiles[b]
+        self.tiles[b] = None
+
+    def add_mask(self, image_name, z, x, y, class_map):
+        """Label one tile's water and join it to already-seen neighbouring tiles"""
+        if self.zoom is None:
+            self.zoom = z
+        elif z != self.zoom:
+            raise ValueError(f"Tile {image_name} is at zoom {z}, tracker is at zoom {self.zoom}")
+
+        water = (class_map == WATER_CLASS).astype(np.uint8)
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(water, connectivity=8)
+        if count <= 1:
+            return
+
+        first_node = len(self.parent)
+        pixel_area = pixel_area_km2(z, y, self.tile_size)
+        col0, row0 = x * self.tile_size, y * self.tile_size
+        for label in range(1, count):
+            left, top, width, height, area = stats[label]
+            node = first_node + label - 1
+            self.parent.append(node)
+            self.size.append(1)
+            self.pixels.append(int(area))
+            self.area_km2.append(area * pixel_area)
+            self.bbox.append((col0 + left, row0 + top, col0 + left + width - 1, row0 + top + height - 1))
+            self.tiles.append({image_name})
+
+        tile_edges = {
+            'top': labels[0, :], 'bottom': labels[-1, :],
+            'left': labels[:, 0], 'right': labels[:, -1]
+        }
+        self.edges[(x, y)] = {
+            side: (edge.astype(np.uint16), first_node)
+            for side, edge in tile_edges.items() if edge.any()
+        }
+
+        neighbours = [
+            ('top', (x, y - 1), 'bottom'), ('bottom', (x, y + 1), 'top'),
+            ('left', (x - 1, y), 'right'), ('right', (x + 1, y), 'left')
+        ]
+        for side, neighbour, opposite in neighbours:
+            own = self.edges[(x, y)].get(side)
+            other = self.edges.get(neighbour, {}).get(opposite)
+            if own is None or other is None:
+                continue
+            self._join_edges(own, other)
+
+    def _join_edges(self, own, other):
+        """Union components whose water pixels touch across a shared edge (8-connected)"""
+        own_labels, own_first = own
+        other_labels, other_first = other
+        pairs = []
+        for shift in (-1, 0, 1):
+            a = own_labels[max(shift, 0):len(own_labels) + min(shift, 0)]
+            b = other_labels[max(-shift, 0):len(other_labels) + min(-shift, 0)]
+            touching = (a > 0) & (b > 0)
+            if touching.any():
+                pairs.append(np.stack([a[touching], b[touching]], axis=1))
+        if not pairs:
+            return
+        for a, b in np.unique(np.concatenate(pairs), axis=0):
+            self.union(own_first + int(a) - 1, other_first + int(b) - 1)
+
+    def add_result(self, prediction_info):
+        """Result callback for process_flood_prediction"""
+        coords = parse_tile_name(prediction_info['image_name'])
+        if coords is None or prediction_info.get('prediction') is None:
+            return
+        self.add_mask(prediction_info['image_name'], coords['z'], coords['x'], coords['y'], prediction_info['prediction'])
+
+    def regions(self, limit=None, min_area_km2=0.0):
+        """Connected flood regions, largest first, with area, lon/lat bbox and member tiles"""
+        roots = [node for node in range(len(self.parent)) if self.parent[node] == node]
+        roots.sort(key=lambda node: self.area_km2[node], reverse=True)
+
+        results = []
+        scale = self.tile_size
+        for node in roots:
+            if self.area_km2[node] < min_area_km2:
+                break
+            min_col, min_row, max_col, max_row = self.bbox[node]
+            north, west = num2deg(min_col / scale, min_row / scale, self.zoom)
+            south, east = num2deg((max_col + 1) / scale, (max_row + 1) / scale, self.zoom)
+            results.append({
+                'region_id': node,
+                'area_km2': self.area_km2[node],
+                'water_pixels': self.pixels[node],
+                'bbox': (west, south, east, north),
+                'tile_count': len(self.tiles[node]),
+                'tiles': sorted(self.tiles[node])
+            })
+            if limit is not None and len(results) >= limit:
+                break
+        return results
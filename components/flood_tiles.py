@@ -0,0 +1,245 @@
+import os
+import re
+import shutil
+import threading
+import numpy as np
+import folium
+from PIL import Image
+from functools import partial
+from urllib.parse import urlsplit, unquote
+from concurrent.futures import ThreadPoolExecutor, wait
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from components.flood import COLORS, NUM_CLASSES
+from components.geo_map import parse_tile_name
+from components.workspace import OUTPUT_ROOT
+
+PYRAMID_DIRNAME = "pyramid"
+# Served from the output root so pyramids in session workspaces are reachable too
+TILE_SERVER_ROOT = OUTPUT_ROOT
+TILE_SERVER_PORT = 8765
+# URL the browser fetches overlay tiles from. The server only listens on 127.0.0.1,
+# so a browser on another host (or outside a container) needs this port forwarded
+# or proxied, with RESGEOAI_TILE_SERVER_URL set to the address it is reachable at.
+TILE_SERVER_URL_ENV = "RESGEOAI_TILE_SERVER_URL"
+WATER_CLASS = 4
+
+# Class maps keep every class index, but only water is drawn on the overlay
+PALETTE = COLORS.astype(np.uint8).flatten().tolist()
+ALPHA = bytes(255 if idx == WATER_CLASS else 0 for idx in range(NUM_CLASSES))
+
+def write_class_tile(path, class_map):
+    """Write a class map as a palette PNG where only water is opaque"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    image = Image.fromarray(class_map.astype(np.uint8))
+    image.putpalette(PALETTE)
+    tmp_path = f"{path}.tmp"
+    image.save(tmp_path, format='PNG', transparency=ALPHA, optimize=False)
+    os.replace(tmp_path, path)
+
+def read_class_tile(path, tile_size=None):
+    """Read a class map tile, or None if it has not been written; tile_size resizes it if given"""
+    if not os.path.exists(path):
+        return None
+    with Image.open(path) as image:
+        class_map = np.asarray(image)
+    if tile_size is not None and class_map.shape != (tile_size, tile_size):
+        class_map = np.asarray(Image.fromarray(class_map).resize((tile_size, tile_size), Image.NEAREST))
+    return class_map
+
+def downsample_children(children, tile_size):
+    """Merge four child class maps into their parent tile
+
+    Nearest-neighbour decimation keeps class labels intact; any water in a
+    2x2 block is kept so narrow channels survive at low zooms.
+    """
+    block = np.zeros((tile_size * 2, tile_size * 2), dtype=np.uint8)
+    for (dx, dy), child in children.items():
+        if child is not None:
+            block[dy * tile_size:(dy + 1) * tile_size, dx * tile_size:(dx + 1) * tile_size] = child
+
+    parent = block[::2, ::2].copy()
+    water = (block.reshape(tile_size, 2, tile_size, 2) == WATER_CLASS).any(axis=(1, 3))
+    parent[water] = WATER_CLASS
+    return parent
+
+class FloodPyramid:
+    """Multi-zoom overview pyramid of flood class maps in XYZ layout
+
+    Base tiles are written in the background as predictions land. Every
+    flush_every tiles the parents of changed tiles are rebuilt level by level,
+    each level in parallel, so overviews stay current during a run. Rebuilds
+    run one after another on a flush thread, so result callbacks never wait
+    for them; only close() does.
+    """
+
+    def __init__(self, flooded_dir, min_zoom=5, tile_size=256, flush_every=256, num_threads=4, reset=True):
+        self.root = os.path.join(flooded_dir, PYRAMID_DIRNAME)
+        if reset and os.path.exists(self.root):
+            shutil.rmtree(self.root)
+        os.makedirs(self.root, exist_ok=True)
+
+        self.min_zoom = min_zoom
+        self.tile_size = tile_size
+        self.flush_every = flush_every
+        self.max_zoom = None
+        self.executor = ThreadPoolExecutor(max_workers=num_threads)
+        # A single thread keeps rebuilds in order; it waits on the worker threads, so it is kept apart from them
+        self.flusher = ThreadPoolExecutor(max_workers=1)
+        self.pending = []
+        self.dirty = set()
+        self.since_flush = 0
+        self._lock = threading.Lock()
+
+    def tile_path(self, z, x, y):
+        return os.path.join(self.root, str(z), str(x), f"{y}.png")
+
+    def add_mask(self, z, x, y, class_map):
+        """Queue a base-level class map and mark its parent for rebuilding"""
+        if class_map.shape != (self.tile_size, self.tile_size):
+            class_map = np.asarray(
+                Image.fromarray(class_map).resize((self.tile_size, self.tile_size), Image.NEAREST)
+            )
+        with self._lock:
+            self.max_zoom = z if self.max_zoom is None else max(self.max_zoom, z)
+            self.pending.append(self.executor.submit(write_class_tile, self.tile_path(z, x, y), class_map))
+            if z > self.min_zoom:
+                self.dirty.add((z - 1, x // 2, y // 2))
+            self.since_flush += 1
+            should_flush = self.since_flush >= self.flush_every
+
+        if should_flush:
+            self.flush(block=False)
+
+    def add_result(self, prediction_info):
+        """Result callback for process_flood_prediction"""
+        coords = parse_tile_name(prediction_info['image_name'])
+        if coords is None or prediction_info.get('prediction') is None:
+            return
+        self.add_mask(coords['z'], coords['x'], coords['y'], prediction_info['prediction'])
+
+    def _build_parent(self, z, x, y):
+        children = {
+            (dx, dy): read_class_tile(self.tile_path(z + 1, 2 * x + dx, 2 * y + dy), self.tile_size)
+            for dx in (0, 1) for dy in (0, 1)
+        }
+        write_class_tile(self.tile_path(z, x, y), downsample_children(children, self.tile_size))
+
+    def flush(self, block=True):
+        """Rebuild all dirty overview tiles once pending base tiles are written
+
+        The rebuild is queued on the flush thread; block waits for it (and any
+        earlier rebuilds) to finish.
+        """
+        with self._lock:
+            pending, self.pending = self.pending, []
+            dirty, self.dirty = self.dirty, set()
+            self.since_flush = 0
+            # Queued under the lock so rebuilds run in the order their tiles were taken
+            future = self.flusher.submit(self._rebuild, pending, dirty)
+        if block:
+            future.result()
+
+    def _rebuild(self, pending, dirty):
+        try:
+            wait(pending)
+            # Finer levels first, since each parent reads its freshly rebuilt children
+            while dirty:
+                level = max(z for z, _, _ in dirty)
+                current = {tile for tile in dirty if tile[0] == level}
+                dirty -= current
+                wait([self.executor.submit(self._build_parent, *tile) for tile in current])
+                dirty |= {(z - 1, x // 2, y // 2) for z, x, y in current if z > self.min_zoom}
+        except Exception as e:
+            print(f"Error rebuilding flood pyramid: {e}")
+
+    def close(self):
+        """Flush remaining work and stop the worker threads"""
+        self.flush()
+        self.flusher.shutdown(wait=True)
+        self.executor.shutdown(wait=True)
+
+def pyramid_zoom_range(flooded_dir):
+    """(min_zoom, max_zoom) of a built pyramid, or None if there is none"""
+    root = os.path.join(flooded_dir, PYRAMID_DIRNAME)
+    if not os.path.exists(root):
+        return None
+    zooms = [int(name) for name in os.listdir(root) if name.isdigit()]
+    return (min(zooms), max(zooms)) if zooms else None
+
+# Only pyramid tiles are served; path segments may not start with a dot, so '..' cannot escape the root
+PYRAMID_TILE_PATH = re.compile(
+    rf"^/(?:[^/.][^/]*/)*{PYRAMID_DIRNAME}/\d+/\d+/\d+\.png$"
+)
+
+def is_pyramid_tile_path(url_path):
+    """Whether a request path (with any query string) names a pyramid tile"""
+    return bool(PYRAMID_TILE_PATH.match(unquote(urlsplit(url_path).path)))
+
+class QuietTileHandler(SimpleHTTPRequestHandler):
+    """Static handler serving only pyramid PNG tiles, without listings or per-request logging
+
+    The root also holds session workspaces with captured imagery, manifests and
+    exports, so anything but */pyramid/{z}/{x}/{y}.png gets a 404.
+    """
+
+    def do_GET(self):
+        if not is_pyramid_tile_path(self.path):
+            self.send_error(404)
+            return
+        super().do_GET()
+
+    def do_HEAD(self):
+        if not is_pyramid_tile_path(self.path):
+            self.send_error(404)
+            return
+        super().do_HEAD()
+
+    def list_directory(self, path):
+        self.send_error(404)
+        return None
+
+    def end_headers(self):
+        self.send_header('Cache-Control', 'no-cache')
+        super().end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+_tile_server = None
+
+def tile_server_url(port=TILE_SERVER_PORT):
+    """Public base URL of the tile server as seen by the browser"""
+    return os.environ.get(TILE_SERVER_URL_ENV, '').rstrip('/') or f"http://localhost:{port}"
+
+def start_tile_server(root=TILE_SERVER_ROOT, port=TILE_SERVER_PORT):
+    """Start (once per process) a local XYZ server for flood pyramids under root, returning its public URL"""
+    global _tile_server
+    if _tile_server is None:
+        os.makedirs(root, exist_ok=True)
+        handler = partial(QuietTileHandler, directory=os.path.abspath(root))
+        try:
+            _tile_server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        except OSError as e:
+            # Another process (e.g. a second Streamlit worker) already serves this port
+            print(f"Flood tile server not started: {e}")
+            return tile_server_url(port)
+        threading.Thread(target=_tile_server.serve_forever, daemon=True).start()
+    return tile_server_url(port)
+
+def flood_tile_layer(flooded_dir, zoom_range, port=TILE_SERVER_PORT):
+    """Folium TileLayer showing the flood pyramid under flooded_dir from the local tile server"""
+    base_url = start_tile_server(port=port)
+    min_zoom, max_zoom = zoom_range
+    url_path = os.path.relpath(flooded_dir, TILE_SERVER_ROOT).replace(os.sep, '/')
+    return folium.TileLayer(
+        tiles=f"{base_url}/{url_path}/{PYRAMID_DIRNAME}/{{z}}/{{x}}/{{y}}.png",
+        attr='Res Geo AI flood masks',
+        name='Flood Masks',
+        overlay=True,
+        control=True,
+        opacity=0.7,
+        min_zoom=0,
+        min_native_zoom=min_zoom,
+        max_native_zoom=max_zoom,
+        max_zoom=max(max_zoom, 19)
+    )
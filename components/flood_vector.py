@@ -0,0 +1,136 @@
+import os
+import json
+import math
+import numpy as np
+import geopandas as gpd
+from rasterio import features
+from shapely.geometry import shape, mapping
+from shapely.ops import unary_union, transform as transform_geometry
+from components.flood_export import iter_base_tiles, tile_grid_transform
+from components.flood_tiles import read_class_tile, WATER_CLASS
+
+EARTH_RADIUS = 6378137.0
+POLYGONS_NAME = "flood_polygons.geojson"
+
+def mercator_to_lonlat(x, y):
+    """Convert EPSG:3857 metres to lon/lat degrees (works on scalars and arrays)"""
+    lon = np.degrees(np.asarray(x) / EARTH_RADIUS)
+    lat = np.degrees(2 * np.arctan(np.exp(np.asarray(y) / EARTH_RADIUS)) - math.pi / 2)
+    return lon, lat
+
+def polygon_area_km2(polygon):
+    """Ground area of an EPSG:3857 polygon, correcting mercator scale at its centroid latitude"""
+    _, lat = mercator_to_lonlat(0.0, polygon.centroid.y)
+    return polygon.area * math.cos(math.radians(float(lat))) ** 2 / 1e6
+
+def polygonize_water(class_map, transform):
+    """Water polygons of a class map in the CRS of the given transform"""
+    water = (class_map == WATER_CLASS).astype(np.uint8)
+    if not water.any():
+        return []
+    return [
+        shape(geometry)
+        for geometry, _ in features.shapes(water, mask=water.astype(bool), transform=transform, connectivity=8)
+    ]
+
+def iter_flood_polygons(tiles, block_tiles=16, tile_size=256, simplify_pixels=1.0, min_area_km2=0.0):
+    """Yield dissolved, simplified water polygons (EPSG:3857) from per-tile masks
+
+    Tiles are grouped into block_tiles x block_tiles blocks, and each block is
+    mosaicked and polygonised on its own, so seams inside a block dissolve for
+    free. Polygons away from the block edge are final and yielded right away.
+    Only polygons touching a block edge are kept and dissolved at the end, so
+    memory is bounded by one block plus the seam polygons.
+    tiles is a list of (z, x, y, load_mask) at a single zoom.
+    """
+    blocks = {}
+    for z, x, y, load_mask in tiles:
+        blocks.setdefault((z, x // block_tiles, y // block_tiles), []).append((x, y, load_mask))
+
+    edge_polygons = []
+    for (zoom, bx, by), block in sorted(blocks.items()):
+        x0, y0 = bx * block_tiles, by * block_tiles
+        extent = block_tiles * tile_size
+        mosaic = np.zeros((extent, extent), dtype=np.uint8)
+        for x, y, load_mask in block:
+            mask = load_mask()
+            if mask is not None:
+                mosaic[(y - y0) * tile_size:(y - y0 + 1) * tile_size, (x - x0) * tile_size:(x - x0 + 1) * tile_size] = mask
+
+        transform = tile_grid_transform(zoom, x0, y0, tile_size)
+        pixel = transform.a
+        tolerance = pixel * simplify_pixels
+        left, top = transform.c, transform.f
+        right, bottom = left + extent * pixel, top - extent * pixel
+
+        for polygon in polygonize_water(mosaic, transform):
+            minx, miny, maxx, maxy = polygon.bounds
+            touches_edge = (
+                minx <= left + pixel / 2 or maxx >= right - pixel / 2
+                or miny <= bottom + pixel / 2 or maxy >= top - pixel / 2
+            )
+            if touches_edge:
+                edge_polygons.append(polygon)
+                continue
+            polygon = polygon.simplify(tolerance, preserve_topology=True)
+            if polygon_area_km2(polygon) >= min_area_km2:
+                yield polygon
+
+    if edge_polygons:
+        # All tiles share one zoom, so the last block's tolerance applies to the seam polygons too
+        merged = unary_union(edge_polygons)
+        for polygon in getattr(merged, 'geoms', [merged]):
+            polygon = polygon.simplify(tolerance, preserve_topology=True)
+            if polygon_area_km2(polygon) >= min_area_km2:
+                yield polygon
+
+def to_lonlat(geometry, precision=6):
+    """Reproject an EPSG:3857 geometry to lon/lat, rounding coordinates for compact output"""
+    def project(x, y, z=None):
+        lon, lat = mercator_to_lonlat(x, y)
+        return np.round(lon, precision), np.round(lat, precision)
+    return transform_geometry(project, geometry)
+
+def export_flood_polygons(flooded_dir, output_path=None, block_tiles=16, tile_size=256, simplify_pixels=1.0,
+                          min_area_km2=0.0):
+    """Vectorise a state's flood pyramid base level into dissolved flood extents
+
+    Writes GeoJSON (streamed feature by feature) or GeoParquet when output_path
+    ends in .parquet. Each feature carries its area in km². Returns
+    (output_path, feature_count), or (None, 0) if there are no masks.
+    """
+    output_path = output_path or os.path.join(flooded_dir, POLYGONS_NAME)
+    tiles = [
+        (z, x, y, lambda path=path: read_class_tile(path, tile_size))
+        for z, x, y, path in iter_base_tiles(flooded_dir)
+    ]
+    if not tiles:
+        return None, 0
+
+    polygons = iter_flood_polygons(tiles, block_tiles, tile_size, simplify_pixels, min_area_km2)
+
+    if output_path.endswith('.parquet'):
+        records = [(polygon_area_km2(p), to_lonlat(p)) for p in polygons]
+        gdf = gpd.GeoDataFrame(
+            {'id': list(range(len(records))), 'area_km2': [round(a, 4) for a, _ in records]},
+            geometry=[g for _, g in records],
+            crs='EPSG:4326'
+        )
+        gdf.to_parquet(output_path)
+        return output_path, len(records)
+
+    count = 0
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write('{"type":"FeatureCollection","features":[')
+        for polygon in polygons:
+            feature = {
+                'type': 'Feature',
+                'properties': {'id': count, 'area_km2': round(polygon_area_km2(polygon), 4)},
+                'geometry': mapping(to_lonlat(polygon))
+            }
+            f.write((',' if count else '') + json.dumps(feature, separators=(',', ':')))
+            count += 1
+        f.write(']}')
+    os.replace(tmp_path, output_path)
+    return output_path, count
@@ -0,0 +1,82 @@
+import os
+import queue
+import shutil
+import threading
+
+def link_or_copy(source_path, target_path):
+    """Hard-link a file into place, falling back to a byte copy across filesystems"""
+    if os.path.exists(target_path):
+        os.remove(target_path)
+    try:
+        os.link(source_path, target_path)
+    except OSError:
+        shutil.copyfile(source_path, target_path)
+
+class TileOutputWriter:
+    """Persists flooded-tile outputs on background threads through a bounded queue
+
+    The queue bound keeps memory flat if the disk falls behind; callers only
+    block once max_pending writes are outstanding. Errors are collected and
+    returned by close() instead of being raised on the inference thread.
+    Used as a context manager, the writer is closed even when the run is
+    cancelled or fails, so no writer threads are left behind.
+    """
+
+    def __init__(self, max_pending=64, num_threads=1):
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.errors = []
+        self.written = 0
+        self.closed = False
+        self._lock = threading.Lock()
+        self.threads = [threading.Thread(target=self._run, daemon=True) for _ in range(num_threads)]
+        for thread in self.threads:
+            thread.start()
+
+    def copy_file(self, source_path, target_path):
+        """Queue linking or copying an existing file without decoding it"""
+        self.queue.put(('copy', source_path, target_path))
+
+    def save_image(self, image, target_path):
+        """Queue encoding a PIL image to disk"""
+        self.queue.put(('image', image, target_path))
+
+    def _run(self):
+        while True:
+            task = self.queue.get()
+            if task is None:
+                self.queue.task_done()
+                return
+
+            kind, payload, target_path = task
+            try:
+                if kind == 'copy':
+                    link_or_copy(payload, target_path)
+                else:
+                    payload.save(target_path)
+                with self._lock:
+                    self.written += 1
+            except Exception as e:
+                with self._lock:
+                    self.errors.append(f"{target_path}: {e}")
+            finally:
+                self.queue.task_done()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def close(self):
+        """Flush all pending writes, stop the threads and return any write errors"""
+        if self.closed:
+            return list(self.errors)
+        self.closed = True
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        for error in self.errors:
+            print(f"Error writing output {error}")
+        return list(self.errors)
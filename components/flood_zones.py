@@ -0,0 +1,117 @@
+import os
+import hashlib
+import numpy as np
+import geopandas as gpd
+from rasterio import features
+from shapely.strtree import STRtree
+from shapely.geometry import box
+from components.geo_map import parse_tile_name
+from components.flood_export import tile_grid_transform
+from components.flood_regions import pixel_area_km2
+
+WATER_CLASS = 4
+ZONE_CACHE_DIR = "output/zone_cache"
+
+class ZonalFloodStats:
+    """Flooded area per district, reduced tile by tile against a cached zone label raster
+
+    Zone boundaries are rasterised once per block of block_tiles x block_tiles
+    tiles, at cells_per_tile label cells across each tile. Blocks are cached in
+    memory and on disk, keyed by the zone set. Each tile's water mask is pooled
+    to the label grid and reduced with one np.bincount, so no per-tile polygon
+    intersection happens and totals update incrementally as tiles finish.
+    """
+
+    def __init__(self, zones, cells_per_tile=32, block_tiles=16, tile_size=256, cache_dir=ZONE_CACHE_DIR):
+        self.names = [name for name, _ in zones]
+        self.cells_per_tile = cells_per_tile
+        self.block_tiles = block_tiles
+        self.tile_size = tile_size
+        self.pool = tile_size // cells_per_tile
+
+        # Zones are rasterised in web-mercator metres, the CRS of the tile grid
+        self.geometries = list(gpd.GeoSeries([g for _, g in zones], crs='EPSG:4326').to_crs('EPSG:3857'))
+        self.tree = STRtree(self.geometries)
+
+        key_source = "|".join(f"{name}:{geometry.wkb_hex}" for name, geometry in zones)
+        key = hashlib.sha1(f"{key_source}:{cells_per_tile}:{block_tiles}".encode()).hexdigest()[:16]
+        self.cache_dir = os.path.join(cache_dir, key)
+        self.blocks = {}
+
+        zone_count = len(zones) + 1  # label 0 is outside every zone
+        self.water_km2 = np.zeros(zone_count)
+        self.observed_km2 = np.zeros(zone_count)
+        self.tile_counts = np.zeros(zone_count, dtype=np.int64)
+
+    def block_labels(self, z, bx, by):
+        """Zone label raster of one block, rasterised on first use and cached"""
+        key = (z, bx, by)
+        if key in self.blocks:
+            return self.blocks[key]
+
+        path = os.path.join(self.cache_dir, f"{z}_{bx}_{by}.npy")
+        if os.path.exists(path):
+            labels = np.load(path)
+        else:
+            size = self.block_tiles * self.cells_per_tile
+            transform = tile_grid_transform(z, bx * self.block_tiles, by * self.block_tiles, self.cells_per_tile)
+            left, top = transform.c, transform.f
+            block_box = box(left, top - size * transform.a, left + size * transform.a, top)
+
+            # Only zones whose outline meets this block are burned in
+            shapes = [(self.geometries[idx], int(idx) + 1) for idx in self.tree.query(block_box)]
+            if shapes:
+                labels = features.rasterize(shapes, out_shape=(size, size), transform=transform, fill=0, dtype='uint16')
+            else:
+                labels = np.zeros((size, size), dtype=np.uint16)
+
+            os.makedirs(self.cache_dir, exist_ok=True)
+            np.save(path, labels)
+
+        self.blocks[key] = labels
+        return labels
+
+    def tile_labels(self, z, x, y):
+        """The cells_per_tile x cells_per_tile slice of the label raster under one tile"""
+        bx, by = x // self.block_tiles, y // self.block_tiles
+        labels = self.block_labels(z, bx, by)
+        col = (x - bx * self.block_tiles) * self.cells_per_tile
+        row = (y - by * self.block_tiles) * self.cells_per_tile
+        return labels[row:row + self.cells_per_tile, col:col + self.cells_per_tile]
+
+    def add_mask(self, z, x, y, class_map):
+        """Fold one tile's water mask into the per-zone totals"""
+        labels = self.tile_labels(z, x, y).ravel()
+        cells = self.cells_per_tile
+        water = (class_map == WATER_CLASS).reshape(cells, self.pool, cells, self.pool).sum(axis=(1, 3)).ravel()
+
+        pixel_area = pixel_area_km2(z, y, self.tile_size)
+        zone_count = len(self.water_km2)
+        self.water_km2 += np.bincount(labels, weights=water, minlength=zone_count) * pixel_area
+        self.observed_km2 += np.bincount(labels, minlength=zone_count) * (self.pool * self.pool * pixel_area)
+        self.tile_counts[np.unique(labels)] += 1
+
+    def add_result(self, prediction_info):
+        """Result callback for process_flood_prediction"""
+        coords = parse_tile_name(prediction_info['image_name'])
+        prediction = prediction_info.get('prediction')
+        if coords is None or prediction is None or prediction.shape != (self.tile_size, self.tile_size):
+            return
+        self.add_mask(coords['z'], coords['x'], coords['y'], prediction)
+
+    def summary(self):
+        """Per-zone flooded area, most flooded first, for zones that have been observed"""
+        rows = []
+        for idx, name in enumerate(self.names, start=1):
+            if self.tile_counts[idx] == 0:
+                continue
+            observed = self.observed_km2[idx]
+            rows.append({
+                'zone': name,
+                'water_km2': float(self.water_km2[idx]),
+                'observed_km2': float(observed),
+                'water_percentage': float(self.water_km2[idx] / observed * 100) if observed > 0 else 0.0,
+                'tiles': int(self.tile_counts[idx])
+            })
+        rows.sort(key=lambda row: row['water_km2'], reverse=True)
+        return rows
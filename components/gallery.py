@@ -0,0 +1,44 @@
+import os
+import hashlib
+from PIL import Image
+
+# Thumbnails are generated once per source file and reused across reruns
+THUMBNAIL_DIR = "output/thumbnails"
+THUMBNAIL_SIZE = 160
+
+def thumbnail_key(image_path, size=THUMBNAIL_SIZE):
+    """Cache key that changes whenever the source file is rewritten"""
+    stat = os.stat(image_path)
+    raw = f"{os.path.abspath(image_path)}:{stat.st_mtime_ns}:{stat.st_size}:{size}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+def get_thumbnail(image_path, size=THUMBNAIL_SIZE, cache_dir=THUMBNAIL_DIR):
+    """Return the path of a cached WebP thumbnail, generating it on first use"""
+    try:
+        key = thumbnail_key(image_path, size)
+        # Two-level fan-out keeps directories small for whole-state runs
+        thumb_path = os.path.join(cache_dir, key[:2], f"{key}.webp")
+        if os.path.exists(thumb_path):
+            return thumb_path
+
+        os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+        with Image.open(image_path) as image:
+            # JPEG draft mode decodes directly at a reduced scale
+            image.draft('RGB', (size, size))
+            thumbnail = image.convert('RGB')
+            thumbnail.thumbnail((size, size))
+
+        tmp_path = f"{thumb_path}.tmp"
+        thumbnail.save(tmp_path, format='WEBP', quality=80)
+        os.replace(tmp_path, thumb_path)
+        return thumb_path
+
+    except Exception as e:
+        print(f"Error creating thumbnail for {image_path}: {e}")
+        return None
+
+def page_bounds(total, page, page_size):
+    """Clamp a 1-based page number and return (page, offset, page_count)"""
+    page_count = max(1, -(-total // page_size))
+    page = min(max(1, page), page_count)
+    return page, (page - 1) * page_size, page_count
@@ -5,8 +5,14 @@ import requests
 import numpy as np
 from PIL import Image
 import math
+import re
 import pandas as pd
 from shapely import wkt
+from shapely.geometry import box
+from components.manifest import has_manifest, record_tiles, query_tiles, count_tiles
+from components.blank_tiles import BlankTileDetector, hash_tile_bytes
+from components.tile_io import tile_extension, is_tile_file
+from components.workspace import OUTPUT_ROOT, state_tiles_dir, state_flooded_dir
 
 def load_geodata():
     """Load geographic data from CSV file"""
@@ -29,6 +35,43 @@ def get_state_geometry_and_bounds(df, state_name):
     
     return None, None, None
 
+# Column names that hold district names in boundary datasets
+DISTRICT_COLUMNS = ['DIST_NAME', 'DISTRICT', 'dtname', 'district']
+
+def split_geometry_grid(geometry, rows, cols):
+    """Split a geometry into a rows x cols grid of clipped cells"""
+    minx, miny, maxx, maxy = geometry.bounds
+    cell_w = (maxx - minx) / cols
+    cell_h = (maxy - miny) / rows
+    cells = []
+    for r in range(rows):
+        for c in range(cols):
+            cell = box(minx + c * cell_w, maxy - (r + 1) * cell_h, minx + (c + 1) * cell_w, maxy - r * cell_h)
+            clipped = geometry.intersection(cell)
+            if not clipped.is_empty:
+                cells.append((f"Sub-region {r + 1}-{c + 1}", clipped))
+    return cells
+
+def get_state_zones(df, state_name, grid=(4, 4)):
+    """Districts of a state as (name, geometry) pairs in lon/lat
+
+    Boundary files without a district column fall back to a regular grid of
+    sub-regions clipped to the state outline.
+    """
+    state_rows = df[df['ST_NAME'].str.lower() == state_name.lower()]
+    if state_rows.empty:
+        return []
+    
+    district_column = next((c for c in DISTRICT_COLUMNS if c in df.columns), None)
+    if district_column:
+        return [
+            (row[district_column], wkt.loads(row['geometry']))
+            for _, row in state_rows.iterrows() if row['geometry']
+        ]
+    
+    _, geometry, _ = get_state_geometry_and_bounds(df, state_name)
+    return split_geometry_grid(geometry, *grid) if geometry is not None else []
+
 def calculate_tile_parameters(bounds, tiles_number):
     """Calculate tile parameters for satellite image capture"""
     minx, miny, maxx, maxy = bounds
@@ -96,8 +139,11 @@ def create_state_folium_map(state_data, geometry, center_lat, center_lon):
     
     return m
 
-def display_state_map_and_tiles(df, state_name, tiles_number=10):
-    """Main function to display state map and prepare tile information"""
+def display_state_map_and_tiles(df, state_name, tiles_number=10, output_root=OUTPUT_ROOT):
+    """Main function to display state map and prepare tile information
+
+    Tile and prediction directories are placed under output_root, e.g. a session workspace.
+    """
     state_data, geometry, bounds = get_state_geometry_and_bounds(df, state_name)
     
     if state_data is None or geometry is None or bounds is None:
@@ -107,7 +153,7 @@ def display_state_map_and_tiles(df, state_name, tiles_number=10):
     tile_params = calculate_tile_parameters(bounds, tiles_number)
     
     # Create output directory
-    output_dir = f"output/{state_data['ST_NAME'].replace(' ', '_')}"
+    output_dir = state_tiles_dir(state_data['ST_NAME'], output_root)
     os.makedirs(output_dir, exist_ok=True)
     
     # Create map
@@ -121,6 +167,7 @@ def display_state_map_and_tiles(df, state_name, tiles_number=10):
         'center': tile_params['center'],
         'tile_size': tile_params['tile_size_meters'],
         'output_dir': output_dir,
+        'flooded_dir': state_flooded_dir(state_data['ST_NAME'], output_root),
         'tile_params': tile_params
     }
     
@@ -142,39 +189,104 @@ def deg2num(lat_deg, lon_deg, zoom):
     ytile = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
     return (xtile, ytile)
 
-def download_single_tile(x, y, z, tile_path):
-    """Download a single satellite tile"""
+def num2deg(xtile, ytile, zoom):
+    """Convert tile coordinates to the lat/lon of the tile's north-west corner"""
+    n = 2.0 ** zoom
+    lon_deg = xtile / n * 360.0 - 180.0
+    lat_deg = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ytile / n))))
+    return (lat_deg, lon_deg)
+
+def tile_bounds(xtile, ytile, zoom):
+    """Lon/lat bounds (west, south, east, north) of a web-mercator tile"""
+    north, west = num2deg(xtile, ytile, zoom)
+    south, east = num2deg(xtile + 1, ytile + 1, zoom)
+    return (west, south, east, north)
+
+TILE_NAME_PATTERN = re.compile(r"tile_(\d+)_(\d+)_z(\d+)_x(\d+)_y(\d+)")
+
+def parse_tile_name(tile_name):
+    """Parse grid indices and z/x/y tile coordinates from a tile file name"""
+    match = TILE_NAME_PATTERN.search(tile_name)
+    if not match:
+        return None
+    i, j, z, x, y = map(int, match.groups())
+    return {'i': i, 'j': j, 'z': z, 'x': x, 'y': y}
+
+def fetch_tile_bytes(x, y, z):
+    """Raw bytes of one World_Imagery tile; raises on HTTP or network errors"""
+    url = f"https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}"
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+    }
+    response = requests.get(url, headers=headers, timeout=10)
+    response.raise_for_status()
+    return response.content
+
+# Open-ocean points far from any coast, where World_Imagery has no imagery at capture zooms
+# and serves its "Map data not yet available" placeholder instead
+PLACEHOLDER_PROBE_POINTS = [(-40.0, 80.0), (-45.0, 95.0)]
+
+def probe_provider_placeholder(blank_detector, zoom, fetch=fetch_tile_bytes):
+    """Fetch the provider's no-imagery placeholder at a zoom level once and register it
+
+    The placeholder is the same image wherever imagery is missing, so a probe
+    only counts if every probe point returns identical bytes; real imagery from
+    distinct places never does. Returns True once the zoom level is covered.
+    """
+    if zoom in blank_detector.probed_zooms:
+        return True
+    try:
+        responses = [fetch(*deg2num(lat, lon, zoom), zoom) for lat, lon in PLACEHOLDER_PROBE_POINTS]
+    except Exception as e:
+        print(f"Error probing placeholder tile at zoom {zoom}: {e}")
+        return False
+
+    if len({hash_tile_bytes(data) for data in responses}) == 1:
+        blank_detector.register_placeholder(responses[0])
+    else:
+        print(f"Placeholder probe at zoom {zoom} returned imagery; nothing registered")
+    blank_detector.probed_zooms.add(zoom)
+    blank_detector.save()
+    return True
+
+def download_single_tile(x, y, z, tile_path, blank_detector=None):
+    """Download a single satellite tile, storing the server's bytes as they are
+
+    The file extension of tile_path is replaced by the one matching the actual
+    encoding (usually .jpg), so nothing downstream has to guess or re-encode.
+    Returns {'image_name', 'content_hash', 'blank_reason'}, or None if the
+    download failed. Tiles the blank_detector flags as no-data are not written.
+    """
     try:
-        url = f"https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}"
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
+        data = fetch_tile_bytes(x, y, z)
+        tile_path = os.path.splitext(tile_path)[0] + tile_extension(data)
+        tile = {'image_name': os.path.basename(tile_path), 'content_hash': hash_tile_bytes(data), 'blank_reason': None}
+        if blank_detector is not None:
+            tile['blank_reason'] = blank_detector.check(data, tile['content_hash'])
+            if tile['blank_reason'] is not None:
+                return tile
         
-        with open(tile_path, 'wb') as f:
-            f.write(response.content)
-        return True
+        # A fresh file replaces the old one instead of rewriting it, so outputs
+        # hard-linked from an earlier capture keep showing that capture's imagery
+        tmp_path = f"{tile_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, tile_path)
+        return tile
     except Exception as e:
         print(f"Error downloading tile {x},{y},{z}: {e}")
-        return False
+        return None
 
-def capture_satellite_tiles(bounds, tile_params, output_dir, state_name, progress_callback=None):
-    """Capture satellite tiles for the given bounds"""
+def iter_capture_tiles(bounds, tile_params):
+    """Yield (i, j, z, x, y) for every grid cell of a capture, in capture order"""
     minx, miny, maxx, maxy = bounds
     
     lat_step = tile_params['lat_step']
     lon_step = tile_params['lon_step']
-    lat_tiles = tile_params['lat_tiles']
-    lon_tiles = tile_params['lon_tiles']
-    total_tiles = tile_params['total_tiles']
     zoom = tile_params['zoom']
     
-    tile_count = 0
-    successful_tiles = 0
-    
-    for i in range(lat_tiles):
-        for j in range(lon_tiles):
+    for i in range(tile_params['lat_tiles']):
+        for j in range(tile_params['lon_tiles']):
             # Calculate tile bounds
             tile_miny = miny + i * lat_step
             tile_maxy = min(miny + (i + 1) * lat_step, maxy)
@@ -187,35 +299,80 @@ def capture_satellite_tiles(bounds, tile_params, output_dir, state_name, progres
             
             # Convert to tile coordinates
             x_tile, y_tile = deg2num(tile_center_lat, tile_center_lon, zoom)
-            
-            # Create tile filename
-            tile_filename = f"tile_{i}_{j}_z{zoom}_x{x_tile}_y{y_tile}.png"
-            tile_path = os.path.join(output_dir, tile_filename)
-            
-            # Download tile
-            success = download_single_tile(x_tile, y_tile, zoom, tile_path)
-            
-            if success:
+            yield i, j, zoom, x_tile, y_tile
+
+def tile_file_name(i, j, z, x, y, extension='.png'):
+    """File name of a captured tile"""
+    return f"tile_{i}_{j}_z{z}_x{x}_y{y}{extension}"
+
+def capture_satellite_tiles(bounds, tile_params, output_dir, state_name, progress_callback=None, blank_detector=None,
+                            progress_bus=None):
+    """Capture satellite tiles for the given bounds
+
+    Placeholder and uniform no-data tiles are tagged in the manifest instead of
+    saved (see count_blank_tiles) and do not count as successful.
+    progress_bus, if given, receives a 'capture' event per tile under the state's topic.
+    """
+    total_tiles = tile_params['total_tiles']
+    blank_detector = blank_detector or BlankTileDetector()
+    probe_provider_placeholder(blank_detector, tile_params['zoom'])
+    
+    tile_count = 0
+    successful_tiles = 0
+    captured = []
+    
+    for i, j, zoom, x_tile, y_tile in iter_capture_tiles(bounds, tile_params):
+        # Create tile filename
+        tile_filename = tile_file_name(i, j, zoom, x_tile, y_tile)
+        tile_path = os.path.join(output_dir, tile_filename)
+        
+        # Download tile
+        tile = download_single_tile(x_tile, y_tile, zoom, tile_path, blank_detector)
+        
+        if tile:
+            if tile['blank_reason'] is None:
                 successful_tiles += 1
-            
-            tile_count += 1
-            
-            # Update progress
-            if progress_callback:
-                progress = tile_count / total_tiles
-                progress_callback(progress)
+            captured.append({**tile, 'z': zoom, 'x': x_tile, 'y': y_tile})
+        
+        tile_count += 1
+        
+        # Update progress
+        if progress_bus:
+            progress_bus.publish(state_name, 'capture', tile_count, total_tiles, {'successful': successful_tiles})
+        if progress_callback:
+            progress = tile_count / total_tiles
+            progress_callback(progress)
+    
+    # Index the captured tiles so listings don't rescan the directory
+    record_tiles(output_dir, captured)
+    blank_detector.save()
+    
+    if progress_bus:
+        progress_bus.publish(state_name, 'capture', tile_count, total_tiles, {'successful': successful_tiles}, final=True)
     
     return successful_tiles, tile_count
 
-def get_tile_images(output_dir):
+def get_tile_images(output_dir, limit=None, offset=0):
     """Get list of tile images from output directory"""
     if not os.path.exists(output_dir):
         return []
     
-    tile_files = [f for f in os.listdir(output_dir) if f.endswith('.png')]
-    return sorted(tile_files)
+    if has_manifest(output_dir):
+        return query_tiles(output_dir, limit=limit, offset=offset)
+    
+    tile_files = sorted(f for f in os.listdir(output_dir) if is_tile_file(f))
+    return tile_files[offset:] if limit is None else tile_files[offset:offset + limit]
+
+def count_tile_images(output_dir):
+    """Count tile images in an output directory"""
+    if not os.path.exists(output_dir):
+        return 0
+    
+    if has_manifest(output_dir):
+        return count_tiles(output_dir)
+    
+    return len([f for f in os.listdir(output_dir) if is_tile_file(f)])
 
 def get_limited_tile_images(output_dir, limit=10):
     """Get limited number of tile images for display"""
-    tile_files = get_tile_images(output_dir)
-    return tile_files[:limit] if len(tile_files) > limit else tile_files
\ No newline at end of file
+    return get_tile_images(output_dir, limit=limit)
\ No newline at end of file
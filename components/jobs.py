@@ -0,0 +1,242 @@
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from components.geo_map import capture_satellite_tiles
+from components.flood import process_flood_prediction
+from components.flood_batch import run_batch
+from components.progress import ProgressBus, LogProgressSubscriber, MetricsProgressSubscriber
+from components.scheduler import RunAdmission
+
+ACTIVE_STATES = ('queued', 'running')
+# Heavy model stages are admitted separately by the stage scheduler, so a few
+# more job threads only let captures run while predictions wait for capacity
+JOB_WORKERS = 4
+# Finished jobs kept for polling before the oldest are dropped
+KEEP_FINISHED = 200
+# Maximum progress updates per second per job for polling pages, server logs and metrics
+JOB_PROGRESS_RATE = 4.0
+LOG_PROGRESS_RATE = 0.2
+METRICS_PROGRESS_RATE = 1.0
+
+# Latest progress event of every job, keyed by job id, for metrics endpoints
+progress_metrics = MetricsProgressSubscriber()
+
+class JobCancelled(BaseException):
+    """Raised inside a job at its next progress report once cancellation is requested
+
+    A BaseException so the pipeline's per-tile `except Exception` handlers let it through.
+    """
+
+class Job:
+    """A unit of background work with progress, result and cooperative cancellation"""
+
+    def __init__(self, kind, label=None, owner=None):
+        self.job_id = uuid.uuid4().hex
+        self.kind = kind
+        self.label = label or kind
+        self.owner = owner
+        self.status = 'queued'
+        self.progress = 0.0
+        self.message = ""
+        self.event = None
+        self.waiting_ahead = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+
+    def report_wait(self, waiting_ahead):
+        """Scheduler on_wait callback: the job is queued for model capacity, keeping its progress"""
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+        self.waiting_ahead = waiting_ahead
+
+    def on_progress_event(self, event):
+        """ProgressBus subscriber keeping the job's progress, throughput and ETA current"""
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+        self.progress = event.fraction
+        self.message = event.stage
+        self.event = event.to_dict()
+        self.waiting_ahead = None
+
+    def progress_bus(self):
+        """A bus feeding this job, the server log and the shared metrics at their own rates"""
+        bus = ProgressBus()
+        bus.subscribe(self.on_progress_event, max_rate=JOB_PROGRESS_RATE)
+        bus.subscribe(LogProgressSubscriber(), max_rate=LOG_PROGRESS_RATE)
+        bus.subscribe(lambda event: progress_metrics.record(event, key=self.job_id), max_rate=METRICS_PROGRESS_RATE)
+        return bus
+
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'kind': self.kind,
+            'label': self.label,
+            'owner': self.owner,
+            'status': self.status,
+            'progress': self.progress,
+            'message': self.message,
+            'event': self.event,
+            'waiting_ahead': self.waiting_ahead,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+class JobRunner:
+    """In-process background job queue backed by a thread pool
+
+    Jobs live in the server process, independent of any Streamlit script run,
+    so they keep going across reruns and disconnects; pages poll them by id.
+    Jobs run in submission order on max_workers threads.
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS, keep_finished=KEEP_FINISHED):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.keep_finished = keep_finished
+        self.jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind, fn, label=None, owner=None):
+        """Queue fn(job) and return the job id; fn's return value becomes the job result"""
+        job = Job(kind, label, owner)
+        with self._lock:
+            self.jobs[job.job_id] = job
+            self._prune()
+        self.executor.submit(self._run, job, fn)
+        return job.job_id
+
+    def _run(self, job, fn):
+        if job.cancel_event.is_set():
+            job.status = 'cancelled'
+            job.finished_at = time.time()
+            return
+        job.status = 'running'
+        job.started_at = time.time()
+        try:
+            job.result = fn(job)
+            job.progress = 1.0
+            job.status = 'completed'
+        except JobCancelled:
+            job.status = 'cancelled'
+        except Exception as e:
+            print(f"Error in {job.kind} job {job.job_id}: {e}")
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished_at = time.time()
+
+    def _prune(self):
+        finished = [job for job in self.jobs.values() if job.status not in ACTIVE_STATES]
+        finished.sort(key=lambda job: job.finished_at or 0)
+        for job in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self.jobs[job.job_id]
+            progress_metrics.discard(job.job_id)
+
+    def get(self, job_id):
+        """Snapshot of a job, or None if it is unknown or has been pruned"""
+        job = self.jobs.get(job_id)
+        return job.to_dict() if job else None
+
+    def cancel(self, job_id):
+        """Request cancellation; a running job stops at its next progress report"""
+        job = self.jobs.get(job_id)
+        if job is None or job.status not in ACTIVE_STATES:
+            return False
+        job.cancel_event.set()
+        return True
+
+    def list(self, owner=None):
+        """Snapshots of all known jobs, newest first, optionally for one owner"""
+        with self._lock:
+            jobs = [job for job in self.jobs.values() if owner is None or job.owner == owner]
+        return [job.to_dict() for job in sorted(jobs, key=lambda job: job.created_at, reverse=True)]
+
+_job_runner = None
+_job_runner_lock = threading.Lock()
+
+def get_job_runner():
+    """The process-wide job runner, created on first use"""
+    global _job_runner
+    with _job_runner_lock:
+        if _job_runner is None:
+            _job_runner = JobRunner()
+        return _job_runner
+
+def get_job(job_id):
+    return get_job_runner().get(job_id)
+
+def get_progress_metrics():
+    """Latest coalesced progress event of every retained job, keyed by job id"""
+    return progress_metrics.snapshot()
+
+def cancel_job(job_id):
+    return get_job_runner().cancel(job_id)
+
+def list_jobs(owner=None):
+    return get_job_runner().list(owner)
+
+def submit_capture_job(state_info, owner=None):
+    """Capture a state's satellite tiles in the background; the result is (successful, total)"""
+    def run(job):
+        return capture_satellite_tiles(
+            state_info['bounds'],
+            state_info['tile_params'],
+            state_info['output_dir'],
+            state_info['state_name'],
+            progress_bus=job.progress_bus()
+        )
+    return get_job_runner().submit('capture', run, label=f"Capture {state_info['state_name']}", owner=owner)
+
+def submit_prediction_job(input_dir, state_name, owner=None, result_callback=None, on_finish=None, **options):
+    """Run process_flood_prediction in the background
+
+    Inference is admitted by the stage scheduler under the server's CPU and
+    memory budget one chunk of tiles at a time, so runs of different owners
+    interleave. on_finish is called when the run ends, even if it failed or was
+    cancelled, e.g. to close incremental consumers fed by result_callback. The
+    per-tile all_predictions list is dropped from the stored result, since
+    finished jobs are kept in memory for polling.
+    """
+    def run(job):
+        try:
+            result = process_flood_prediction(
+                input_dir,
+                state_name,
+                progress_bus=job.progress_bus(),
+                result_callback=result_callback,
+                admission=RunAdmission(owner, options.get('model_options'), on_wait=job.report_wait),
+                **options
+            )
+        finally:
+            if on_finish:
+                on_finish()
+        result.pop('all_predictions', None)
+        return result
+    return get_job_runner().submit('prediction', run, label=f"Predict {state_name}", owner=owner)
+
+def submit_batch_job(df, state_names, tiles_number, owner=None, **options):
+    """Capture and segment several states with run_batch in the background
+
+    Progress is published under the 'batch' topic with per-state progress as
+    the event detail. As for predictions, the per-tile all_predictions list is
+    dropped from the stored result.
+    """
+    def run(job):
+        bus = job.progress_bus()
+
+        def on_progress(stage, progress, state_progress):
+            bus.publish('batch', stage, progress, 1.0, state_progress, final=progress >= 1.0)
+
+        result = run_batch(
+            df, state_names, tiles_number, progress_callback=on_progress, owner=owner, on_wait=job.report_wait, **options
+        )
+        result.pop('all_predictions', None)
+        return result
+    return get_job_runner().submit('batch', run, label=f"Batch of {len(state_names)} states", owner=owner)
@@ -0,0 +1,197 @@
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+# Each tile and flooded directory keeps its own manifest, so removing the directory removes its index too
+MANIFEST_NAME = "manifest.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    state_name TEXT,
+    started_at REAL NOT NULL,
+    completed_at REAL,
+    total_images INTEGER
+);
+CREATE TABLE IF NOT EXISTS tiles (
+    image_name TEXT PRIMARY KEY,
+    z INTEGER,
+    x INTEGER,
+    y INTEGER,
+    captured_at REAL,
+    content_hash TEXT,
+    blank_reason TEXT
+);
+CREATE TABLE IF NOT EXISTS predictions (
+    image_name TEXT PRIMARY KEY,
+    run_id INTEGER NOT NULL,
+    z INTEGER,
+    x INTEGER,
+    y INTEGER,
+    water_percentage REAL NOT NULL,
+    flooded INTEGER NOT NULL,
+    prefiltered INTEGER NOT NULL DEFAULT 0,
+    source_path TEXT,
+    original_path TEXT,
+    prediction_path TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_predictions_flooded_water
+    ON predictions (flooded, water_percentage DESC);
+CREATE INDEX IF NOT EXISTS idx_predictions_water
+    ON predictions (water_percentage DESC);
+"""
+
+# Columns added after a table was first created, applied to older manifests on open
+MIGRATIONS = [
+    ('tiles', 'content_hash', 'TEXT'),
+    ('tiles', 'blank_reason', 'TEXT'),
+]
+
+# Allowed sort orders for listing queries, mapped to SQL so callers never inject ORDER BY text
+SORT_ORDERS = {
+    'water_desc': 'water_percentage DESC, image_name',
+    'water_asc': 'water_percentage ASC, image_name',
+    'name': 'image_name',
+}
+
+def manifest_path(directory):
+    """Path of the manifest database for a tile or flooded directory"""
+    return os.path.join(directory, MANIFEST_NAME)
+
+def has_manifest(directory):
+    """Whether a directory has been indexed"""
+    return os.path.exists(manifest_path(directory))
+
+def open_manifest(directory):
+    """Open (creating if needed) the manifest database of a directory"""
+    os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(manifest_path(directory), timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    for table, column, column_type in MIGRATIONS:
+        columns = {row['name'] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+    return conn
+
+def start_run(directory, kind, state_name=None):
+    """Register a capture or prediction run and return its id"""
+    with closing(open_manifest(directory)) as conn, conn:
+        cursor = conn.execute(
+            "INSERT INTO runs (kind, state_name, started_at) VALUES (?, ?, ?)",
+            (kind, state_name, time.time())
+        )
+        return cursor.lastrowid
+
+def complete_run(directory, run_id, total_images):
+    """Mark a run as finished"""
+    with closing(open_manifest(directory)) as conn, conn:
+        conn.execute(
+            "UPDATE runs SET completed_at = ?, total_images = ? WHERE run_id = ?",
+            (time.time(), total_images, run_id)
+        )
+
+def record_tiles(directory, tiles):
+    """Index captured tiles; each tile is a dict with image_name and optional z/x/y, content_hash
+    and blank_reason (set for no-data tiles that were tagged instead of saved)"""
+    now = time.time()
+    with closing(open_manifest(directory)) as conn, conn:
+        conn.executemany(
+            """INSERT OR REPLACE INTO tiles (image_name, z, x, y, captured_at, content_hash, blank_reason)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            [
+                (t['image_name'], t.get('z'), t.get('x'), t.get('y'), now, t.get('content_hash'), t.get('blank_reason'))
+                for t in tiles
+            ]
+        )
+
+def record_predictions(directory, run_id, predictions):
+    """Replace the indexed predictions of a directory with those of the given run"""
+    rows = [
+        (
+            p['image_name'], run_id, p.get('z'), p.get('x'), p.get('y'),
+            float(p['water_percentage']), int(bool(p.get('flooded'))), int(bool(p.get('prefiltered'))),
+            p.get('source_path'), p.get('original_path'), p.get('prediction_path')
+        )
+        for p in predictions
+    ]
+    with closing(open_manifest(directory)) as conn, conn:
+        conn.execute("DELETE FROM predictions")
+        conn.executemany(
+            """INSERT INTO predictions (
+                image_name, run_id, z, x, y, water_percentage, flooded, prefiltered,
+                source_path, original_path, prediction_path
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            rows
+        )
+
+def query_tiles(directory, limit=None, offset=0):
+    """Indexed tile names in name order"""
+    with closing(open_manifest(directory)) as conn:
+        rows = conn.execute(
+            "SELECT image_name FROM tiles WHERE blank_reason IS NULL ORDER BY image_name LIMIT ? OFFSET ?",
+            (-1 if limit is None else limit, offset)
+        ).fetchall()
+    return [row['image_name'] for row in rows]
+
+def query_tile_hashes(directory):
+    """Content hash of every indexed tile, keyed by tile name (None where unknown)"""
+    with closing(open_manifest(directory)) as conn:
+        rows = conn.execute("SELECT image_name, content_hash FROM tiles WHERE blank_reason IS NULL").fetchall()
+    return {row['image_name']: row['content_hash'] for row in rows}
+
+def query_blank_tiles(directory):
+    """Blank reason of every tile tagged as blank, keyed by tile name"""
+    with closing(open_manifest(directory)) as conn:
+        rows = conn.execute("SELECT image_name, blank_reason FROM tiles WHERE blank_reason IS NOT NULL").fetchall()
+    return {row['image_name']: row['blank_reason'] for row in rows}
+
+def count_tiles(directory):
+    """Number of indexed tiles with real imagery"""
+    with closing(open_manifest(directory)) as conn:
+        return conn.execute("SELECT COUNT(*) FROM tiles WHERE blank_reason IS NULL").fetchone()[0]
+
+def count_blank_tiles(directory):
+    """Number of tiles tagged as blank, by reason"""
+    with closing(open_manifest(directory)) as conn:
+        rows = conn.execute(
+            "SELECT blank_reason, COUNT(*) AS n FROM tiles WHERE blank_reason IS NOT NULL GROUP BY blank_reason"
+        ).fetchall()
+    return {row['blank_reason']: row['n'] for row in rows}
+
+def query_flooded(directory, limit=10, offset=0, sort='water_desc'):
+    """Page through flooded predictions, e.g. the 50 most flooded tiles"""
+    order = SORT_ORDERS.get(sort, SORT_ORDERS['water_desc'])
+    with closing(open_manifest(directory)) as conn:
+        rows = conn.execute(
+            f"""SELECT image_name, water_percentage, original_path, prediction_path, z, x, y
+                FROM predictions WHERE flooded = 1 ORDER BY {order} LIMIT ? OFFSET ?""",
+            (-1 if limit is None else limit, offset)
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+def query_predictions(directory, limit=None, offset=0, sort='water_desc', min_water=None):
+    """Page through all predictions of the latest run"""
+    order = SORT_ORDERS.get(sort, SORT_ORDERS['water_desc'])
+    where, params = "", []
+    if min_water is not None:
+        where, params = "WHERE water_percentage >= ?", [min_water]
+    with closing(open_manifest(directory)) as conn:
+        rows = conn.execute(
+            f"SELECT * FROM predictions {where} ORDER BY {order} LIMIT ? OFFSET ?",
+            params + [-1 if limit is None else limit, offset]
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+def summarize_predictions(directory):
+    """Counts of indexed predictions, flooded and prefiltered tiles"""
+    with closing(open_manifest(directory)) as conn:
+        row = conn.execute(
+            """SELECT COUNT(*) AS total_images,
+                      COALESCE(SUM(flooded), 0) AS total_flooded,
+                      COALESCE(SUM(prefiltered), 0) AS total_prefiltered
+               FROM predictions"""
+        ).fetchone()
+    return dict(row)
@@ -0,0 +1,174 @@
+import time
+import threading
+
+class ProgressEvent:
+    """Snapshot of one topic's progress: counts, throughput, ETA and per-stage timings"""
+
+    def __init__(self, topic, stage, done, total, rate, eta, stage_timings, detail=None, final=False):
+        self.topic = topic
+        self.stage = stage
+        self.done = done
+        self.total = total
+        self.rate = rate
+        self.eta = eta
+        self.stage_timings = stage_timings
+        self.detail = detail
+        self.final = final
+
+    @property
+    def fraction(self):
+        return min(self.done / self.total, 1.0) if self.total else 0.0
+
+    def to_dict(self):
+        return {
+            'topic': self.topic,
+            'stage': self.stage,
+            'done': self.done,
+            'total': self.total,
+            'fraction': self.fraction,
+            'rate': self.rate,
+            'eta': self.eta,
+            'stage_timings': dict(self.stage_timings),
+            'detail': self.detail,
+            'final': self.final,
+        }
+
+class _TopicState:
+    def __init__(self):
+        self.stage = None
+        self.stage_started = None
+        self.stage_timings = {}
+        self.rate = None
+        self.last_done = 0
+        self.last_time = None
+
+    def update(self, stage, done, now, smoothing):
+        if stage != self.stage:
+            if self.stage is not None:
+                self.stage_timings[self.stage] = now - self.stage_started
+            self.stage = stage
+            self.stage_started = now
+            self.rate = None
+            self.last_done, self.last_time = done, now
+            return
+        elapsed = now - self.last_time
+        if elapsed > 0 and done != self.last_done:
+            instant = (done - self.last_done) / elapsed
+            # Exponential moving average keeps the ETA steady through bursty shard completions
+            self.rate = instant if self.rate is None else smoothing * instant + (1 - smoothing) * self.rate
+            self.last_done, self.last_time = done, now
+
+class _Subscription:
+    def __init__(self, callback, max_rate, topic):
+        self.callback = callback
+        self.min_interval = 1.0 / max_rate if max_rate else 0.0
+        self.topic = topic
+        self.last_sent = {}
+
+class ProgressBus:
+    """Coalescing publish/subscribe channel for pipeline progress
+
+    Publishing is cheap enough to do once per tile: it updates the topic's
+    counters and hands the newest event to each subscriber only if that
+    subscriber's max_rate allows. Intermediate events are dropped, never
+    queued. Stage changes and final events are always delivered. A failing
+    subscriber is reported and skipped without stopping the pipeline.
+    """
+
+    def __init__(self, smoothing=0.3):
+        self.smoothing = smoothing
+        self.topics = {}
+        self.subscriptions = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback, max_rate=2.0, topic=None):
+        """Deliver events to callback(event) at most max_rate times per second, per topic"""
+        with self._lock:
+            self.subscriptions.append(_Subscription(callback, max_rate, topic))
+
+    def publish(self, topic, stage, done, total, detail=None, final=False):
+        """Record progress and deliver it to subscribers that are due an update
+
+        done and total are counts within the current stage; detail carries any
+        extra payload for subscribers, e.g. per-state progress of a batch.
+        """
+        now = time.monotonic()
+        with self._lock:
+            state = self.topics.setdefault(topic, _TopicState())
+            stage_changed = stage != state.stage
+            state.update(stage, done, now, self.smoothing)
+            if final and state.stage is not None:
+                state.stage_timings[state.stage] = now - state.stage_started
+            eta = (total - done) / state.rate if state.rate and total else None
+            event = ProgressEvent(topic, stage, done, total, state.rate, eta, dict(state.stage_timings), detail, final)
+
+            due = []
+            for subscription in self.subscriptions:
+                if subscription.topic is not None and subscription.topic != topic:
+                    continue
+                last_sent = subscription.last_sent.get(topic)
+                if final or stage_changed or last_sent is None or now - last_sent >= subscription.min_interval:
+                    subscription.last_sent[topic] = now
+                    due.append(subscription)
+
+        for subscription in due:
+            try:
+                subscription.callback(event)
+            except Exception as e:
+                print(f"Error in progress subscriber: {e}")
+
+    def stage_callback(self, topic, stage, total=1.0, progress_callback=None):
+        """Adapter for functions reporting a fraction through progress_callback
+
+        The fraction is published as a count out of total, and reaching 1.0 is
+        always delivered; progress_callback, if given, still gets every fraction.
+        """
+        def report(progress):
+            self.publish(topic, stage, progress * total, total, final=progress >= 1.0)
+            if progress_callback:
+                progress_callback(progress)
+        return report
+
+def format_eta(seconds):
+    """Human-readable remaining time"""
+    if seconds is None:
+        return "estimating..."
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60}s"
+    return f"{seconds}s"
+
+class LogProgressSubscriber:
+    """Prints coalesced progress lines, e.g. subscribed at max_rate=0.2 for one line every 5 s"""
+
+    def __call__(self, event):
+        rate = f"{event.rate:.1f}/s" if event.rate else "-"
+        print(
+            f"[{event.topic}] {event.stage}: {event.done:g}/{event.total:g} "
+            f"({event.fraction * 100:.1f}%), {rate}, ETA {format_eta(event.eta)}"
+        )
+
+class MetricsProgressSubscriber:
+    """Keeps the latest event of every topic for metrics endpoints or dashboards"""
+
+    def __init__(self):
+        self.latest = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        self.record(event)
+
+    def record(self, event, key=None):
+        """Store an event under key, by default its topic"""
+        with self._lock:
+            self.latest[key or event.topic] = event.to_dict()
+
+    def discard(self, key):
+        with self._lock:
+            self.latest.pop(key, None)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.latest)
@@ -0,0 +1,273 @@
+import os
+import itertools
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+def total_memory_mb():
+    """Physical memory of the machine in MB, or a conservative guess where it is unknown"""
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // (1024 * 1024)
+    except (ValueError, OSError, AttributeError):
+        return 8192
+
+CPU_BUDGET = os.cpu_count() or 1
+# Headroom is left for Streamlit, capture threads and the OS
+MEMORY_BUDGET_MB = int(total_memory_mb() * 0.75)
+# Approximate resident size of one loaded model with its activations
+STAGE_MEMORY_MB = {'segformer': 1500, 'yolo': 800}
+WAIT_POLL_INTERVAL = 0.5
+# Tiles segmented per admission before a run gives its share back and queues again
+ADMISSION_CHUNK_TILES = 32
+
+def segformer_cost(model_options=None, num_workers=1):
+    """(cpu, memory_mb) a Segformer run will really use with these options"""
+    model_options = model_options or {}
+    num_threads = model_options.get('num_threads')
+    if num_workers > 1:
+        cpu = num_workers * (num_threads or max(1, CPU_BUDGET // num_workers))
+    elif num_threads:
+        cpu = num_threads
+    else:
+        # torch's default intra-op pool spans every core
+        cpu = CPU_BUDGET
+    return cpu, num_workers * STAGE_MEMORY_MB['segformer']
+
+def yolo_cost():
+    """(cpu, memory_mb) of one YOLO inference, which also uses torch's default thread pool"""
+    return CPU_BUDGET, STAGE_MEMORY_MB['yolo']
+
+class StageScheduler:
+    """Admits heavy model stages under a process-wide CPU and memory budget
+
+    Requests queue per owner (a browser session). Whenever capacity frees up,
+    the owner with the fewest running stages is served next, ties going to the
+    owner served longest ago, and requests of one owner run in order, so one
+    user queueing many runs cannot starve the others. The chosen request waits
+    until it fits instead of being overtaken by smaller ones, so large stages
+    are not starved either. The one exception is a request waiting for memory:
+    requests that need no memory (CPU chunks of runs whose models are already
+    resident) may pass it, since those runs must progress to free the memory.
+    Requests larger than the budget are clamped to it and run alone.
+    """
+
+    def __init__(self, cpu_budget=CPU_BUDGET, memory_budget_mb=MEMORY_BUDGET_MB):
+        self.cpu_budget = cpu_budget
+        self.memory_budget_mb = memory_budget_mb
+        self.used_cpu = 0
+        self.used_memory_mb = 0
+        self.queues = {}
+        self.running = {}
+        self.last_served = {}
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+    def _waiting_in_order(self):
+        # Fewest running stages first, then the owner served longest ago, then the oldest request
+        waiting = [ticket for queue in self.queues.values() for ticket in queue]
+        return sorted(waiting, key=lambda ticket: (
+            self.running.get(ticket['owner'], 0), self.last_served.get(ticket['owner'], -1), ticket['seq']
+        ))
+
+    def _next_ticket(self):
+        memory_blocked = False
+        for ticket in self._waiting_in_order():
+            if memory_blocked and ticket['memory_mb']:
+                continue
+            fits_memory = self.used_memory_mb + ticket['memory_mb'] <= self.memory_budget_mb
+            if fits_memory and self.used_cpu + ticket['cpu'] <= self.cpu_budget:
+                return ticket
+            if fits_memory:
+                # Waiting only for CPU, which frees chunk by chunk: it holds the line
+                return None
+            # Memory is held by runs that need CPU chunks to finish and free it, so
+            # requests needing no memory may go ahead; other memory requests may not
+            memory_blocked = True
+        return None
+
+    def _dispatch(self):
+        granted = False
+        while self.queues:
+            ticket = self._next_ticket()
+            if ticket is None:
+                break
+            owner = ticket['owner']
+            self.queues[owner].remove(ticket)
+            if not self.queues[owner]:
+                del self.queues[owner]
+            self.used_cpu += ticket['cpu']
+            self.used_memory_mb += ticket['memory_mb']
+            self.running[owner] = self.running.get(owner, 0) + 1
+            self.last_served[owner] = next(self._sequence)
+            ticket['granted'] = True
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def _release(self, ticket):
+        owner = ticket['owner']
+        self.used_cpu -= ticket['cpu']
+        self.used_memory_mb -= ticket['memory_mb']
+        self.running[owner] -= 1
+        if not self.running[owner]:
+            del self.running[owner]
+            if owner not in self.queues:
+                del self.last_served[owner]
+        self._dispatch()
+
+    def _withdraw(self, ticket):
+        queue = self.queues.get(ticket['owner'])
+        if queue and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del self.queues[ticket['owner']]
+        # The withdrawn ticket may have been the one holding the line
+        self._dispatch()
+
+    @contextmanager
+    def admit(self, stage, owner=None, cpu=1, memory_mb=None, on_wait=None):
+        """Block until the stage fits the budget and hold its share while the block runs
+
+        on_wait(waiting_ahead) is called about every WAIT_POLL_INTERVAL seconds
+        while queued, e.g. to show the queue position; an exception raised from
+        it (such as a job cancellation) withdraws the request.
+        """
+        ticket = {
+            'stage': stage,
+            'owner': owner,
+            'cpu': min(max(0, cpu), self.cpu_budget),
+            'memory_mb': min(STAGE_MEMORY_MB.get(stage, 0) if memory_mb is None else memory_mb, self.memory_budget_mb),
+            'seq': next(self._sequence),
+            'granted': False,
+        }
+        with self._cond:
+            self.queues.setdefault(owner, deque()).append(ticket)
+            self._dispatch()
+
+        try:
+            while True:
+                with self._cond:
+                    if not ticket['granted']:
+                        self._cond.wait(WAIT_POLL_INTERVAL)
+                    if ticket['granted']:
+                        break
+                    waiting_ahead = sum(
+                        1 for queue in self.queues.values() for other in queue if other['seq'] < ticket['seq']
+                    )
+                if on_wait:
+                    on_wait(waiting_ahead)
+        except BaseException:
+            with self._cond:
+                if ticket['granted']:
+                    self._release(ticket)
+                else:
+                    self._withdraw(ticket)
+            raise
+
+        try:
+            yield ticket
+        finally:
+            with self._cond:
+                self._release(ticket)
+
+    def status(self):
+        """Current usage, running stages per owner and number of queued requests"""
+        with self._cond:
+            return {
+                'cpu_used': self.used_cpu,
+                'cpu_budget': self.cpu_budget,
+                'memory_used_mb': self.used_memory_mb,
+                'memory_budget_mb': self.memory_budget_mb,
+                'running': dict(self.running),
+                'queued': sum(len(queue) for queue in self.queues.values()),
+            }
+
+class ChunkedAdmission:
+    """Holds a scheduler admission for one chunk of work at a time
+
+    admit is a factory returning a fresh admission context manager, e.g.
+    lambda: scheduler.admit('segformer', owner, cpu=cpu, memory_mb=memory_mb).
+    The first chunk is admitted on entry; after every chunk_size calls to
+    step() the admission is released and requested again, so a long run
+    queues behind other owners between chunks instead of holding its share
+    to the end. With lazy=True nothing is admitted until hold() is called,
+    for runs that may not need the model at all. With admit=None it does nothing.
+    """
+
+    def __init__(self, admit=None, chunk_size=ADMISSION_CHUNK_TILES, total=None, lazy=False):
+        self.admit = admit
+        self.chunk_size = max(1, chunk_size)
+        self.total = total
+        self.lazy = lazy
+        self.done = 0
+        self._admission = None
+
+    def hold(self):
+        """Make sure the current chunk is admitted, waiting in the queue if needed"""
+        if self.admit is not None and self._admission is None:
+            admission = self.admit()
+            admission.__enter__()
+            self._admission = admission
+
+    def _release(self, exc_info=(None, None, None)):
+        admission, self._admission = self._admission, None
+        if admission is not None:
+            admission.__exit__(*exc_info)
+
+    def __enter__(self):
+        if not self.lazy:
+            self.hold()
+        return self
+
+    def step(self):
+        """Record one finished item, re-queueing once a chunk is complete and more work remains"""
+        self.done += 1
+        if self.done % self.chunk_size == 0 and (self.total is None or self.done < self.total):
+            self._release()
+            if not self.lazy:
+                self.hold()
+
+    def __exit__(self, exc_type, exc, tb):
+        self._release((exc_type, exc, tb))
+        return False
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    """The process-wide heavy stage scheduler, created on first use"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = StageScheduler()
+        return _scheduler
+
+class RunAdmission:
+    """Scheduler admission of one model run: memory for the run's lifetime, CPU one chunk at a time
+
+    A loaded model keeps its memory between chunks, so reserve() is entered
+    before the model (or the worker pool) is loaded and left once it is freed;
+    chunks() then only hands the CPU share back and forth.
+    """
+
+    def __init__(self, owner=None, model_options=None, on_wait=None, stage='segformer', scheduler=None):
+        self.owner = owner
+        self.model_options = model_options
+        self.on_wait = on_wait
+        self.stage = stage
+        self.scheduler = scheduler
+
+    def _scheduler(self):
+        return self.scheduler or get_scheduler()
+
+    def reserve(self, num_workers=1):
+        """Context manager holding the memory of num_workers resident models"""
+        memory_mb = num_workers * STAGE_MEMORY_MB.get(self.stage, 0)
+        return self._scheduler().admit(self.stage, self.owner, cpu=0, memory_mb=memory_mb, on_wait=self.on_wait)
+
+    def chunks(self, num_workers=1, chunk_size=ADMISSION_CHUNK_TILES, total=None, lazy=False):
+        """ChunkedAdmission of the CPU the run's num_workers models use"""
+        cpu, _ = segformer_cost(self.model_options, num_workers)
+        scheduler = self._scheduler()
+        admit = lambda: scheduler.admit(self.stage, self.owner, cpu=cpu, memory_mb=0, on_wait=self.on_wait)
+        return ChunkedAdmission(admit, chunk_size, total, lazy)
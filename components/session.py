@@ -0,0 +1,8 @@
+import uuid
+import streamlit as st
+
+def session_owner():
+    """Stable id of this browser session, used to tag its background jobs and scheduler requests"""
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    return st.session_state.session_id
@@ -0,0 +1,58 @@
+import cv2
+import numpy as np
+from PIL import Image
+
+# Leading bytes of the formats tile servers return
+IMAGE_SIGNATURES = [
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF8', 'gif'),
+]
+FORMAT_EXTENSIONS = {'jpeg': '.jpg', 'png': '.png', 'webp': '.webp', 'gif': '.gif'}
+TILE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif')
+
+def sniff_image_format(data):
+    """Image format of raw bytes from their signature, or None if unrecognised"""
+    for signature, image_format in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return image_format
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+def tile_extension(data, default='.png'):
+    """File extension matching the actual encoding of tile bytes"""
+    return FORMAT_EXTENSIONS.get(sniff_image_format(data), default)
+
+def is_tile_file(name):
+    """Whether a file name is a captured tile image in any stored format"""
+    return name.lower().endswith(TILE_EXTENSIONS)
+
+def decode_tile_array(data, out=None, reduce=1):
+    """Decode tile bytes to an RGB uint8 array with OpenCV
+
+    reduce of 2, 4 or 8 decodes JPEGs directly at that fraction of full size.
+    If out is a preallocated (H, W, 3) uint8 array of the decoded shape, the
+    pixels are written into it instead of a new array.
+    """
+    flags = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+             4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}[reduce]
+    bgr = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+    if bgr is None:
+        raise ValueError("Undecodable tile image")
+    if out is not None and out.shape == bgr.shape:
+        return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB, dst=out)
+    return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+
+def load_tile_array(image_path, out=None, reduce=1):
+    """Read a tile file and decode it with decode_tile_array"""
+    with open(image_path, 'rb') as f:
+        return decode_tile_array(f.read(), out=out, reduce=reduce)
+
+def load_tile_image(image_path):
+    """Decode a tile into an RGB PIL image, using OpenCV's decoder and PIL as fallback"""
+    try:
+        return Image.fromarray(load_tile_array(image_path))
+    except Exception:
+        with Image.open(image_path) as image:
+            return image.convert('RGB')
@@ -0,0 +1,63 @@
+import os
+import time
+import shutil
+
+# Shared root: caches and cross-run stores (blank tile registry, zone rasters, change
+# masks, thumbnails, history, alerts) live here and are used by every workspace
+OUTPUT_ROOT = "output"
+WORKSPACES_DIR = os.path.join(OUTPUT_ROOT, "workspaces")
+# Workspaces untouched for this long are removed unless they belong to an active job
+WORKSPACE_MAX_AGE = 24 * 3600
+LAST_USED_FILE = ".last_used"
+
+def state_dir_name(state_name):
+    return state_name.replace(' ', '_')
+
+def state_tiles_dir(state_name, output_root=OUTPUT_ROOT):
+    """Directory of a state's captured tiles under an output root"""
+    return os.path.join(output_root, state_dir_name(state_name))
+
+def state_flooded_dir(state_name, output_root=OUTPUT_ROOT):
+    """Directory of a state's prediction outputs under an output root"""
+    return os.path.join(output_root, "flooded", state_dir_name(state_name))
+
+def workspace_root(workspace_id):
+    """Private output root of one session or job, laid out like the shared output/"""
+    return os.path.join(WORKSPACES_DIR, workspace_id)
+
+def touch_workspace(workspace_id):
+    """Create a workspace if needed and mark it as recently used"""
+    root = workspace_root(workspace_id)
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, LAST_USED_FILE), 'w') as f:
+        f.write(str(time.time()))
+    return root
+
+def workspace_last_used(workspace_id):
+    root = workspace_root(workspace_id)
+    marker = os.path.join(root, LAST_USED_FILE)
+    try:
+        return os.path.getmtime(marker if os.path.exists(marker) else root)
+    except OSError:
+        return None
+
+def remove_workspace(workspace_id):
+    """Delete one workspace; the shared caches and other workspaces are untouched"""
+    root = workspace_root(workspace_id)
+    if os.path.exists(root):
+        shutil.rmtree(root, ignore_errors=True)
+
+def prune_workspaces(active_ids=(), max_age=WORKSPACE_MAX_AGE):
+    """Remove workspaces idle for longer than max_age, except active_ids; returns their ids"""
+    if not os.path.isdir(WORKSPACES_DIR):
+        return []
+    removed = []
+    cutoff = time.time() - max_age
+    for workspace_id in os.listdir(WORKSPACES_DIR):
+        if workspace_id in active_ids:
+            continue
+        last_used = workspace_last_used(workspace_id)
+        if last_used is not None and last_used < cutoff:
+            remove_workspace(workspace_id)
+            removed.append(workspace_id)
+    return removed
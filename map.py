@@ -1,22 +1,46 @@
 import streamlit as st
 from streamlit_folium import st_folium
 import os
-import shutil
-from PIL import Image
 
 # Import our components
 from components.geo_map import (
     load_geodata, 
     display_state_map_and_tiles, 
-    capture_satellite_tiles, 
-    get_limited_tile_images
+    get_state_zones,
+    get_tile_images,
+    count_tile_images
 )
 from components.flood import (
-    process_flood_prediction,
+    flood_model_settings,
+    flood_run_settings,
     get_flooded_images,
+    count_flooded_images,
     cleanup_prediction_data,
     get_prediction_summary
 )
+from components.gallery import get_thumbnail, page_bounds
+from components.manifest import count_blank_tiles
+from components.flood_heatmap import FloodHeatmap
+from components.flood_tiles import FloodPyramid, pyramid_zoom_range, flood_tile_layer
+from components.flood_export import export_flood_cog
+from components.flood_vector import export_flood_polygons
+from components.flood_regions import FloodRegionTracker
+from components.flood_zones import ZonalFloodStats
+from components.flood_history import FloodHistoryRecorder, rising_tiles, latest_fractions
+from components.flood_alerts import (
+    AlertEngine, FileAlertSink, WebhookStubSink, build_rules, DEFAULT_ALERT_RULES
+)
+from components.flood_change import detect_flood_changes, MaskCacheSeeder
+from components.jobs import (
+    ACTIVE_STATES, get_job, cancel_job, list_jobs, submit_capture_job, submit_prediction_job, submit_batch_job
+)
+from components.progress import ProgressBus, format_eta
+from components.workspace import (
+    workspace_root, touch_workspace, remove_workspace, prune_workspaces, state_flooded_dir
+)
+from components.scheduler import RunAdmission
+from components.session import session_owner
+import folium
 
 # Add custom CSS to prevent unnecessary reruns
 st.markdown("""
@@ -40,42 +64,54 @@ def cached_load_geodata():
     """Cached version of geodata loading"""
     return load_geodata()
 
-def display_tile_images(tile_images, output_dir, columns=5, max_display=10):
-    """Display tile images in a grid layout"""
-    if not tile_images:
+def render_page_selector(key, total, page_size):
+    """Render a page selector and return the offset of the selected page"""
+    _, _, page_count = page_bounds(total, 1, page_size)
+    col_page, col_info = st.columns([1, 3])
+    with col_page:
+        page = st.number_input("Page", min_value=1, max_value=page_count, value=1, step=1, key=key)
+    page, offset, page_count = page_bounds(total, int(page), page_size)
+    with col_info:
+        st.write(f"**Showing {offset + 1}-{min(offset + page_size, total)} of {total}** (page {page} of {page_count})")
+    return offset
+
+def display_thumbnail(image_path, caption):
+    """Display the cached thumbnail of an image"""
+    thumb_path = get_thumbnail(image_path) if os.path.exists(image_path) else None
+    if thumb_path:
+        st.image(thumb_path, caption=caption, use_container_width=True)
+    else:
+        st.error(f"Error loading {os.path.basename(image_path)}")
+
+def display_tile_images(output_dir, columns=5, page_size=20):
+    """Display a page of tile thumbnails in a grid layout"""
+    total_tiles = count_tile_images(output_dir)
+    if total_tiles == 0:
         st.write("No tiles found")
         return
     
-    # Limit to max_display images
-    display_images = tile_images[:max_display]
-    st.write(f"**Showing {len(display_images)} of {len(tile_images)} tiles:**")
+    offset = render_page_selector("tiles_page", total_tiles, page_size)
+    # Only the tiles on the current page are listed and decoded
+    display_images = get_tile_images(output_dir, limit=page_size, offset=offset)
     
-    # Create 2x5 grid (2 rows of 5 columns each)
     for row in range(0, len(display_images), columns):
         cols = st.columns(columns)
-        for col_idx, tile_idx in enumerate(range(row, min(row + columns, len(display_images)))):
+        for col_idx, tile_name in enumerate(display_images[row:row + columns]):
             with cols[col_idx]:
-                tile_name = display_images[tile_idx]
-                tile_path = os.path.join(output_dir, tile_name)
-                if os.path.exists(tile_path):
-                    try:
-                        image = Image.open(tile_path)
-                        st.image(image, caption=tile_name.split('_')[1], use_container_width=True)
-                    except Exception as e:
-                        st.error(f"Error loading {tile_name}: {e}")
-    
-    if len(tile_images) > max_display:
-        st.info(f"... and {len(tile_images) - max_display} more tiles")
+                display_thumbnail(os.path.join(output_dir, tile_name), tile_name.split('_')[1])
 
-def display_flooded_images_section(state_name):
-    """Display section for flooded images"""
-    flooded_images = get_flooded_images(f"output/flooded/{state_name.replace(' ', '_')}")
+def display_flooded_images_section(flooded_dir, page_size=10):
+    """Display section for flooded images, most flooded first"""
+    total_flooded = count_flooded_images(flooded_dir)
     
-    if not flooded_images:
+    if total_flooded == 0:
         st.warning("No flooded areas detected")
         return
     
-    st.success(f"🌊 Found {len(flooded_images)} images with significant flooding!")
+    st.success(f"🌊 Found {total_flooded} images with significant flooding!")
+    
+    offset = render_page_selector("flooded_page", total_flooded, page_size)
+    flooded_images = get_flooded_images(flooded_dir, limit=page_size, offset=offset, sort='water_desc')
     
     # Display flooded images in grid format
     for row_start in range(0, len(flooded_images), 5):
@@ -86,27 +122,136 @@ def display_flooded_images_section(state_name):
         cols = st.columns(5)
         for idx, img_info in enumerate(row_images):
             with cols[idx]:
-                if os.path.exists(img_info['original_path']):
-                    original_img = Image.open(img_info['original_path'])
-                    st.image(original_img, caption=f"Area {row_start + idx + 1}", use_container_width=True)
+                display_thumbnail(img_info['original_path'], f"Area {offset + row_start + idx + 1}")
         
         # Prediction images row
         st.write("**Flood Predictions:**")
         cols = st.columns(5)
         for idx, img_info in enumerate(row_images):
             with cols[idx]:
-                if os.path.exists(img_info['prediction_path']):
-                    pred_img = Image.open(img_info['prediction_path'])
-                    st.image(pred_img, caption="Flood Zones", use_container_width=True)
+                water = img_info.get('water_percentage')
+                display_thumbnail(
+                    img_info['prediction_path'],
+                    f"Flood Zones ({water:.0f}% water)" if water is not None else "Flood Zones"
+                )
         
         if row_start + 5 < len(flooded_images):
             st.markdown("---")
 
+def session_output_root():
+    """This session's private output root; shared caches stay under output/"""
+    return workspace_root(session_owner())
+
+def start_session_run():
+    """Mark this session's workspace as in use, pruning workspaces of long-gone sessions"""
+    active_owners = {job['owner'] for job in list_jobs() if job['status'] in ACTIVE_STATES}
+    prune_workspaces(active_ids=active_owners | {session_owner()})
+    return touch_workspace(session_owner())
+
+# Maximum widget updates per second for synchronous runs on this page
+UI_PROGRESS_RATE = 4.0
+# Seconds between redraws of a background job's progress section
+JOB_POLL_INTERVAL = 1.0
+
+def describe_progress(event):
+    """One status line with stage, counts, throughput and ETA of a progress event"""
+    text = f"{event['stage'].replace('_', ' ').capitalize()}: {event['fraction'] * 100:.1f}%"
+    if event['total'] > 1:
+        text += f" ({event['done']:.0f}/{event['total']:.0f})"
+    if event['rate']:
+        text += f", {event['rate']:.1f}/s, ETA {format_eta(event['eta'])}"
+    return text
+
+def render_job_progress(job, label):
+    """Progress bar and cancel button for a queued or running background job"""
+    st.progress(min(job['progress'], 1.0))
+    if job['status'] == 'queued':
+        st.text(f"{label}: queued, waiting for a free worker")
+    elif job['waiting_ahead'] is not None:
+        st.text(f"{label}: waiting for model capacity, {job['waiting_ahead']} runs ahead")
+    elif job['event']:
+        st.text(f"{label} · {describe_progress(job['event'])}")
+        finished_stages = job['event']['stage_timings']
+        if finished_stages:
+            st.caption(" · ".join(f"{stage.replace('_', ' ')} {seconds:.1f}s" for stage, seconds in finished_stages.items()))
+        # Batch jobs publish {state: progress} as the event detail, shown as one bar per state
+        state_progress = job['event']['detail']
+        if isinstance(state_progress, dict):
+            for state, fraction in state_progress.items():
+                st.progress(min(fraction, 1.0), text=f"{state}: {fraction * 100:.0f}%")
+    else:
+        st.text(f"{label}: {job['progress'] * 100:.1f}%")
+    if st.button("⏹️ Cancel", key=f"cancel_{job['job_id']}"):
+        cancel_job(job['job_id'])
+        st.rerun()
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def poll_job_progress(job_id, label):
+    """Redraw only this job's progress while it runs; the whole page reruns once it ends"""
+    job = get_job(job_id)
+    if job is None or job['status'] not in ACTIVE_STATES:
+        st.rerun()
+    render_job_progress(job, label)
+
+def start_prediction_job(df, state_name, output_dir, flooded_dir):
+    """Submit a background prediction feeding the incremental map, region, zone and alert consumers"""
+    start_session_run()
+    
+    # Water fractions are folded into the map layer as each tile finishes
+    heatmap = FloodHeatmap()
+    
+    # Masks are built into the overlay tile pyramid as they land
+    pyramid = FloodPyramid(flooded_dir)
+    
+    # Connected flood regions are labelled across tiles as results stream in
+    regions = FloodRegionTracker()
+    
+    # Flooded area per district, reduced against cached zone rasters
+    zonal_stats = ZonalFloodStats(get_state_zones(df, state_name))
+    
+    # Alert rules are evaluated per tile; rises are measured against the previous run
+    alert_engine = AlertEngine(
+        build_rules(DEFAULT_ALERT_RULES, zonal_stats=zonal_stats, baseline=latest_fractions(state_name)),
+        [FileAlertSink(), WebhookStubSink()],
+        state_name=state_name
+    )
+    
+    # Per-tile water fractions are appended to the cross-run time series
+    history = FloodHistoryRecorder(state_name)
+    
+    # Masks are kept by content hash so the first change detection does not segment the tiles again
+    mask_cache = MaskCacheSeeder(output_dir)
+    
+    def on_tile_result(prediction_info):
+        heatmap.add_result(prediction_info)
+        pyramid.add_result(prediction_info)
+        regions.add_result(prediction_info)
+        zonal_stats.add_result(prediction_info)
+        alert_engine.add_result(prediction_info)
+        history.add_result(prediction_info)
+        mask_cache.add_result(prediction_info)
+    
+    def on_finish():
+        pyramid.close()
+        history.close()
+    
+    st.session_state.flood_heatmap = heatmap
+    st.session_state.flood_heatmap_state = state_name
+    st.session_state.prediction_aggregates = {
+        'regions': regions, 'zonal_stats': zonal_stats, 'alert_engine': alert_engine
+    }
+    st.session_state.prediction_job_id = submit_prediction_job(
+        output_dir, state_name, owner=session_owner(), result_callback=on_tile_result, on_finish=on_finish,
+        flooded_dir=flooded_dir, **flood_run_settings()
+    )
+
 def reset_analysis_state():
     """Reset all analysis-related session state"""
     keys_to_remove = [
         'analysis_started', 'analysis_complete', 'show_tiles',
-        'current_output_dir', 'prediction_complete', 'show_predictions'
+        'current_output_dir', 'current_flooded_dir', 'prediction_complete', 'show_predictions',
+        'flood_heatmap', 'flood_heatmap_state', 'change_detection_started',
+        'capture_job_id', 'prediction_job_id', 'batch_job_id', 'prediction_aggregates'
     ]
     
     for key in keys_to_remove:
@@ -153,14 +298,66 @@ def render_map_page():
                 st.session_state.selected_state = selected_state
                 st.session_state.tiles_range = tiles_range
                 # Clear previous states
-                for key in ['analysis_complete', 'show_tiles', 'prediction_complete', 'show_predictions']:
+                for key in [
+                    'analysis_complete', 'show_tiles', 'prediction_complete', 'show_predictions', 'prediction_job_id'
+                ]:
                     if key in st.session_state:
                         del st.session_state[key]
     
+    # Several states captured and segmented as one deduplicated batch
+    with st.expander("🇮🇳 Multi-State Batch Analysis"):
+        batch_states = st.multiselect("States", state_names, key="batch_states")
+        batch_tiles_range = st.slider(
+            "Batch Tile Range", min_value=10, max_value=2000, value=10, step=10, key="batch_tiles_slider"
+        )
+        if st.button("🚀 Run Batch", key="batch_btn", disabled=not batch_states):
+            run_settings = flood_run_settings()
+            st.session_state.batch_job_id = submit_batch_job(
+                df, batch_states, batch_tiles_range, owner=session_owner(),
+                num_workers=run_settings.pop('num_workers'), model_options=run_settings.pop('model_options'),
+                prediction_options=run_settings, output_root=start_session_run()
+            )
+        
+        batch_job = get_job(st.session_state['batch_job_id']) if st.session_state.get('batch_job_id') else None
+        if batch_job and batch_job['status'] in ACTIVE_STATES:
+            poll_job_progress(batch_job['job_id'], "Batch")
+        elif batch_job and batch_job['status'] == 'cancelled':
+            st.warning("Batch was cancelled")
+        elif batch_job and batch_job['status'] == 'failed':
+            st.error(f"Batch failed: {batch_job['error']}")
+        elif batch_job:
+            batch_result = batch_job['result']
+            if 'error' in batch_result:
+                st.error(f"Batch failed: {batch_result['error']}")
+            else:
+                st.text(
+                    f"✅ Batch complete: {batch_result['planned_tiles']} unique tiles, "
+                    f"{batch_result['duplicate_tiles_skipped']} duplicates skipped "
+                    f"({batch_result['border_tiles_shared']} shared across state borders), "
+                    f"{batch_result['outside_cells_skipped']} grid cells outside the state outlines"
+                )
+                st.dataframe([
+                    {
+                        'State': state,
+                        'Tiles': summary['total_images'],
+                        'Flooded Tiles': summary['total_flooded'],
+                        'Flood %': round(summary['flooded_percentage'], 1),
+                        'Mean Water %': round(summary['mean_water_percentage'], 1)
+                    }
+                    for state, summary in batch_result['states'].items()
+                ], use_container_width=True)
+    
     # Map display section
     if selected_state:
         st.markdown("### State Map View")
-        map_obj, _ = display_state_map_and_tiles(df, selected_state, 10)
+        map_obj, _ = display_state_map_and_tiles(df, selected_state, 10, output_root=session_output_root())
+        if map_obj and st.session_state.get('flood_heatmap_state') == selected_state:
+            st.session_state.flood_heatmap.add_to_map(map_obj)
+            flooded_dir = state_flooded_dir(selected_state, session_output_root())
+            zoom_range = pyramid_zoom_range(flooded_dir)
+            if zoom_range:
+                flood_tile_layer(flooded_dir, zoom_range).add_to(map_obj)
+            folium.LayerControl().add_to(map_obj)
         if map_obj:
             # Reduce map height and center it
             col_map1, col_map2, col_map3 = st.columns([0.1, 0.8, 0.1])
@@ -171,40 +368,41 @@ def render_map_page():
     
     st.markdown('<div class="indian-flag-divider"></div>', unsafe_allow_html=True)
         
-    # Analysis progress section
+    # Analysis progress section: capture runs as a background job the page polls
     if st.session_state.get('analysis_started', False):
-        st.markdown("### Analysis Progress")
-        
-        progress_container = st.container()
-        
-        map_obj, state_info = display_state_map_and_tiles(
+        _, state_info = display_state_map_and_tiles(
             df, 
             st.session_state.selected_state, 
-            st.session_state.tiles_range
+            st.session_state.tiles_range,
+            output_root=start_session_run()
         )
-        
         if state_info:
-            with progress_container:
-                progress_bar = st.progress(0)
-                status_text = st.empty()
-                
-                def update_progress(progress):
-                    progress_bar.progress(progress)
-                    status_text.text(f"Processing: {progress * 100:.1f}%")
-                
-                # Capture satellite tiles
-                successful_tiles, total_tiles = capture_satellite_tiles(
-                    state_info['bounds'],
-                    state_info['tile_params'],
-                    state_info['output_dir'],
-                    state_info['state_name'],
-                    progress_callback=update_progress
+            st.session_state.capture_job_id = submit_capture_job(state_info, owner=session_owner())
+            st.session_state.current_output_dir = state_info['output_dir']
+            st.session_state.current_flooded_dir = state_info['flooded_dir']
+            st.session_state.current_state_name = state_info['state_name']
+        st.session_state.analysis_started = False
+    
+    capture_job = get_job(st.session_state['capture_job_id']) if st.session_state.get('capture_job_id') else None
+    if capture_job:
+        st.markdown("### Analysis Progress")
+        
+        if capture_job['status'] in ACTIVE_STATES:
+            poll_job_progress(capture_job['job_id'], "Processing")
+        elif capture_job['status'] == 'completed':
+            successful_tiles, total_tiles = capture_job['result']
+            st.text(f"✅ Complete: {successful_tiles}/{total_tiles} tiles extracted")
+            blank_counts = count_blank_tiles(st.session_state.current_output_dir)
+            if blank_counts:
+                st.info(
+                    f"Skipped {sum(blank_counts.values())} no-data tiles: "
+                    + ", ".join(f"{count} {reason.replace('_', ' ')}" for reason, count in blank_counts.items())
                 )
-                
-                status_text.text(f"✅ Complete: {successful_tiles}/{total_tiles} tiles extracted")
-                st.session_state.analysis_complete = True
-                st.session_state.current_output_dir = state_info['output_dir']
-                st.session_state.current_state_name = state_info['state_name']
+            st.session_state.analysis_complete = True
+        elif capture_job['status'] == 'cancelled':
+            st.warning("Tile capture was cancelled")
+        else:
+            st.error(f"Tile capture failed: {capture_job['error']}")
     
     # Post-analysis controls
     if st.session_state.get('analysis_complete', False):
@@ -212,7 +410,7 @@ def render_map_page():
         st.markdown("### 🛠️ Analysis Tools")
         
         # Action buttons in columns
-        col_tiles, col_predict, col_reset = st.columns(3)
+        col_tiles, col_predict, col_change, col_reset = st.columns(4)
         
         with col_tiles:
             view_tiles_btn = st.button("📁 View Extracted Tiles", key="view_tiles_btn", use_container_width=True)
@@ -220,10 +418,16 @@ def render_map_page():
         with col_predict:
             predict_btn = st.button("🤖 Flood Prediction", key="predict_btn", use_container_width=True)
         
+        with col_change:
+            change_btn = st.button("🔁 Detect Changes", key="change_btn", use_container_width=True)
+        
         with col_reset:
             if st.button("🗑️ Reset Analysis", key="reset_btn", use_container_width=True):
-                if os.path.exists("output"):
-                    shutil.rmtree("output")
+                # Only this session's jobs and workspace are cleared; other users and the shared caches are untouched
+                for key in ['capture_job_id', 'prediction_job_id', 'batch_job_id']:
+                    if st.session_state.get(key):
+                        cancel_job(st.session_state[key])
+                remove_workspace(session_owner())
                 reset_analysis_state()
                 st.rerun()
         
@@ -232,37 +436,93 @@ def render_map_page():
             st.session_state.show_tiles = not st.session_state.get('show_tiles', False)
         
         if predict_btn:
-            st.session_state.prediction_started = True
+            start_prediction_job(
+                df, st.session_state.current_state_name,
+                st.session_state.current_output_dir, st.session_state.current_flooded_dir
+            )
+            for key in ['prediction_complete', 'show_predictions']:
+                if key in st.session_state:
+                    del st.session_state[key]
+        
+        if change_btn:
+            st.session_state.change_detection_started = True
     
     # Extracted tiles section with expander
     if st.session_state.get('show_tiles', False) and st.session_state.get('analysis_complete', False):
-        tile_images = get_limited_tile_images(st.session_state.current_output_dir)
-        
         with st.expander("Extracted Satellite Tiles", expanded=True):
-            display_tile_images(tile_images, st.session_state.current_output_dir)
+            display_tile_images(st.session_state.current_output_dir)
     
-    # Prediction progress section
-    if st.session_state.get('prediction_started', False):
+    # Change detection section: only tiles whose imagery changed are re-segmented
+    if st.session_state.get('change_detection_started', False):
         st.markdown('<div class="indian-flag-divider"></div>', unsafe_allow_html=True)
-        st.markdown("### 🌊 Flood Prediction Analysis")
+        st.markdown("### 🔁 Change Detection")
         
-        progress_container = st.container()
+        change_progress = st.progress(0)
+        change_status = st.empty()
         
-        with progress_container:
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            
-            def update_prediction_progress(progress):
-                progress_bar.progress(progress)
-                status_text.text(f"Analyzing images: {progress * 100:.1f}%")
-            
-            # Process flood prediction
-            prediction_result = process_flood_prediction(
-                st.session_state.current_output_dir,
-                st.session_state.current_state_name,
-                progress_callback=update_prediction_progress
-            )
+        def show_change_progress(event):
+            change_progress.progress(min(event.fraction, 1.0))
+            change_status.text(describe_progress(event.to_dict()))
+        
+        change_bus = ProgressBus()
+        change_bus.subscribe(show_change_progress, max_rate=UI_PROGRESS_RATE)
+        
+        def show_capacity_wait(waiting_ahead):
+            change_status.text(f"Waiting for model capacity, {waiting_ahead} runs ahead")
+        
+        change_result = detect_flood_changes(
+            st.session_state.current_output_dir,
+            st.session_state.current_state_name,
+            progress_callback=change_bus.stage_callback('changes', 'comparing_tiles'),
+            flooded_dir=st.session_state.current_flooded_dir,
+            admission=RunAdmission(session_owner(), flood_model_settings(), on_wait=show_capacity_wait),
+            output_root=session_output_root()
+        )
+        st.session_state.change_detection_started = False
+        
+        if 'error' in change_result:
+            st.error(f"Change detection failed: {change_result['error']}")
+        else:
+            change_status.text("✅ Change detection complete!")
+            col_c1, col_c2, col_c3, col_c4 = st.columns(4)
+            with col_c1:
+                st.metric("Total Tiles", change_result['total_images'])
+            with col_c2:
+                st.metric("Re-segmented", change_result['recomputed'])
+            with col_c3:
+                st.metric("Reused From Cache", change_result['reused'])
+            with col_c4:
+                st.metric("Changed Imagery", change_result['changed_imagery'])
             
+            compared = [c for c in change_result['changes'] if c['delta'] is not None][:20]
+            if compared:
+                st.dataframe([
+                    {
+                        'Tile': c['image_name'],
+                        'Imagery': c['status'],
+                        'Previous Water %': round(c['previous_water_percentage'], 1),
+                        'Current Water %': round(c['water_percentage'], 1),
+                        'Change': f"{c['delta']:+.1f}%"
+                    }
+                    for c in compared
+                ], use_container_width=True)
+            else:
+                st.info("No previous run of this state to compare against yet; this run is now the baseline.")
+    
+    # Prediction progress section: a fragment polls the background job while it runs
+    prediction_job = get_job(st.session_state['prediction_job_id']) if st.session_state.get('prediction_job_id') else None
+    if prediction_job:
+        st.markdown('<div class="indian-flag-divider"></div>', unsafe_allow_html=True)
+        st.markdown("### 🌊 Flood Prediction Analysis")
+        
+        if prediction_job['status'] in ACTIVE_STATES:
+            poll_job_progress(prediction_job['job_id'], "Analyzing images")
+        elif prediction_job['status'] == 'cancelled':
+            st.warning("Flood prediction was cancelled")
+        elif prediction_job['status'] == 'failed':
+            st.error(f"Prediction failed: {prediction_job['error']}")
+        else:
+            prediction_result = prediction_job['result']
             if 'error' in prediction_result:
                 st.error(f"Prediction failed: {prediction_result['error']}")
             else:
@@ -270,7 +530,13 @@ def render_map_page():
                 total_flooded = prediction_result['total_flooded']
                 flooded_percentage = prediction_result['flooded_percentage']
                 
-                status_text.text(f"✅ Analysis Complete!")
+                st.text("✅ Analysis Complete!")
+                
+                if prediction_result.get('blank_tiles'):
+                    st.info(f"{sum(prediction_result['blank_tiles'].values())} blank tiles were skipped before analysis")
+                
+                if prediction_result.get('write_errors'):
+                    st.warning(f"{len(prediction_result['write_errors'])} output files could not be saved")
                 
                 # Display summary
                 col_summary1, col_summary2, col_summary3 = st.columns(3)
@@ -284,22 +550,121 @@ def render_map_page():
                 with col_summary3:
                     st.metric("Flood Percentage", f"{flooded_percentage:.1f}%")
                 
-                st.session_state.prediction_complete = True
-                st.session_state.prediction_started = False
+                # A new browser session only has the job's summary, not the in-memory aggregates
+                aggregates = st.session_state.get('prediction_aggregates') or {}
+                
+                if aggregates and aggregates['alert_engine'].alerts:
+                    st.markdown("#### 🚨 Alerts")
+                    for alert in aggregates['alert_engine'].alerts:
+                        st.error(alert['message'])
+                
+                district_stats = aggregates['zonal_stats'].summary() if aggregates else []
+                if district_stats:
+                    st.markdown("#### Flooded Area by District")
+                    st.dataframe([
+                        {
+                            'District': row['zone'],
+                            'Water Area (km²)': round(row['water_km2'], 2),
+                            'Analysed Area (km²)': round(row['observed_km2'], 2),
+                            'Water %': round(row['water_percentage'], 1),
+                            'Tiles': row['tiles']
+                        }
+                        for row in district_stats
+                    ], use_container_width=True)
+                
+                largest_regions = aggregates['regions'].regions(limit=10, min_area_km2=0.01) if aggregates else []
+                if largest_regions:
+                    st.markdown("#### Largest Connected Flood Regions")
+                    st.dataframe([
+                        {
+                            'Region': idx + 1,
+                            'Area (km²)': round(region['area_km2'], 2),
+                            'Tiles': region['tile_count'],
+                            'Bounds (W, S, E, N)': ", ".join(f"{v:.4f}" for v in region['bbox'])
+                        }
+                        for idx, region in enumerate(largest_regions)
+                    ], use_container_width=True)
+                
+                rising = rising_tiles(0.1, state_name=st.session_state.current_state_name, limit=10)
+                if rising:
+                    st.markdown("#### Rising Water Since Last Run")
+                    st.dataframe([
+                        {
+                            'Tile (z/x/y)': f"{row['z']}/{row['x']}/{row['y']}",
+                            'Previous Water %': round(row['previous_fraction'] * 100, 1),
+                            'Current Water %': round(row['water_fraction'] * 100, 1),
+                            'Change': f"+{row['delta'] * 100:.1f}%"
+                        }
+                        for row in rising
+                    ], use_container_width=True)
                 
-                # Auto-show predictions if flooded areas found
-                if total_flooded > 0:
-                    st.session_state.show_predictions = True
+                # Auto-show predictions once, when the run first completes
+                if not st.session_state.get('prediction_complete', False):
+                    st.session_state.prediction_complete = True
+                    st.session_state.show_predictions = total_flooded > 0
     
     # Flood predictions section with expander
     if st.session_state.get('prediction_complete', False):
         
-        # Show predictions button
-        view_pred_btn = st.button("🌊 View Flood Predictions", key="view_predictions_btn", use_container_width=True)
+        col_view, col_export, col_vector = st.columns(3)
+        
+        with col_view:
+            # Show predictions button
+            view_pred_btn = st.button("🌊 View Flood Predictions", key="view_predictions_btn", use_container_width=True)
+        
+        with col_export:
+            export_btn = st.button("🗺️ Export GeoTIFF", key="export_cog_btn", use_container_width=True)
+        
+        with col_vector:
+            vector_btn = st.button("📐 Export Flood Polygons", key="export_polygons_btn", use_container_width=True)
+        
         if view_pred_btn:
             st.session_state.show_predictions = not st.session_state.get('show_predictions', False)
         
+        if export_btn:
+            flooded_dir = st.session_state.current_flooded_dir
+            with st.spinner("Writing Cloud-Optimized GeoTIFF..."):
+                try:
+                    cog_path = export_flood_cog(flooded_dir)
+                except Exception as e:
+                    st.error(f"GeoTIFF export failed: {e}")
+                    cog_path = None
+            if cog_path:
+                st.success(f"Flood mask exported to {cog_path}")
+                with open(cog_path, 'rb') as cog_file:
+                    st.download_button(
+                        "⬇️ Download GeoTIFF",
+                        cog_file,
+                        file_name=os.path.basename(cog_path),
+                        mime="image/tiff",
+                        key="download_cog_btn"
+                    )
+            else:
+                st.warning("No flood masks available to export")
+        
+        if vector_btn:
+            flooded_dir = st.session_state.current_flooded_dir
+            with st.spinner("Vectorising flood extents..."):
+                try:
+                    polygons_path, polygon_count = export_flood_polygons(flooded_dir)
+                except Exception as e:
+                    st.error(f"Polygon export failed: {e}")
+                    polygons_path, polygon_count = None, 0
+            if polygons_path:
+                st.success(f"{polygon_count} flood extents exported to {polygons_path}")
+                with open(polygons_path, 'rb') as polygons_file:
+                    st.download_button(
+                        "⬇️ Download GeoJSON",
+                        polygons_file,
+                        file_name=os.path.basename(polygons_path),
+                        mime="application/geo+json",
+                        key="download_polygons_btn"
+                    )
+            else:
+                st.warning("No flood masks available to export")
+        
         # Expandable section for predicted images
         if st.session_state.get('show_predictions', False):
             with st.expander("🌊 Flooded Areas Detection", expanded=True):
-                display_flooded_images_section(st.session_state.current_state_name)
\ No newline at end of file
+                display_flooded_images_section(st.session_state.current_flooded_dir)
+
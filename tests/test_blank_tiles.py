@@ -0,0 +1,53 @@
+import io
+import pytest
+
+np = pytest.importorskip("numpy")
+from PIL import Image, ImageDraw
+from components.blank_tiles import BlankTileDetector
+
+def encode_jpeg(image, quality=75):
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+def placeholder_tile(quality=75):
+    """A flat grey tile with a line of text, like the provider's "Map data not yet available" placeholder"""
+    image = Image.new('RGB', (256, 256), (204, 204, 204))
+    draw = ImageDraw.Draw(image)
+    draw.text((40, 110), "Map data not yet available", fill=(90, 90, 90))
+    draw.text((70, 130), "Try a lower zoom level", fill=(90, 90, 90))
+    return encode_jpeg(image, quality)
+
+def water_tile():
+    """Calm dark water shading smoothly towards the shore, flat along each row like the placeholder"""
+    shade = np.linspace(30, 90, 256, dtype=np.float32)[:, None, None]
+    pixels = np.broadcast_to(shade + np.array([10, 20, 40], dtype=np.float32), (256, 256, 3))
+    return encode_jpeg(Image.fromarray(pixels.astype(np.uint8)))
+
+def test_placeholder_with_text_is_not_low_variance():
+    """Text lifts the placeholder above the low-variance threshold, so registration is what catches it"""
+    detector = BlankTileDetector(registry_path=None)
+    assert detector.classify(placeholder_tile()) is None
+
+def test_probed_placeholder_is_tagged(tmp_path):
+    geo_map = pytest.importorskip("components.geo_map")
+    detector = BlankTileDetector(registry_path=str(tmp_path / "blank_tiles.json"))
+    assert geo_map.probe_provider_placeholder(detector, 17, fetch=lambda x, y, z: placeholder_tile())
+
+    assert detector.check(placeholder_tile()) == 'known_placeholder'
+    # The same placeholder encoded differently still matches its perceptual signature
+    assert detector.check(placeholder_tile(quality=90)) == 'placeholder_phash'
+    assert detector.check(water_tile()) is None
+
+    # The registration survives a restart and the zoom level is not probed again
+    reloaded = BlankTileDetector(registry_path=str(tmp_path / "blank_tiles.json"))
+    assert 17 in reloaded.probed_zooms
+    assert reloaded.classify(placeholder_tile(quality=90)) == 'placeholder_phash'
+
+def test_probe_returning_imagery_registers_nothing():
+    geo_map = pytest.importorskip("components.geo_map")
+    detector = BlankTileDetector(registry_path=None)
+    responses = iter([water_tile(), placeholder_tile()])
+    assert geo_map.probe_provider_placeholder(detector, 17, fetch=lambda x, y, z: next(responses))
+    assert not detector.placeholder_signatures
+    assert detector.classify(placeholder_tile()) is None
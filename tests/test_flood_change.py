@@ -0,0 +1,56 @@
+import os
+import pytest
+
+np = pytest.importorskip("numpy")
+flood_change = pytest.importorskip("components.flood_change")
+from PIL import Image
+
+def write_tile(directory, name, shade):
+    os.makedirs(directory, exist_ok=True)
+    Image.new('RGB', (16, 16), (shade, shade, shade)).save(os.path.join(directory, name))
+
+def water_mask(fraction, size=16):
+    mask = np.zeros((size, size), dtype=np.uint8)
+    mask[:int(size * fraction)] = 4
+    return mask
+
+@pytest.fixture
+def no_model(monkeypatch):
+    """Fail the test if change detection tries to segment anything"""
+    def initialize_flood_model(**options):
+        raise AssertionError("the model should not be loaded")
+    monkeypatch.setattr(flood_change, 'initialize_flood_model', initialize_flood_model)
+
+def test_seeded_masks_and_zxy_baseline(tmp_path, no_model):
+    """Prediction masks seed the cache, and the baseline follows z/x/y across capture grids"""
+    tiles_dir, cache_dir, workspace = str(tmp_path / "tiles"), str(tmp_path / "cache"), str(tmp_path / "workspace")
+    write_tile(tiles_dir, "tile_0_0_z12_x10_y20.png", 50)
+
+    seeder = flood_change.MaskCacheSeeder(tiles_dir, cache_dir=cache_dir)
+    seeder.add_result({'image_name': "tile_0_0_z12_x10_y20.png", 'prediction': water_mask(0.25)})
+    first = flood_change.detect_flood_changes(
+        tiles_dir, "State", cache_dir=cache_dir, output_root=workspace, flooded_dir=str(tmp_path / "flooded")
+    )
+    assert (first['recomputed'], first['reused'], first['new_tiles']) == (0, 1, 1)
+    assert os.path.isdir(flood_change.change_state_dir(workspace))
+
+    # A denser grid gives the same z/x/y tile other grid indices, and its imagery changed
+    recaptured_dir = str(tmp_path / "recaptured")
+    write_tile(recaptured_dir, "tile_3_5_z12_x10_y20.png", 90)
+    flood_change.MaskCacheSeeder(recaptured_dir, cache_dir=cache_dir).add_result(
+        {'image_name': "tile_3_5_z12_x10_y20.png", 'prediction': water_mask(0.75)}
+    )
+    second = flood_change.detect_flood_changes(
+        recaptured_dir, "State", cache_dir=cache_dir, output_root=workspace, flooded_dir=str(tmp_path / "flooded")
+    )
+    change = second['changes'][0]
+    assert change['status'] == 'changed'
+    assert change['delta'] == pytest.approx(50.0)
+    assert os.path.basename(change['change_path']) == "change_z12_x10_y20.png"
+
+def test_mask_cache_key_separates_mode_and_backend():
+    keys = {
+        flood_change.mask_cache_key({'mode': mode, 'backend': backend})
+        for mode in ('default', 'cpu_optimized') for backend in ('pytorch', 'onnx')
+    }
+    assert len(keys) == 4
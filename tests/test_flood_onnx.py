@@ -0,0 +1,54 @@
+import pytest
+
+def test_onnx_export_matches_pytorch(tmp_path):
+    """A small random Segformer exported to ONNX gives the same logits at an input size it was not exported at"""
+    torch = pytest.importorskip("torch")
+    pytest.importorskip("onnxruntime")
+    transformers = pytest.importorskip("transformers")
+    from components.flood_onnx import export_segformer_onnx, create_onnx_session, OnnxSegformer
+
+    config = transformers.SegformerConfig(
+        num_labels=8,
+        depths=[1, 1, 1, 1],
+        hidden_sizes=[8, 16, 32, 64],
+        num_attention_heads=[1, 1, 2, 2],
+        decoder_hidden_size=32
+    )
+    torch.manual_seed(0)
+    model = transformers.SegformerForSemanticSegmentation(config).eval()
+    onnx_path = export_segformer_onnx(model, str(tmp_path / "tiny.onnx"), image_size=(64, 64))
+    onnx_model = OnnxSegformer(create_onnx_session(onnx_path))
+
+    pixel_values = torch.randn(2, 3, 96, 128)
+    with torch.inference_mode():
+        expected = model(pixel_values=pixel_values).logits
+    actual = onnx_model(pixel_values=pixel_values).logits
+
+    assert actual.shape == expected.shape
+    assert torch.allclose(actual, expected, atol=1e-3)
+    assert (actual.argmax(dim=1) == expected.argmax(dim=1)).float().mean() > 0.99
+
+def test_onnx_backend_parity_with_checkpoint(tmp_path):
+    """The ONNX backend reproduces the PyTorch checkpoint's masks on sample tiles"""
+    pytest.importorskip("onnxruntime")
+    transformers = pytest.importorskip("transformers")
+    np = pytest.importorskip("numpy")
+    Image = pytest.importorskip("PIL.Image")
+    flood = pytest.importorskip("components.flood")
+    try:
+        transformers.SegformerForSemanticSegmentation.from_pretrained(flood.MODEL_NAME, local_files_only=True)
+    except OSError:
+        pytest.skip("Segformer checkpoint is not cached locally")
+
+    rng = np.random.default_rng(0)
+    sample = []
+    for idx in range(2):
+        path = tmp_path / f"tile_{idx}.png"
+        Image.fromarray(rng.integers(0, 255, (256, 256, 3), dtype=np.uint8)).save(path)
+        sample.append(str(path))
+
+    report = flood.check_onnx_parity(sample, sample_size=2)
+    assert 'error' not in report, report.get('error')
+    assert report['sample_size'] == 2
+    assert report['shapes_match']
+    assert report['pixel_agreement'] > 0.98
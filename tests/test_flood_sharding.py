@@ -0,0 +1,34 @@
+import pytest
+
+flood = pytest.importorskip("components.flood")
+
+def test_fallback_keeps_the_callers_thread_settings(tmp_path, monkeypatch):
+    """Shards re-run in this process load the model with the caller's options, not the per-worker thread split"""
+    def broken_pool(*args, **kwargs):
+        raise OSError("cannot start workers")
+
+    loaded = []
+    monkeypatch.setattr(flood, 'ProcessPoolExecutor', broken_pool)
+    monkeypatch.setattr(flood, 'initialize_flood_model', lambda **options: loaded.append(options) or (None, None, None))
+
+    results, _ = flood.run_sharded_prediction(
+        ["tile_0_0_z12_x1_y1.png"], str(tmp_path), str(tmp_path), num_workers=4, model_options={'mode': 'default'}
+    )
+    assert results is None
+    assert loaded == [{'mode': 'default'}]
+
+def test_shard_results_carry_no_images(tmp_path, monkeypatch):
+    np = pytest.importorskip("numpy")
+    from PIL import Image
+
+    def process_single_tile(image_file, input_dir, flooded_dir, processor, model, device, writer=None):
+        mask = np.zeros((8, 8), dtype=np.uint8)
+        return flood.record_tile_prediction(image_file, mask, Image.new('RGB', (8, 8)), flooded_dir, writer=writer)
+
+    monkeypatch.setattr(flood, 'process_single_tile', process_single_tile)
+    monkeypatch.setattr(flood, '_worker_model', ('processor', 'model', 'cpu'))
+    results, write_errors = flood._process_shard(["tile_0_0_z12_x1_y1.png"], str(tmp_path), str(tmp_path))
+    info, _ = results[0]
+    assert info['original_image'] is None and info['prediction_viz'] is None
+    assert info['prediction'].shape == (8, 8)
+    assert write_errors == []
@@ -0,0 +1,26 @@
+import os
+import threading
+import pytest
+
+np = pytest.importorskip("numpy")
+flood_tiles = pytest.importorskip("components.flood_tiles")
+
+def test_add_mask_does_not_wait_for_parent_rebuild(tmp_path):
+    """A flush triggered from the result callback is queued; close() is what waits for it"""
+    pyramid = flood_tiles.FloodPyramid(str(tmp_path), min_zoom=9, tile_size=8, flush_every=1)
+    release = threading.Event()
+    build_parent = pyramid._build_parent
+
+    def slow_build_parent(*tile):
+        release.wait(5)
+        build_parent(*tile)
+
+    pyramid._build_parent = slow_build_parent
+    water = np.full((8, 8), flood_tiles.WATER_CLASS, dtype=np.uint8)
+    pyramid.add_mask(10, 4, 6, water)
+    assert not os.path.exists(pyramid.tile_path(9, 2, 3))
+
+    release.set()
+    pyramid.close()
+    parent = flood_tiles.read_class_tile(pyramid.tile_path(9, 2, 3), 8)
+    assert (parent[:4, :4] == flood_tiles.WATER_CLASS).all()
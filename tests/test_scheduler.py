@@ -0,0 +1,56 @@
+import threading
+from components.scheduler import StageScheduler, ChunkedAdmission, RunAdmission
+
+def run_owner(scheduler, owner, chunks, order):
+    """Process chunks one admission at a time, recording the owner of each admitted chunk"""
+    admit = lambda: scheduler.admit('segformer', owner, cpu=4, memory_mb=0)
+    with ChunkedAdmission(admit, chunk_size=1, total=chunks) as admission:
+        for _ in range(chunks):
+            order.append(owner)
+            admission.step()
+
+def test_chunked_admission_interleaves_owners():
+    """A second owner gets the budget between the first owner's chunks instead of after its whole run"""
+    scheduler = StageScheduler(cpu_budget=4, memory_budget_mb=1000)
+    order = []
+    with scheduler.admit('segformer', 'blocker', cpu=4, memory_mb=0):
+        first = threading.Thread(target=run_owner, args=(scheduler, 'a', 3, order))
+        second = threading.Thread(target=run_owner, args=(scheduler, 'b', 3, order))
+        for thread, queued in ((first, 1), (second, 2)):
+            thread.start()
+            while scheduler.status()['queued'] < queued:
+                threading.Event().wait(0.01)
+    first.join()
+    second.join()
+    assert order == ['a', 'b', 'a', 'b', 'a', 'b']
+    assert scheduler.status()['cpu_used'] == 0
+
+def test_lazy_admission_without_hold_admits_nothing():
+    requested = []
+    with ChunkedAdmission(lambda: requested.append(True), lazy=True) as admission:
+        admission.step()
+    assert requested == []
+
+def test_run_memory_is_held_between_chunks_without_blocking_them():
+    """A second run waits for memory while the first, holding it, still gets its CPU chunks"""
+    scheduler = StageScheduler(cpu_budget=4, memory_budget_mb=1500)
+    first = RunAdmission('a', {'num_threads': 4}, scheduler=scheduler)
+    second_admitted = threading.Event()
+
+    def second_run():
+        with RunAdmission('b', scheduler=scheduler).reserve():
+            second_admitted.set()
+
+    with first.reserve():
+        waiter = threading.Thread(target=second_run)
+        waiter.start()
+        while scheduler.status()['queued'] < 1:
+            threading.Event().wait(0.01)
+        with first.chunks(total=3, chunk_size=1) as chunks:
+            for _ in range(3):
+                assert scheduler.status()['memory_used_mb'] == 1500
+                chunks.step()
+        assert not second_admitted.is_set()
+    waiter.join()
+    assert second_admitted.is_set()
+    assert scheduler.status()['memory_used_mb'] == 0
@@ -5,6 +5,7 @@ from PIL import Image
 import io
 from components.thermal import convert_to_thermal_night_vision
 from components.detection import detect_victims_yolo, display_detection_results, get_detection_statistics
+from components.session import session_owner
 
 def annotate_original_image(original_image, detection_results):
     """Annotate the original RGB image with all detection results"""
@@ -181,7 +182,7 @@ def render_victim_page():
             
             if thermal_image is not None:
                 with st.spinner('Detecting objects using AI...'):
-                    _, detection_results = detect_victims_yolo(thermal_image)
+                    _, detection_results = detect_victims_yolo(thermal_image, owner=session_owner())
                     
                     if detection_results is not None:
                         annotated_original = annotate_original_image(original_image, detection_results)